@@ -1,20 +1,110 @@
-from diffusers import DiffusionPipeline
-from utils import get_accel_device
+from model_registry import registry, stable_diffusion_name
+from result_cache import media_cache
+from metrics import metrics
+from scheduler import resource_scheduler
+from init import STABLE_DIFFUSION_MODEL, SD_PROFILES, SD_PROFILE
+from media_formats import IMAGE_FORMAT, IMAGE_QUALITY, image_extension, save_image
+from typing import Dict, List, Optional
 import os
+import threading
 
 
-# Model configuration
-STABLE_DIFFUSION_MODEL = "runwayml/stable-diffusion-v1-5"
+# Seed used for cached generations so identical prompts map to the same artifact
+DEFAULT_SEED = 0
+
+# Overrides of the profile's step count and square output resolution
+SD_STEPS = os.getenv('SD_STEPS')
+SD_RESOLUTION = os.getenv('SD_RESOLUTION')
+
+# One call at a time per pipeline: the scheduler keeps its timesteps and past
+# model outputs on the shared instance, so concurrent calls corrupt each other
+_pipeline_locks = {profile: threading.Lock() for profile in SD_PROFILES}
+
+
+# Define a function to resolve the generation settings of a performance profile
+def profile_settings(profile: str = SD_PROFILE) -> Dict:
+    """
+    Returns the settings of a Stable Diffusion performance profile, with the
+    SD_STEPS and SD_RESOLUTION overrides applied.
+
+    Args:
+        profile (str): Name of a profile in `init.SD_PROFILES`
+
+    Returns:
+        Dict: The profile's options, including "steps" and "resolution"
+
+    Examples:
+        >>> profile_settings("fast")["steps"] -> 20
+    """
+    if profile not in SD_PROFILES:
+        raise ValueError(f"Unknown Stable Diffusion profile '{profile}', expected one of {sorted(SD_PROFILES)}")
+    settings = dict(SD_PROFILES[profile])
+    if SD_STEPS:
+        settings["steps"] = int(SD_STEPS)
+    if SD_RESOLUTION:
+        settings["resolution"] = int(SD_RESOLUTION)
+    return settings
+
+
+# Define a function to generate several images in one pipeline call
+@metrics.timed("image")
+def generate_images(descs: List[str], output_paths: List[str], seed: Optional[int] = None,
+                    profile: str = SD_PROFILE) -> None:
+    """
+    Generates one image per description in a single batched pipeline call.
+
+    Args:
+        descs (List[str]): Descriptions of the images to be generated
+        output_paths (List[str]): Paths where the generated images will be saved
+        seed (Optional[int]): Random seed for reproducible generation
+        profile (str): Performance profile selecting scheduler, steps, precision and resolution
+
+    Returns:
+        None
+
+    Examples:
+        >>> generate_images(["a red fox", "a blue whale"], ["fox.png", "whale.png"], profile="fast")
+    """
+    import torch
+
+    settings = profile_settings(profile)
+
+    # Get the resident Stable Diffusion v1.5 pipeline for the profile (loaded once per worker)
+    pipe = registry.get(stable_diffusion_name(profile))
+
+    # Seed each image's sampler when reproducible images are requested
+    generator = None
+    if seed is not None:
+        generator = [torch.Generator(device="cpu").manual_seed(seed) for _ in descs]
+
+    # Set the prompts and generate the images once the device has room for them
+    with _pipeline_locks[profile], resource_scheduler.reserve("image", pipe.device.type):
+        images = pipe(
+            descs,
+            num_inference_steps=settings["steps"],
+            height=settings["resolution"],
+            width=settings["resolution"],
+            generator=generator,
+        ).images
+
+    for image, output_path in zip(images, output_paths):
+        # Ensure the output directory exists
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+
+        # Save the generated image to the specified file in IMAGE_FORMAT
+        save_image(image, output_path)
 
 
 # Define a function to generate an image from a given description
-def generate_image(desc: str, output_path: str) -> None:
+def generate_image(desc: str, output_path: str, seed: Optional[int] = None, profile: str = SD_PROFILE) -> None:
     """
     Generates an image from a given description.
 
     Args:
         desc (str): Description of the image to be generated
         output_path (str): Path where the generated image will be saved
+        seed (Optional[int]): Random seed for reproducible generation
+        profile (str): Performance profile selecting scheduler, steps, precision and resolution
 
     Returns:
         None
@@ -22,22 +112,27 @@ def generate_image(desc: str, output_path: str) -> None:
     Examples:
         >>> generate_image("a photo of spiderman eating broccoli", "output.png")
     """
-    # Load the Stable Diffusion v1.5 model
-    pipe = DiffusionPipeline.from_pretrained(STABLE_DIFFUSION_MODEL)
+    generate_images([desc], [output_path], seed=seed, profile=profile)
 
-    # Get the acceleration device to use for the pipeline
-    device = get_accel_device()
-    pipe = pipe.to(device)
 
-    # Recommended if your computer has less than 64 GB of RAM
-    pipe.enable_attention_slicing()
+# Define a function to generate an image through the result cache
+def generate_image_cached(desc: str, seed: int = DEFAULT_SEED, profile: str = SD_PROFILE) -> str:
+    """
+    Generates an image from a given description, reusing a previous result
+    for the same description, seed and profile.
 
-    # Set the prompt and generate the image
-    prompt = desc
-    image = pipe(prompt).images[0]
+    Args:
+        desc (str): Description of the image to be generated
+        seed (int): Random seed for reproducible generation
+        profile (str): Performance profile selecting scheduler, steps, precision and resolution
 
-    # Ensure the output directory exists
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    Returns:
+        str: Path of the content-addressed image file
 
-    # Save the generated image to the specified file
-    image.save(output_path)  # Save the generated image to a file
+    Examples:
+        >>> generate_image_cached("a photo of spiderman eating broccoli")
+    """
+    params = dict(profile_settings(profile), format=IMAGE_FORMAT, quality=IMAGE_QUALITY)
+    return media_cache.get_or_create(
+        "image", image_extension(), STABLE_DIFFUSION_MODEL, desc, params, seed,
+        lambda path: generate_image(desc, path, seed=seed, profile=profile))
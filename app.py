@@ -1,29 +1,76 @@
-from flask import Flask, render_template, request, jsonify, url_for, session, send_from_directory
+from flask import Flask, Response, g, redirect, render_template, request, jsonify, url_for, session, send_from_directory
 from flask_bootstrap import Bootstrap
-from music_gen.api import gen_api
-from summariser.llama_api import llama_api
-from tiktok_to_text.api import t4_api
-from tiktok_videos.download import download_videos
-from animate_text.api import generate_image
+from tiktok_videos.download import download_videos, TRENDING_TAGS
+from tiktok_videos.previews import make_previews
+from pipeline import run_idea_pipeline, run_media_pipeline, stream_idea_pipeline, stream_audio_pipeline
+from music_gen.streaming import wav_stream_header
+from media_formats import to_pcm16
+from job_queue import job_queue, QueueFull, DONE, FAILED
+from scheduler import resource_scheduler, set_session, Saturated
+from prefetch import summary_prefetcher
+from trend_index import trend_index_server
+from idea_store import idea_store
+from result_cache import media_cache
+from model_registry import warm_models
+from metrics import metrics, request_profiler, start_trace, server_timing, PROFILE_REQUESTS
 from dotenv import load_dotenv
 import json
 import os
+import uuid
 
 # Load environment variables
 load_dotenv()
 
+# Browser and proxy cache lifetime of generated media in seconds
+MEDIA_MAX_AGE = int(os.getenv('MEDIA_MAX_AGE', str(365 * 24 * 3600)))
+
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'default-dev-key-change-in-production')
 Bootstrap(app)
 
+# Optionally load the ML models before the first request instead of on demand
+if os.getenv('WARM_MODELS_ON_STARTUP', 'false').lower() == 'true':
+    warm_models()
+
+
+@app.before_request
+def before_request():
+    start_trace()
+    # Heavy stages are shared fairly between sessions
+    set_session(session.get('sid') or request.remote_addr)
+    # Profile this request when profiling is enabled and it asks for it with ?profile=1
+    g.profiler = None
+    if PROFILE_REQUESTS and request.args.get('profile') == '1':
+        g.profiler = request_profiler.start()
+
+
+@app.after_request
+def after_request(response):
+    # Report the stages this request ran, e.g. in the browser's network panel
+    timing = server_timing()
+    if timing:
+        response.headers['Server-Timing'] = timing
+    return response
+
+
+@app.errorhandler(Saturated)
+def saturated(e):
+    # No capacity left for another model run; cached results and ideas are still served
+    response = jsonify(error=str(e))
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+
+@app.teardown_request
+def teardown_request(exception):
+    if g.get('profiler') is not None:
+        path = request_profiler.stop(g.profiler, request.endpoint or 'request')
+        print(f"Profile of {request.path} written to {path}")
+
 
 @app.route('/')
 def home():
-    trending_tags = ["MakeupTutorial", "BeautyHacks", "SkincareRoutine",  "TravelVlog", "HiddenGems",
-                     "TravelTips", "Foodie", "RecipeOfTheDay", "CookingHacks", "OOTD", "FashionInspo",
-                     "StyleTips", "AI", "MachineLearning", "TechInnovation"]
-
-    return render_template('index.html', trending_tags=trending_tags)
+    return render_template('index.html', trending_tags=TRENDING_TAGS)
 
 
 def extract_value_from_json(json_string):
@@ -37,6 +84,25 @@ def extract_value_from_json(json_string):
         return None
 
 
+def session_id():
+    # Stable identifier of the browser session, used to track its prefetch
+    if 'sid' not in session:
+        session['sid'] = uuid.uuid4().hex
+    return session['sid']
+
+
+def static_url(path):
+    # Convert a path under the static folder into its URL
+    filename = os.path.relpath(path, 'static').replace(os.sep, '/')
+    return url_for('static', filename=filename)
+
+
+def media_url(path):
+    # Convert a path in the result cache into its URL
+    filename = os.path.relpath(path, media_cache.root).replace(os.sep, '/')
+    return url_for('media', filename=filename)
+
+
 @app.route('/search', methods=['POST'])
 def search():
     search_tags = extract_value_from_json(request.form.get('search_tags'))
@@ -45,8 +111,9 @@ def search():
     # Download videos for the given tags
     video_files = download_videos(search_tags, output_dir)
 
-    video_urls = [url_for('static', filename=os.path.join(
-        'video', search_tags, os.path.basename(video))) for video in video_files]
+    # Make small previews and posters for the page; the originals stay the input for transcription
+    videos = [{kind: static_url(path) if path else None for kind, path in renditions.items()}
+              for renditions in make_previews(video_files, output_dir)]
 
     # Convert video URLs to absolute paths
     base_dir = os.path.abspath(os.path.dirname(__file__))
@@ -54,69 +121,205 @@ def search():
         base_dir, url.lstrip('/')) for url in video_files]
 
     session['video_urls'] = absolute_video_paths
-    return render_template('video.html', video_urls=video_urls)
+    session['tag'] = search_tags
 
+    # Start transcribing and summarising now so /generate_idea can pick up the result,
+    # unless the idea will be served from the trend index (which just releases the previous prefetch)
+    indexed = trend_index_server.is_indexed(search_tags)
+    summary_prefetcher.start(session_id(), [] if indexed else absolute_video_paths)
+    return render_template('video.html', videos=videos)
 
-@ app.route('/generate_idea', methods=['POST'])
-def generate_idea():
-    video_urls = session.get('video_urls', [])
 
-    text_summary = t4_api(video_urls)
+def store_idea(result, sid=None):
+    # Keep the idea server-side for /generate_media, which only generates from stored ideas
+    idea_store.get().put(sid or session_id(), result)
 
-    # Get the idea and song descriptions from the Llama API
-    idea_description, song_description = llama_api(text_summary)
 
-    print("Idea Description:", idea_description)
-    print("Song Description:", song_description)
+def media_urls(result):
+    return {"audio_url": media_url(result["audio_path"]), "img_url": media_url(result["image_path"]),
+            "timings": result["timings"]}
 
-    # Extract the "Trend Name"
-    trend_name_start = idea_description.find(
-        "Trend Idea:") + len("Trend Idea:")
-    trend_name_end = idea_description.find("Trend Concept:")
-    trend_name = idea_description[trend_name_start:trend_name_end].strip().strip(
-        '"')
 
-    print("Trend Name:", trend_name)
+def wants_async():
+    return request.args.get('async', 'false').lower() in ('1', 'true')
 
-    # Extract the "Video Idea"
-    video_idea_start = idea_description.find(
-        "Trend Concept:") + len("Trend Concept:")
-    video_idea = idea_description[video_idea_start:].strip()
-    video_idea_lines = video_idea.split('\n')
-    formatted_video_idea = '\n'.join(line.strip() for line in video_idea_lines)
 
-    print("Trend Idea:", formatted_video_idea)
+def enqueue(kind, func, *args):
+    # Queue a pipeline job and point the client at its status endpoint
+    try:
+        job = job_queue.submit(kind, func, *args)
+    except QueueFull as e:
+        response = jsonify(error=str(e))
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
 
-    # Store song description in session for later use
-    session['idea'] = trend_name
-    session['tags'] = text_summary["tags"]
-    session['song_description'] = song_description
-    session['concept'] = formatted_video_idea
+    response = jsonify(job.to_dict())
+    response.headers['Location'] = url_for('job_status', job_id=job.id)
+    return response, 202
 
-    return jsonify(idea=trend_name, concept=formatted_video_idea)
 
+@ app.route('/generate_idea', methods=['POST'])
+def generate_idea():
+    video_urls = session.get('video_urls', [])
 
-@ app.route('/generate_media', methods=['POST'])
-def generate_media():
-    song_description = session.get('song_description', '')
-    tags = session.get('tags', '')
+    # Serve a precomputed idea when the tag is in the trend index
+    indexed = trend_index_server.lookup(session.get('tag'))
+    if indexed is not None:
+        store_idea(indexed)
+        return jsonify(idea=indexed["idea"], concept=indexed["concept"])
 
-    if not song_description or not tags:
-        return jsonify(error="Missing data for generating media"), 400
+    if wants_async():
+        return enqueue("idea", run_idea_pipeline, video_urls)
+
+    result = run_idea_pipeline(video_urls)
+    store_idea(result)
+
+    return jsonify(idea=result["idea"], concept=result["concept"])
 
-    # Generate the image using the tags
-    output_img_path = os.path.join('static', 'gen_img', f"{tags[0]}.png")
-    generate_image(tags, output_img_path)
-    img_url = url_for('static', filename=f'gen_img/{tags[0]}.png')
 
-    # Generate the audio using the song description
-    output_file_path = gen_api(song_description, 'new_audio', 6)
+def sse(event, data):
+    # Format one server-sent event
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-    audio_url = url_for(
-        'static', filename=f'audio/{os.path.basename(output_file_path)}')
 
-    return jsonify(audio_url=audio_url, img_url=img_url)
+@app.route('/generate_idea/stream')
+def generate_idea_stream():
+    video_urls = session.get('video_urls', [])
+    # The session cookie is sent with the headers, so the session id is fixed before streaming
+    sid = session_id()
+
+    # Indexed ideas are complete already, so they are sent as a single burst
+    indexed = trend_index_server.lookup(session.get('tag'))
+    if indexed is not None:
+        store_idea(indexed, sid)
+
+    def events():
+        if indexed is not None:
+            yield sse("idea", {"idea": indexed["idea"]})
+            yield sse("concept", {"concept": indexed["concept"]})
+            yield sse("done", indexed)
+            return
+        try:
+            for name, data in stream_idea_pipeline(video_urls):
+                # Stored before the client hears it is done, so /generate_media finds it
+                if name == "done":
+                    store_idea(data, sid)
+                yield sse(name, data)
+        except Exception as e:
+            print(f"Exception occurred while streaming the idea: {e}")
+            yield sse("failed", {"error": str(e)})
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
+@ app.route('/generate_media', methods=['POST'])
+def generate_media():
+    # Only the session's own idea is generated, never a prompt sent by the client
+    idea = idea_store.get().get(session_id())
+    if idea is None or not idea["song_description"] or not idea["tags"]:
+        return jsonify(error="Missing data for generating media"), 400
+    tags, song_description = idea["tags"], idea["song_description"]
+
+    if wants_async():
+        return enqueue("media", run_media_pipeline, tags, song_description)
+
+    result = run_media_pipeline(tags, song_description)
+
+    return jsonify(**media_urls(result))
+
+
+@app.route('/generate_media/audio_stream')
+def generate_audio_stream():
+    # Only the session's own idea is generated, like /generate_media
+    idea = idea_store.get().get(session_id())
+    if idea is None or not idea["song_description"]:
+        return jsonify(error="Missing song description"), 400
+    song_description = idea["song_description"]
+
+    stream = stream_audio_pipeline(song_description)
+    segments = stream.listen()
+
+    # Wait for the first segment; a clip that is already cached has none and is served as a file
+    first = next(segments, None)
+    if first is None:
+        return redirect(media_url(stream.path))
+
+    def body():
+        # 16-bit WAV of unknown length, written as MusicGen finishes each chunk
+        yield wav_stream_header(stream.sampling_rate)
+        yield to_pcm16(first).tobytes()
+        try:
+            for segment in segments:
+                yield to_pcm16(segment).tobytes()
+        except Exception as e:
+            print(f"Exception occurred while streaming audio: {e}")
+
+    return Response(body(), mimetype='audio/wav', headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    if job.status == FAILED:
+        if job.retry_after is not None:
+            # Rejected by the resource scheduler, reported like a synchronous request
+            response = jsonify(error=job.error)
+            response.headers['Retry-After'] = str(job.retry_after)
+            return response, 503
+        return jsonify(error=job.error), 500
+    if job.status != DONE:
+        return jsonify(job.to_dict()), 202
+
+    if job.kind == "idea":
+        store_idea(job.result)
+        return jsonify(idea=job.result["idea"], concept=job.result["concept"])
+
+    return jsonify(**media_urls(job.result))
+
+
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify(media_cache.stats())
+
+
+@app.route('/media/<path:filename>')
+def media(filename):
+    # Cached artifacts are content-addressed and never change, so the key in the
+    # file name is a strong ETag and clients may keep them for a year; Range
+    # requests get partial responses so players can seek without a full download
+    key = os.path.splitext(os.path.basename(filename))[0]
+    response = send_from_directory(media_cache.root, filename, etag=key, max_age=MEDIA_MAX_AGE, conditional=True)
+    response.headers['Cache-Control'] = f'public, max-age={MEDIA_MAX_AGE}, immutable'
+    return response
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    cache = media_cache.stats()
+    scheduled = resource_scheduler.stats()
+    body = metrics.render({
+        "trendtok_result_cache_hits_total": ("counter", "Result cache hits", cache["hits"]),
+        "trendtok_result_cache_misses_total": ("counter", "Result cache misses", cache["misses"]),
+        "trendtok_job_queue_depth": ("gauge", "Jobs queued or running", job_queue.depth()),
+        "trendtok_scheduler_waiting": ("gauge", "Model stages waiting for capacity", scheduled["waiting"]),
+        "trendtok_scheduler_running": ("gauge", "Model stages running", scheduled["running"]),
+        "trendtok_scheduler_cpu_threads_used": ("gauge", "CPU threads reserved by running model stages",
+                                                scheduled["devices"]["cpu"]["used_threads"]),
+    })
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+# Development server; run `python serve.py` in production
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=8888)
+    app.run(debug=os.getenv('FLASK_DEBUG', 'false').lower() == 'true', host='0.0.0.0', port=8888)
@@ -0,0 +1,61 @@
+"""
+Compare speech recognition backends by throughput (audio-seconds per wall-second).
+
+Usage:
+    python -m benchmarks.asr_throughput static/video/AI/*.mp4 --backends google whisper
+"""
+import argparse
+import json
+import time
+
+from tiktok_to_text.api import extract_audio_pcm
+from tiktok_to_text.asr import BACKENDS, SAMPLE_RATE, SAMPLE_WIDTH, get_backend
+
+
+def benchmark_backend(name, clips, repeat):
+    backend = get_backend(name)
+    audio_seconds = sum(len(pcm) for pcm in clips) / (SAMPLE_RATE * SAMPLE_WIDTH)
+
+    # Warm-up pass so model loading is not counted as decoding time
+    backend.transcribe(clips[0], SAMPLE_RATE)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for pcm in clips:
+            backend.transcribe(pcm, SAMPLE_RATE)
+    wall_seconds = time.perf_counter() - start
+
+    return {
+        "backend": name,
+        "clips": len(clips),
+        "audio_seconds": audio_seconds * repeat,
+        "wall_seconds": wall_seconds,
+        "throughput": audio_seconds * repeat / wall_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("videos", nargs="+", help="Video files to transcribe")
+    parser.add_argument("--backends", nargs="+", default=sorted(BACKENDS), choices=sorted(BACKENDS))
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # Decode the audio once so only recognition is timed
+    clips = [extract_audio_pcm(video) for video in args.videos]
+
+    results = []
+    for name in args.backends:
+        result = benchmark_backend(name, clips, args.repeat)
+        results.append(result)
+        print(f"{name:>10}: {result['audio_seconds']:.1f} s of audio in {result['wall_seconds']:.2f} s "
+              f"-> {result['throughput']:.2f} audio-s/wall-s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Report seconds per image and peak RSS for each Stable Diffusion performance profile.
+
+Every profile runs in its own interpreter so peak RSS is not inflated by the
+previously loaded pipeline.
+
+Usage:
+    python -m benchmarks.diffusion_profiles --profiles quality fast draft --images 4 --batch 2
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from init import SD_PROFILES
+
+PROMPT = "a neon-lit street food stall at night, cinematic, high detail"
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_profile(profile, images, batch):
+    from animate_text.api import generate_images, profile_settings
+    from model_registry import registry, stable_diffusion_name
+
+    start = time.perf_counter()
+    registry.get(stable_diffusion_name(profile))
+    load_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Warm-up call so one-off allocation and kernel selection are not timed
+        generate_images([PROMPT], [os.path.join(tmp_dir, "warmup.png")], seed=0, profile=profile)
+
+        start = time.perf_counter()
+        done = 0
+        while done < images:
+            count = min(batch, images - done)
+            paths = [os.path.join(tmp_dir, f"{done + i}.png") for i in range(count)]
+            generate_images([PROMPT] * count, paths, seed=done, profile=profile)
+            done += count
+        generate_seconds = time.perf_counter() - start
+
+    settings = profile_settings(profile)
+    return {
+        "profile": profile,
+        "steps": settings["steps"],
+        "resolution": settings["resolution"],
+        "dtype": settings["dtype"],
+        "batch": batch,
+        "images": images,
+        "load_seconds": load_seconds,
+        "seconds_per_image": generate_seconds / images,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=sorted(SD_PROFILES), choices=sorted(SD_PROFILES))
+    parser.add_argument("--images", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=1, help="Images per pipeline call")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_profile(args.worker, args.images, args.batch)))
+        return
+
+    results = []
+    for profile in args.profiles:
+        command = [sys.executable, "-m", "benchmarks.diffusion_profiles", "--worker", profile,
+                   "--images", str(args.images), "--batch", str(args.batch)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{profile:>8}: {result['seconds_per_image']:.2f} s/image "
+              f"({result['steps']} steps, {result['resolution']}px, {result['dtype']}, batch {args.batch}), "
+              f"peak RSS {result['peak_rss_mb']:.0f} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
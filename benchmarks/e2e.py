@@ -0,0 +1,259 @@
+"""
+Offline end-to-end benchmark of /search, /generate_idea and /generate_media.
+
+The Flask routes are driven through the test client with local stand-ins for
+every external dependency: a fake Drive server, a fake speech recognition
+backend, a fake streaming Llama API and tiny randomly initialised MusicGen and
+Stable Diffusion models. Reports per-route latency percentiles, throughput
+with N concurrent sessions and peak RSS, and saves them as JSON.
+
+By default every LLM answer is unique and the LLM cache is off, so each
+session generates its own media; --warm measures the cached path instead.
+
+Time to first audio is how long after the idea the music can start playing:
+the /generate_media latency, or with --stream-audio the time until the first
+samples of /generate_media/audio_stream arrive (before /generate_media runs).
+
+Usage:
+    python -m benchmarks.e2e --sessions 8 --concurrency 2 --output e2e.json
+    python -m benchmarks.e2e --sessions 8 --concurrency 2 --baseline e2e.json
+    MUSICGEN_CHUNK_SECONDS=4 python -m benchmarks.e2e --audio-length 4 --stream-audio
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_drive import make_videos, start_fake_drive
+from benchmarks.fake_llm import start_fake_llm
+
+ROUTES = ["search", "generate_idea", "audio_stream", "generate_media"]
+
+
+def percentile(values, q):
+    # Linear interpolation between the closest ranks
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def latency_summary(values):
+    if not values:
+        return {}
+    return {"p50": percentile(values, 50), "p90": percentile(values, 90), "p95": percentile(values, 95),
+            "p99": percentile(values, 99), "mean": statistics.mean(values), "max": max(values)}
+
+
+def configure(args, work_dir):
+    """Point every external dependency at a local stand-in; must run before the app is imported."""
+    videos = make_videos(os.path.join(work_dir, "drive"), args.videos, args.video_seconds)
+    drive_server, drive_url = start_fake_drive(videos)
+    llm_server, llm_url = start_fake_llm(token_delay=args.token_delay, unique=not args.warm)
+
+    os.environ.update({
+        "DRIVE_API_URL": drive_url,
+        "DRIVE_LISTING_CACHE": os.path.join(work_dir, "drive_listing_cache.json"),
+        "LLAMA_API_URL": llm_url,
+        "LLAMA_API_KEY": "fake",
+        "ASR_BACKEND": "fake",
+        "TRANSCRIPT_DB": os.path.join(work_dir, "transcripts.sqlite3"),
+        "TREND_INDEX_DB": os.path.join(work_dir, "trend_index.sqlite3"),
+        "IDEA_DB": os.path.join(work_dir, "ideas.sqlite3"),
+        "TREND_INDEX_REFRESH": "false",
+        "RESULT_CACHE_DIR": os.path.join(work_dir, "cache"),
+        "AUDIO_LENGTH": str(args.audio_length),
+        "SD_STEPS": str(args.sd_steps),
+        "SD_RESOLUTION": str(args.sd_resolution),
+        "WARM_MODELS_ON_STARTUP": "false",
+    })
+    if not args.warm:
+        os.environ["LLM_CACHE_SIZE"] = "0"
+    return [drive_server, llm_server]
+
+
+def install_stand_ins(args):
+    import requests
+
+    from model_registry import registry
+    from providers import drive_session
+    from tiktok_to_text import asr
+
+    class FakeASRBackend(asr.ASRBackend):
+        """Returns a canned sentence after a delay proportional to the audio length."""
+
+        name = "fake"
+
+        def transcribe(self, pcm, sample_rate=asr.SAMPLE_RATE):
+            seconds = len(pcm) / (asr.SAMPLE_WIDTH * sample_rate)
+            time.sleep(seconds * args.asr_realtime_factor)
+            return f"This clip shows a quick street food recipe in {seconds:.1f} seconds."
+
+    asr.BACKENDS[FakeASRBackend.name] = FakeASRBackend
+    drive_session.override(requests.Session())
+
+    if not args.real_models:
+        from benchmarks.tiny_models import install
+        install(registry)
+
+
+def stream_audio(client, timings):
+    # Read the streamed WAV, noting when the first samples arrive after its header
+    start = time.perf_counter()
+    response = client.get('/generate_media/audio_stream', buffered=False)
+    if response.status_code == 302:
+        # Already cached: the player is sent straight to the file
+        timings["first_audio"] = time.perf_counter() - start
+    elif response.status_code == 200:
+        received = 0
+        for chunk in response.response:
+            received += len(chunk)
+            if received > 44 and "first_audio" not in timings:
+                timings["first_audio"] = time.perf_counter() - start
+        response.close()
+    else:
+        raise RuntimeError(f"/generate_media/audio_stream returned {response.status_code}: "
+                           f"{response.get_data(as_text=True)[:200]}")
+    timings["audio_stream"] = time.perf_counter() - start
+
+
+def run_session(app, tag, stream=False):
+    client = app.test_client()
+    timings = {}
+
+    start = time.perf_counter()
+    response = client.post('/search', data={'search_tags': json.dumps([{"value": tag}])})
+    timings["search"] = time.perf_counter() - start
+    if response.status_code != 200:
+        raise RuntimeError(f"/search returned {response.status_code}")
+
+    for route in ("generate_idea", "generate_media"):
+        # The page starts playing the streamed music while /generate_media renders the image
+        if route == "generate_media" and stream:
+            stream_audio(client, timings)
+
+        start = time.perf_counter()
+        response = client.post(f'/{route}')
+        timings[route] = time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"/{route} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+
+    timings["session"] = sum(value for route, value in timings.items() if route != "first_audio")
+    timings.setdefault("first_audio", timings["generate_media"])
+    return timings
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path}:")
+    for route in ROUTES + ["first_audio", "session"]:
+        for key in ("p50", "p95"):
+            old = baseline["latency"].get(route, {}).get(key)
+            new = results["latency"].get(route, {}).get(key)
+            if old and new:
+                print(f"{route:>15} {key}: {old:.3f} s -> {new:.3f} s ({(new - old) / old:+.0%})")
+    old, new = baseline["throughput_sessions_per_second"], results["throughput_sessions_per_second"]
+    print(f"{'throughput':>15}: {old:.3f} -> {new:.3f} sessions/s ({(new - old) / old:+.0%})")
+    old, new = baseline["peak_rss_mb"], results["peak_rss_mb"]
+    print(f"{'peak RSS':>15}: {old:.0f} MB -> {new:.0f} MB ({(new - old) / old:+.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8, help="Timed sessions (search, idea, media)")
+    parser.add_argument("--concurrency", type=int, default=2, help="Sessions running at once")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed sessions run first, e.g. to load the models")
+    parser.add_argument("--warm", action="store_true", help="Keep the LLM cache on and LLM answers identical")
+    parser.add_argument("--videos", type=int, default=3, help="Clips in every fake Drive folder")
+    parser.add_argument("--video-seconds", type=int, default=4)
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Fake LLM seconds per word")
+    parser.add_argument("--asr-realtime-factor", type=float, default=0.05,
+                        help="Fake ASR seconds per second of audio")
+    parser.add_argument("--audio-length", type=int, default=1, help="Music length in multiples of 5 seconds")
+    parser.add_argument("--sd-steps", type=int, default=2)
+    parser.add_argument("--sd-resolution", type=int, default=64)
+    parser.add_argument("--real-models", action="store_true", help="Use the real MusicGen and Stable Diffusion")
+    parser.add_argument("--stream-audio", action="store_true",
+                        help="Stream the music from /generate_media/audio_stream before /generate_media")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare with the JSON results of an earlier run")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="e2e-")
+    servers = configure(args, work_dir)
+
+    from tiktok_videos.download import TRENDING_TAGS
+    existing_video_dirs = {tag for tag in TRENDING_TAGS if os.path.exists(os.path.join('static', 'video', tag))}
+
+    import app as app_module
+    from metrics import metrics
+    install_stand_ins(args)
+    app = app_module.app
+
+    try:
+        for i in range(args.warmup):
+            run_session(app, TRENDING_TAGS[i % len(TRENDING_TAGS)], args.stream_audio)
+
+        # Different tags per concurrent session, since sessions on one tag share its download directory
+        tags = [TRENDING_TAGS[(args.warmup + i) % len(TRENDING_TAGS)] for i in range(args.sessions)]
+        samples, errors = [], []
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            futures = [executor.submit(run_session, app, tag, args.stream_audio) for tag in tags]
+            for future in futures:
+                try:
+                    samples.append(future.result())
+                except Exception as e:
+                    errors.append(str(e))
+        wall_seconds = time.perf_counter() - start
+    finally:
+        for server in servers:
+            server.shutdown()
+        for tag in set(TRENDING_TAGS) - existing_video_dirs:
+            shutil.rmtree(os.path.join('static', 'video', tag), ignore_errors=True)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        "config": vars(args),
+        "python": sys.version.split()[0],
+        "latency": {route: latency_summary([s[route] for s in samples if route in s])
+                    for route in ROUTES + ["first_audio", "session"]},
+        "sessions": len(samples),
+        "errors": errors,
+        "wall_seconds": wall_seconds,
+        "throughput_sessions_per_second": len(samples) / wall_seconds,
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "stages": metrics.summary(),
+    }
+
+    for route in ROUTES + ["first_audio", "session"]:
+        latency = results["latency"][route]
+        if latency:
+            print(f"{route:>15}: p50 {latency['p50']:.3f} s, p95 {latency['p95']:.3f} s, "
+                  f"p99 {latency['p99']:.3f} s, max {latency['max']:.3f} s")
+    print(f"{len(samples)} sessions ({len(errors)} failed) in {wall_seconds:.1f} s with concurrency "
+          f"{args.concurrency}: {results['throughput_sessions_per_second']:.3f} sessions/s, "
+          f"peak RSS {results['peak_rss_mb']:.0f} MB")
+    for error in errors:
+        print(f"  error: {error}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
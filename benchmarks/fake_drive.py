@@ -0,0 +1,125 @@
+"""
+Local stand-in for the Drive v3 REST endpoints used by `tiktok_videos.download`.
+
+Every folder lists the same directory of .mp4 files; `files/<id>?alt=media`
+serves a file with HTTP range support, so resumed downloads work too.
+
+Usage:
+    python -m benchmarks.fake_drive --port 8898 --videos 3
+    DRIVE_API_URL=http://127.0.0.1:8898 python app.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from imageio_ffmpeg import get_ffmpeg_exe
+
+
+def make_videos(directory, count=3, seconds=4):
+    """Write small .mp4 clips with a tone and a test pattern, each with its own pitch."""
+    os.makedirs(directory, exist_ok=True)
+    for i in range(count):
+        path = os.path.join(directory, f"clip_{i + 1}.mp4")
+        if os.path.exists(path):
+            continue
+        subprocess.run([
+            get_ffmpeg_exe(), "-v", "error", "-y",
+            "-f", "lavfi", "-i", f"testsrc=size=360x640:rate=15:duration={seconds}",
+            "-f", "lavfi", "-i", f"sine=frequency={220 * (i + 1)}:duration={seconds}",
+            "-pix_fmt", "yuv420p", "-shortest", path,
+        ], check=True)
+    return directory
+
+
+class FakeDriveHandler(BaseHTTPRequestHandler):
+    directory = "."
+
+    def files(self):
+        entries = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".mp4"):
+                continue
+            with open(os.path.join(self.directory, name), "rb") as f:
+                data = f.read()
+            entries.append({"id": name, "name": name, "size": str(len(data)),
+                            "md5Checksum": hashlib.md5(data).hexdigest()})
+        return entries
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/").endswith("/files"):
+            self.send_json({"files": self.files()})
+            return
+
+        match = re.search(r"/files/([^/]+)$", url.path)
+        path = os.path.join(self.directory, os.path.basename(match.group(1))) if match else None
+        if path is None or parse_qs(url.query).get("alt") != ["media"] or not os.path.exists(path):
+            self.send_json({"error": "not found"}, status=404)
+            return
+
+        with open(path, "rb") as f:
+            data = f.read()
+        start = 0
+        range_header = re.match(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if range_header:
+            start = int(range_header.group(1))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+        self.wfile.write(data[start:])
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_drive(directory, port=0):
+    """Serve the videos in `directory` from a background thread and return the server and its base URL."""
+    handler = type("Handler", (FakeDriveHandler,), {"directory": directory})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8898)
+    parser.add_argument("--videos", type=int, default=3, help="Number of clips to generate")
+    parser.add_argument("--directory", help="Serve these .mp4 files instead of generated clips")
+    args = parser.parse_args()
+
+    directory = args.directory or make_videos(tempfile.mkdtemp(prefix="fake-drive-"), args.videos)
+    server, url = start_fake_drive(directory, args.port)
+    print(f"Fake Drive API serving {directory} on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
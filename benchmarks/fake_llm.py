@@ -0,0 +1,108 @@
+"""
+Local stand-in for the Llama API chat completions endpoint.
+
+Answers idea, song and summary prompts with canned responses, word by word
+with a configurable delay, either as server-sent events ("stream": true) or
+as one JSON body once the whole response has been "generated".
+
+Usage:
+    python -m benchmarks.fake_llm --port 8899 --token-delay 0.02
+    LLAMA_API_URL=http://127.0.0.1:8899 LLAMA_API_KEY=fake python app.py
+"""
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+IDEA_RESPONSE = (
+    "Trend Idea: \"Midnight Market Makeover\"\n"
+    "Trend Concept: Film a street food stall from closing time to reopening.\n"
+    "Speed up the clean-up, then slow down for the first dish of the night.\n"
+    "Finish with a close-up of the cook's signature move."
+)
+SONG_RESPONSE = "Upbeat lo-fi hip hop with warm keys, soft vinyl crackle and a steady 90 bpm beat."
+SUMMARY_RESPONSE = (
+    "Here is a summary of the text in under 80 words:\n\n"
+    "Creators share quick recipes and street food finds.\n\n"
+    "Top tags/keywords:\n\n* StreetFood\n* Recipes\n* NightMarket"
+)
+
+
+def canned_response(api_request):
+    system = api_request["messages"][0]["content"]
+    if "Trend Idea:" in system and "JSON" not in system:
+        return IDEA_RESPONSE
+    if "audio" in system:
+        return SONG_RESPONSE
+    return SUMMARY_RESPONSE
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    token_delay = 0.02
+    unique = False
+    counter = itertools.count(1)
+
+    def do_POST(self):
+        api_request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        response_text = canned_response(api_request)
+        if self.unique:
+            # Make every answer different so nothing downstream is served from a cache
+            response_text += f" #{next(self.counter)}"
+        tokens = re.findall(r"\S+\s*|\s+", response_text)
+
+        if not api_request.get("stream"):
+            time.sleep(self.token_delay * len(tokens))
+            body = json.dumps({"choices": [{"message": {"role": "assistant", "content": "".join(tokens)}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        # The connection is closed after the stream, so no length or chunked encoding is needed
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for token in tokens:
+            time.sleep(self.token_delay)
+            event = {"choices": [{"delta": {"content": token}}]}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_llm(port=0, token_delay=0.02, unique=False):
+    """Serve the fake endpoint from a background thread and return the server and its base URL."""
+    handler = type("Handler", (FakeLLMHandler,), {"token_delay": token_delay, "unique": unique,
+                                                  "counter": itertools.count(1)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between generated words")
+    args = parser.parse_args()
+
+    server, url = start_fake_llm(args.port, args.token_delay)
+    print(f"Fake Llama API listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
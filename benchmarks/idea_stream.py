@@ -0,0 +1,85 @@
+"""
+Compare time-to-first-content of the streamed idea endpoint with the blocking one.
+
+Both endpoints run against the local fake Llama API, with a fresh LLM client
+per run so no response is served from the cache.
+
+Usage:
+    python -m benchmarks.idea_stream --runs 5 --token-delay 0.02
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from benchmarks.fake_llm import start_fake_llm
+
+
+def time_blocking(client):
+    start = time.perf_counter()
+    response = client.post('/generate_idea')
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, response.data
+    return {"first_content": elapsed, "complete": elapsed}
+
+
+def time_streaming(client):
+    start = time.perf_counter()
+    response = client.get('/generate_idea/stream', buffered=False)
+    first_content = None
+    events = []
+    for chunk in response.response:
+        for block in chunk.decode().split("\n\n"):
+            if not block.startswith("event: "):
+                continue
+            name = block.split("\n", 1)[0][len("event: "):]
+            events.append(name)
+            if first_content is None and name in ("partial", "idea"):
+                first_content = time.perf_counter() - start
+    complete = time.perf_counter() - start
+    assert events and events[-1] == "done", events
+    return {"first_content": first_content, "complete": complete}
+
+
+def summarise(samples):
+    return {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between generated words")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # The LLM client reads its endpoint at import, so point it at the fake server first
+    server, url = start_fake_llm(token_delay=args.token_delay)
+    os.environ["LLAMA_API_URL"] = url
+    os.environ.setdefault("LLAMA_API_KEY", "fake")
+
+    import app
+    from llm_client import llm_client
+
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['video_urls'] = []
+
+    results = {}
+    for name, measure in (("blocking", time_blocking), ("streaming", time_streaming)):
+        samples = []
+        for _ in range(args.runs):
+            llm_client.reset()
+            samples.append(measure(client))
+        results[name] = summarise(samples)
+        print(f"{name:>9}: first content {results[name]['first_content']:.3f} s, "
+              f"complete {results[name]['complete']:.3f} s (median of {args.runs})")
+
+    server.shutdown()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Compare int8 dynamically quantised MusicGen and Stable Diffusion with float32.
+
+For each model, both variants run in their own interpreter (so peak RSS
+is not inflated by the other one) with the same inputs and seeds. It reports
+load time, wall time, MusicGen decoder tokens per second, the model's weight
+size and peak RSS. The outputs are compared for quality:
+- audio by the cosine similarity of the log-magnitude spectrograms;
+- images by PSNR and pixel cosine similarity.
+
+MusicGen decodes greedily here so both variants are deterministic and their
+audio is comparable. Stable Diffusion compares the int8 profile with the same
+settings in float32.
+
+Usage:
+    python -m benchmarks.quantization --models musicgen sd --seconds 10
+    python -m benchmarks.quantization --tiny   # tiny random models, no downloads
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+MUSIC_PROMPT = "upbeat lo-fi hip hop with warm keys and a steady beat"
+IMAGE_PROMPT = "a neon-lit street food stall at night, cinematic, high detail"
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_musicgen_variant(quantize, tiny, cache_dir):
+    from quantization import load_quantized
+
+    if not tiny:
+        from init import load_musicgen
+        return load_musicgen(quantize=quantize)
+
+    from benchmarks.tiny_models import tiny_musicgen
+    processor, model = tiny_musicgen()
+    if quantize:
+        model = load_quantized("tiny/musicgen", lambda: model, cache_dir)
+    return processor, model
+
+
+def load_sd_variant(quantize, tiny, cache_dir):
+    from quantization import load_quantized
+
+    if not tiny:
+        from init import SD_PROFILES, load_stable_diffusion
+        # The float32 baseline is the int8 profile without quantisation (only in this worker process)
+        SD_PROFILES["int8-float32"] = dict(SD_PROFILES["int8"], quantize=False)
+        return load_stable_diffusion("int8" if quantize else "int8-float32")
+
+    from benchmarks.tiny_models import tiny_stable_diffusion
+    pipeline = tiny_stable_diffusion()
+    if quantize:
+        pipeline.text_encoder = load_quantized("tiny/sd-text-encoder", lambda: pipeline.text_encoder, cache_dir)
+        pipeline.unet = load_quantized("tiny/sd-unet", lambda: pipeline.unet, cache_dir)
+    return pipeline
+
+
+def run_musicgen(quantize, args, output_path):
+    import torch
+    from model_registry import estimate_nbytes
+    from music_gen.api import tokens_for_duration
+
+    start = time.perf_counter()
+    processor, model = load_musicgen_variant(quantize, args.tiny, args.cache_dir)
+    load_seconds = time.perf_counter() - start
+
+    inputs = processor(text=[MUSIC_PROMPT], padding=True, return_tensors="pt")
+    max_new_tokens = tokens_for_duration(model, args.seconds)
+    with torch.no_grad():
+        # Warm-up call so one-off allocation and kernel selection are not timed
+        model.generate(**inputs, max_new_tokens=8, do_sample=False)
+        start = time.perf_counter()
+        audio = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False)
+        generate_seconds = time.perf_counter() - start
+
+    np.save(output_path, audio[0, 0].numpy())
+    return {
+        "load_seconds": load_seconds,
+        "generate_seconds": generate_seconds,
+        "tokens_per_second": max_new_tokens / generate_seconds,
+        "sampling_rate": model.config.audio_encoder.sampling_rate,
+        "weights_mb": estimate_nbytes(model) / 1024 ** 2,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_sd(quantize, args, output_path):
+    import torch
+    from model_registry import estimate_nbytes
+
+    start = time.perf_counter()
+    pipeline = load_sd_variant(quantize, args.tiny, args.cache_dir)
+    load_seconds = time.perf_counter() - start
+
+    def generate(steps):
+        generator = torch.Generator(device="cpu").manual_seed(0)
+        return pipeline([IMAGE_PROMPT], num_inference_steps=steps, height=args.resolution, width=args.resolution,
+                        generator=generator).images[0]
+
+    generate(1)
+    start = time.perf_counter()
+    image = generate(args.steps)
+    generate_seconds = time.perf_counter() - start
+
+    np.save(output_path, np.asarray(image))
+    return {
+        "load_seconds": load_seconds,
+        "generate_seconds": generate_seconds,
+        "seconds_per_step": generate_seconds / args.steps,
+        "weights_mb": estimate_nbytes(pipeline) / 1024 ** 2,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def spectrogram(audio, frame=2048, hop=512):
+    # Log-magnitude STFT with a Hann window
+    audio = np.pad(audio.astype(np.float64), (0, max(0, frame - len(audio))))
+    window = np.hanning(frame)
+    frames = np.stack([audio[i:i + frame] * window for i in range(0, len(audio) - frame + 1, hop)])
+    return np.log1p(np.abs(np.fft.rfft(frames, axis=1)))
+
+
+def cosine(a, b):
+    a, b = a.ravel().astype(np.float64), b.ravel().astype(np.float64)
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-12))
+
+
+def audio_similarity(reference, candidate):
+    length = min(len(reference), len(candidate))
+    return {"spectral_cosine": cosine(spectrogram(reference[:length]), spectrogram(candidate[:length]))}
+
+
+def image_similarity(reference, candidate):
+    mse = np.mean((reference.astype(np.float64) - candidate.astype(np.float64)) ** 2)
+    psnr = float("inf") if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+    return {"psnr_db": psnr, "pixel_cosine": cosine(reference, candidate)}
+
+
+RUNNERS = {"musicgen": run_musicgen, "sd": run_sd}
+SIMILARITY = {"musicgen": audio_similarity, "sd": image_similarity}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=["musicgen", "sd"], choices=sorted(RUNNERS))
+    parser.add_argument("--seconds", type=float, default=10, help="Length of the generated music")
+    parser.add_argument("--steps", type=int, default=20, help="Stable Diffusion steps")
+    parser.add_argument("--resolution", type=int, default=512)
+    parser.add_argument("--tiny", action="store_true", help="Use tiny random models instead of the real ones")
+    parser.add_argument("--cache-dir", help="Quantised checkpoint cache (defaults to QUANTIZED_CACHE_DIR, "
+                                            "or a temporary directory with --tiny)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--worker", nargs=3, metavar=("MODEL", "VARIANT", "OUTPUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        model, variant, output_path = args.worker
+        print(json.dumps(RUNNERS[model](variant == "int8", args, output_path)))
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="quantization-")
+    if args.cache_dir is None:
+        from quantization import QUANTIZED_CACHE_DIR
+        args.cache_dir = os.path.join(work_dir, "cache") if args.tiny else QUANTIZED_CACHE_DIR
+
+    results = []
+    for model in args.models:
+        outputs = {}
+        for variant in ("float32", "int8"):
+            output_path = os.path.join(work_dir, f"{model}-{variant}.npy")
+            command = [sys.executable, "-m", "benchmarks.quantization", "--worker", model, variant, output_path,
+                       "--seconds", str(args.seconds), "--steps", str(args.steps),
+                       "--resolution", str(args.resolution), "--cache-dir", args.cache_dir]
+            if args.tiny:
+                command.append("--tiny")
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            result = dict(json.loads(output.strip().splitlines()[-1]), model=model, variant=variant)
+            outputs[variant] = np.load(output_path)
+            results.append(result)
+
+            speed = (f"{result['tokens_per_second']:.1f} tokens/s" if model == "musicgen"
+                     else f"{result['seconds_per_step']:.2f} s/step")
+            print(f"{model:>8} {variant:>7}: load {result['load_seconds']:.1f} s, "
+                  f"generate {result['generate_seconds']:.2f} s ({speed}), "
+                  f"weights {result['weights_mb']:.0f} MB, peak RSS {result['peak_rss_mb']:.0f} MB")
+
+        similarity = SIMILARITY[model](outputs["float32"], outputs["int8"])
+        results[-1]["similarity"] = similarity
+        print(f"{model:>8} int8 vs float32: " + ", ".join(f"{key} {value:.3f}" for key, value in similarity.items()))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Report RSS and PSS per worker of the pre-fork server as the worker count grows.
+
+For each worker count, `serve.py` is started in its own process and
+/proc/<pid>/smaps_rollup is read for the parent and each worker twice:
+- once the workers are up;
+- again after every worker has run media generation.
+
+PSS charges each shared page to its processes in equal parts, so the total
+PSS is the real memory cost of the server. With preloaded models it should
+grow by much less than one model copy per extra worker.
+
+Usage:
+    python -m benchmarks.serve_memory --workers 1 2 4
+    python -m benchmarks.serve_memory --workers 1 2 4 --no-preload   # every worker loads its own copy
+    python -m benchmarks.serve_memory --workers 1 2 --tiny           # tiny random models, no downloads
+"""
+import argparse
+import gc
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def smaps_rollup(pid):
+    # Memory totals of a process in megabytes (Linux only)
+    totals = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                totals[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": totals.get("Rss", 0.0),
+        "pss_mb": totals.get("Pss", 0.0),
+        "shared_mb": totals.get("Shared_Clean", 0.0) + totals.get("Shared_Dirty", 0.0),
+        "private_mb": totals.get("Private_Clean", 0.0) + totals.get("Private_Dirty", 0.0),
+    }
+
+
+def children_of(pid):
+    children = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            children.extend(int(child) for child in f.read().split())
+    return children
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def snapshot(server_pid):
+    parent = smaps_rollup(server_pid)
+    workers = [smaps_rollup(pid) for pid in children_of(server_pid)]
+    return {
+        "parent": parent,
+        "workers": workers,
+        "worker_rss_mb": sum(w["rss_mb"] for w in workers) / len(workers),
+        "worker_pss_mb": sum(w["pss_mb"] for w in workers) / len(workers),
+        "total_rss_mb": parent["rss_mb"] + sum(w["rss_mb"] for w in workers),
+        "total_pss_mb": parent["pss_mb"] + sum(w["pss_mb"] for w in workers),
+    }
+
+
+def generate_media(url, i):
+    # Unique descriptions so every request runs the models instead of hitting the result cache
+    response = requests.post(f"{url}/generate_media", data={"tags": f"street food #{i}",
+                                                            "song_description": f"lo-fi beat #{i}"}, timeout=1800)
+    response.raise_for_status()
+
+
+def measure(workers, args):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    command = [sys.executable, "-m", "benchmarks.serve_memory", "--server", str(workers), "--port", str(port)]
+    if args.tiny:
+        command.append("--tiny")
+    if args.no_preload:
+        command.append("--no-preload")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, RESULT_CACHE_DIR=cache_dir, AUDIO_LENGTH="1", SD_STEPS=str(args.sd_steps),
+                   SD_RESOLUTION=str(args.sd_resolution), WARM_MODELS_ON_STARTUP="false")
+        server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = time.time() + args.startup_timeout
+            while True:
+                try:
+                    if requests.get(url, timeout=5).ok and len(children_of(server.pid)) == workers:
+                        break
+                except requests.RequestException:
+                    pass
+                if server.poll() is not None or time.time() > deadline:
+                    raise RuntimeError(f"Server with {workers} workers did not start")
+                time.sleep(0.5)
+
+            idle = snapshot(server.pid)
+            # Enough concurrent requests that every worker is likely to run the models
+            with ThreadPoolExecutor(max_workers=workers * 2) as executor:
+                list(executor.map(lambda i: generate_media(url, i), range(workers * args.requests_per_worker)))
+            busy = snapshot(server.pid)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+    return {"workers": workers, "preload": not args.no_preload, "idle": idle, "after_requests": busy}
+
+
+def run_server(workers, port, tiny, preload):
+    gc.disable()
+    import serve
+
+    sock = serve.listen("127.0.0.1", port)
+    from app import app
+    if tiny:
+        from benchmarks.tiny_models import install
+        from model_registry import registry
+        install(registry)
+    serve.serve(app, sock, workers, preload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--no-preload", action="store_true", help="Let every worker load its own models")
+    parser.add_argument("--tiny", action="store_true", help="Use tiny random models instead of the real ones")
+    parser.add_argument("--requests-per-worker", type=int, default=2)
+    parser.add_argument("--sd-steps", type=int, default=2)
+    parser.add_argument("--sd-resolution", type=int, default=256)
+    parser.add_argument("--startup-timeout", type=float, default=900)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--server", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.server:
+        run_server(args.server, args.port, args.tiny, not args.no_preload)
+        return
+
+    results = []
+    for workers in args.workers:
+        result = measure(workers, args)
+        results.append(result)
+        for phase in ("idle", "after_requests"):
+            s = result[phase]
+            print(f"{workers} worker(s), {phase:>14}: per worker RSS {s['worker_rss_mb']:.0f} MB, "
+                  f"PSS {s['worker_pss_mb']:.0f} MB; parent PSS {s['parent']['pss_mb']:.0f} MB; "
+                  f"total PSS {s['total_pss_mb']:.0f} MB (sum of RSS {s['total_rss_mb']:.0f} MB)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
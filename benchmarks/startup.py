@@ -0,0 +1,76 @@
+"""
+Measure cold import time of the web app and its first-request latency.
+
+Each run starts a fresh interpreter so nothing is cached in-process. The
+report also lists heavy modules that were imported eagerly, which is the
+usual cause of a startup regression.
+
+Usage:
+    python -m benchmarks.startup --runs 5 --max-import-seconds 2
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Modules that must only be imported on first use
+HEAVY_MODULES = [
+    "torch", "transformers", "diffusers", "moviepy", "scipy", "cv2",
+    "speech_recognition", "llamaapi", "google.oauth2", "googleapiclient",
+]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+response = client.get('/')
+first_request = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - start,
+    "first_request_seconds": first_request - imported,
+    "status": response.status_code,
+    "heavy_modules": [m for m in %r if m in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def run_probe():
+    output = subprocess.run([sys.executable, "-c", PROBE], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-seconds", type=float,
+                        help="Exit with an error if the median import time exceeds this")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    runs = [run_probe() for _ in range(args.runs)]
+    result = {
+        "runs": runs,
+        "import_seconds_median": statistics.median(r["import_seconds"] for r in runs),
+        "first_request_seconds_median": statistics.median(r["first_request_seconds"] for r in runs),
+        "heavy_modules": sorted({m for r in runs for m in r["heavy_modules"]}),
+    }
+
+    print(f"cold import:   {result['import_seconds_median'] * 1000:.0f} ms (median of {args.runs})")
+    print(f"first request: {result['first_request_seconds_median'] * 1000:.0f} ms")
+    if result["heavy_modules"]:
+        print(f"eagerly imported heavy modules: {', '.join(result['heavy_modules'])}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.max_import_seconds is not None and result["import_seconds_median"] > args.max_import_seconds:
+        sys.exit(f"Cold import took {result['import_seconds_median']:.2f} s, "
+                 f"over the {args.max_import_seconds:.2f} s budget")
+
+
+if __name__ == "__main__":
+    main()
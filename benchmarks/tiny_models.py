@@ -0,0 +1,111 @@
+"""
+Tiny randomly initialised MusicGen and Stable Diffusion stand-ins.
+
+They have the same interfaces as the real models but only a few thousand
+parameters, so the media pipeline can run without downloading anything.
+Their output is noise; they exist to exercise and time the code around the
+models.
+"""
+import json
+import os
+import tempfile
+
+import torch
+
+
+class TinyMusicgenProcessor:
+    """Character-level stand-in for the MusicGen processor (the real one needs the T5 tokenizer files)."""
+
+    def __init__(self, sampling_rate=32000):
+        from transformers import EncodecFeatureExtractor
+
+        self.feature_extractor = EncodecFeatureExtractor(feature_size=1, sampling_rate=sampling_rate, padding_value=0.0)
+
+    def __call__(self, text, audio=None, sampling_rate=None, padding=True, return_tensors="pt"):
+        length = max(len(t) for t in text)
+        inputs = {
+            "input_ids": torch.tensor([[ord(c) % 99 + 1 for c in t.ljust(length)] for t in text]),
+            "attention_mask": torch.tensor([[1] * len(t) + [0] * (length - len(t)) for t in text]),
+        }
+        if audio is not None:
+            inputs.update(self.feature_extractor(audio, sampling_rate=sampling_rate, return_tensors="pt", padding=True))
+        return inputs
+
+
+def tiny_musicgen():
+    """Return a (processor, model) pair shaped like `init.load_musicgen`'s."""
+    from transformers import (EncodecConfig, MusicgenConfig, MusicgenDecoderConfig,
+                              MusicgenForConditionalGeneration, T5Config)
+
+    torch.manual_seed(0)
+    text_encoder = T5Config(vocab_size=100, d_model=16, d_kv=8, d_ff=32, num_layers=1, num_heads=2)
+    audio_encoder = EncodecConfig(sampling_rate=32000, audio_channels=1, num_filters=4, codebook_size=64,
+                                  codebook_dim=16, hidden_size=16, upsampling_ratios=[8, 5, 4, 4],
+                                  num_lstm_layers=1, target_bandwidths=[2.2], num_residual_layers=1)
+    decoder = MusicgenDecoderConfig(vocab_size=64, hidden_size=16, num_hidden_layers=1, num_attention_heads=2,
+                                    ffn_dim=32, num_codebooks=4, max_position_embeddings=4096)
+    config = MusicgenConfig.from_sub_models_config(text_encoder, audio_encoder, decoder)
+    model = MusicgenForConditionalGeneration(config).eval()
+    model.generation_config.decoder_start_token_id = 64
+    model.generation_config.pad_token_id = 64
+    model.generation_config.do_sample = True
+    model.generation_config.guidance_scale = 3.0
+    return TinyMusicgenProcessor(), model
+
+
+def _tiny_clip_tokenizer():
+    from transformers import CLIPTokenizer
+    from transformers.models.clip.tokenization_clip import bytes_to_unicode
+
+    # Byte-level vocabulary without merges: every character is its own token
+    symbols = list(bytes_to_unicode().values())
+    vocab = {token: i for i, token in enumerate(symbols + [s + "</w>" for s in symbols])}
+    vocab["<|startoftext|>"] = len(vocab)
+    vocab["<|endoftext|>"] = len(vocab)
+
+    directory = tempfile.mkdtemp(prefix="tiny-clip-")
+    with open(os.path.join(directory, "vocab.json"), "w") as f:
+        json.dump(vocab, f)
+    with open(os.path.join(directory, "merges.txt"), "w") as f:
+        f.write("#version: 0.2\n")
+    return CLIPTokenizer(os.path.join(directory, "vocab.json"), os.path.join(directory, "merges.txt"),
+                         model_max_length=77, pad_token="<|endoftext|>")
+
+
+def tiny_stable_diffusion(profile=None):
+    """Return a Stable Diffusion pipeline with tiny random weights; `profile` is accepted for the registry."""
+    from diffusers import AutoencoderKL, PNDMScheduler, StableDiffusionPipeline, UNet2DConditionModel
+    from transformers import CLIPTextConfig, CLIPTextModel
+
+    torch.manual_seed(0)
+    tokenizer = _tiny_clip_tokenizer()
+    text_encoder = CLIPTextModel(CLIPTextConfig(vocab_size=len(tokenizer), hidden_size=16, intermediate_size=32,
+                                                num_hidden_layers=1, num_attention_heads=2,
+                                                max_position_embeddings=77, bos_token_id=tokenizer.bos_token_id,
+                                                eos_token_id=tokenizer.eos_token_id))
+    unet = UNet2DConditionModel(sample_size=16, in_channels=4, out_channels=4, layers_per_block=1,
+                                block_out_channels=(16, 32), norm_num_groups=8, cross_attention_dim=16,
+                                attention_head_dim=2,
+                                down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+                                up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"))
+    vae = AutoencoderKL(in_channels=3, out_channels=3, latent_channels=4, block_out_channels=(8, 16),
+                        norm_num_groups=8, layers_per_block=1,
+                        down_block_types=("DownEncoderBlock2D", "DownEncoderBlock2D"),
+                        up_block_types=("UpDecoderBlock2D", "UpDecoderBlock2D"))
+    pipeline = StableDiffusionPipeline(vae=vae, text_encoder=text_encoder, tokenizer=tokenizer, unet=unet,
+                                       scheduler=PNDMScheduler(skip_prk_steps=True), safety_checker=None,
+                                       feature_extractor=None, requires_safety_checker=False)
+    pipeline.set_progress_bar_config(disable=True)
+    return pipeline
+
+
+def install(registry):
+    """Register the tiny models in place of the real ones."""
+    from functools import partial
+
+    from init import SD_PROFILES
+    from model_registry import MUSICGEN, stable_diffusion_name
+
+    registry.register(MUSICGEN, tiny_musicgen)
+    for profile in SD_PROFILES:
+        registry.register(stable_diffusion_name(profile), partial(tiny_stable_diffusion, profile))
@@ -0,0 +1,83 @@
+"""
+Report on-screen text extraction throughput and how many frames sampling and deduplication skip.
+
+For every video the report lists its total frame count, the frames passed on
+by scene-change sampling, the frames the perceptual hash skipped as
+duplicates, and frames per second for sampling alone and for the full OCR
+stage. Needs the tesseract binary for the OCR columns.
+
+Usage:
+    python -m benchmarks.video_ocr static/video --output ocr.json
+"""
+import argparse
+import json
+import os
+import time
+
+from imageio_ffmpeg import count_frames_and_secs
+
+from py_ocr.video import distinct_frames, ocr_video, sample_frames
+from tiktok_videos.previews import PREVIEW_DIR
+
+
+def video_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                # Preview renditions are downscaled copies of the originals
+                dirnames[:] = [d for d in dirnames if d != PREVIEW_DIR]
+                yield from (os.path.join(dirpath, f) for f in sorted(filenames) if f.endswith('.mp4'))
+        else:
+            yield path
+
+
+def measure(video_file):
+    total_frames, duration = count_frames_and_secs(video_file)
+
+    start = time.perf_counter()
+    sampled = list(sample_frames(video_file))
+    distinct = list(distinct_frames(iter(sampled)))
+    sample_seconds = time.perf_counter() - start
+
+    result = ocr_video(video_file)
+    return {
+        "video": video_file,
+        "duration": duration,
+        "frames": total_frames,
+        "sampled": len(sampled),
+        "skipped_duplicates": len(sampled) - len(distinct),
+        "read": result["read"],
+        "sample_fps": total_frames / sample_seconds,
+        "ocr_fps": total_frames / result["seconds"],
+        "ocr_seconds": result["seconds"],
+        "text_lines": len(result["text"].splitlines()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="Videos or directories of videos")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for video_file in video_files(args.paths):
+        result = measure(video_file)
+        results.append(result)
+        print(f"{video_file}: {result['frames']} frames, {result['sampled']} sampled, "
+              f"{result['skipped_duplicates']} duplicates skipped, {result['read']} read; "
+              f"sampling {result['sample_fps']:.0f} frames/s, OCR {result['ocr_fps']:.0f} frames/s")
+
+    if results:
+        frames = sum(r["frames"] for r in results)
+        seconds = sum(r["ocr_seconds"] for r in results)
+        print(f"Total: {frames} frames, {sum(r['read'] for r in results)} read, "
+              f"{sum(r['skipped_duplicates'] for r in results)} duplicates skipped, {frames / seconds:.0f} frames/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import json
+import os
+import time
+from typing import Dict, Optional
+
+from providers import LazyProvider
+from utils import sqlite_connection
+
+
+# SQLite file holding the latest idea of every session, shared by all worker processes
+IDEA_DB = os.getenv('IDEA_DB', 'ideas.sqlite3')
+
+# Seconds an idea stays usable for media generation
+IDEA_TTL = int(os.getenv('IDEA_TTL', '86400'))
+
+
+class IdeaStore:
+    """
+    Latest generated idea per browser session.
+
+    The media endpoints only generate from ideas stored here, so they never
+    run the models on prompts sent by the client. Ideas are kept server-side
+    rather than in the session cookie because a streamed idea is only complete
+    after the response headers (and the cookie) have been sent.
+    """
+
+    def __init__(self, db_path: str = IDEA_DB, ttl: int = IDEA_TTL):
+        self.db_path = db_path
+        self.ttl = ttl
+        with sqlite_connection(self.db_path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ideas ("
+                " session_id TEXT PRIMARY KEY,"
+                " data TEXT NOT NULL,"
+                " created_at REAL NOT NULL)")
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """
+        Look up the idea of a session.
+
+        Args:
+            session_id (str): Session identifier
+
+        Returns:
+            Optional[Dict]: The idea, concept, tags and song description, or None if the session has no current idea
+        """
+        with sqlite_connection(self.db_path) as conn:
+            row = conn.execute("SELECT data FROM ideas WHERE session_id = ? AND created_at > ?",
+                               (session_id, time.time() - self.ttl)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, session_id: str, idea: Dict) -> None:
+        """
+        Store the idea of a session, replacing its previous one and dropping expired ones.
+
+        Args:
+            session_id (str): Session identifier
+            idea (Dict): The idea, concept, tags and song description
+        """
+        data = {key: idea[key] for key in ("idea", "concept", "tags", "song_description")}
+        now = time.time()
+        with sqlite_connection(self.db_path) as conn:
+            conn.execute("DELETE FROM ideas WHERE created_at <= ?", (now - self.ttl,))
+            conn.execute("INSERT OR REPLACE INTO ideas (session_id, data, created_at) VALUES (?, ?, ?)",
+                         (session_id, json.dumps(data), now))
+
+
+# Shared store, opened on first use so importing the app creates no database file
+idea_store = LazyProvider(IdeaStore)
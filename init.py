@@ -1,14 +1,107 @@
-from transformers import AutoProcessor, MusicgenForConditionalGeneration
-from diffusers import DiffusionPipeline
+import os
+from utils import get_accel_device
+from quantization import load_quantized
+
+
+# Model configuration
+MUSICGEN_MODEL = "facebook/musicgen-small"
+STABLE_DIFFUSION_MODEL = "runwayml/stable-diffusion-v1-5"
+WHISPER_MODEL = "openai/whisper-tiny.en"
+
+# Stable Diffusion performance profiles: precision, scheduler and memory layout used when
+# loading the pipeline, plus the default step count and resolution used when calling it
+SD_PROFILES = {
+    # Stock pipeline: default scheduler at 50 steps in float32
+    "quality": {"dtype": "float32", "scheduler": None, "channels_last": False,
+                "attention_slicing": True, "steps": 50, "resolution": 512},
+    # DPM-Solver++ at 20 steps in bfloat16 with a channels-last UNet and VAE
+    "fast": {"dtype": "bfloat16", "scheduler": "dpm", "channels_last": True,
+             "attention_slicing": False, "steps": 20, "resolution": 512},
+    # Quick drafts: fewer steps at a lower resolution
+    "draft": {"dtype": "bfloat16", "scheduler": "dpm", "channels_last": True,
+              "attention_slicing": False, "steps": 12, "resolution": 384},
+    # CPU nodes: int8 dynamically quantised text encoder and UNet linear layers, DPM-Solver++ at 20 steps
+    "int8": {"dtype": "float32", "scheduler": "dpm", "channels_last": False, "quantize": True,
+             "attention_slicing": False, "steps": 20, "resolution": 512},
+}
+SD_PROFILE = os.getenv('SD_PROFILE', 'quality')
+
+# Run MusicGen with int8 dynamically quantised linear layers (CPU only)
+MUSICGEN_QUANTIZE = os.getenv('MUSICGEN_QUANTIZE', 'false').lower() == 'true'
+
+
+# Define a function to load the MusicGen processor and model, optionally quantised to int8
+def load_musicgen(quantize: bool = MUSICGEN_QUANTIZE):
+    from transformers import AutoProcessor, MusicgenForConditionalGeneration
+
+    def load_float():
+        return MusicgenForConditionalGeneration.from_pretrained(MUSICGEN_MODEL, attn_implementation="eager")
+
+    processor = AutoProcessor.from_pretrained(MUSICGEN_MODEL)
+    # The quantised model is cached on disk, so the float32 weights are only loaded for the first conversion
+    model = load_quantized(MUSICGEN_MODEL, load_float) if quantize else load_float()
+    model.eval()
+    return processor, model
+
+
+# Define a function to load the Stable Diffusion pipeline for a performance profile on the acceleration device
+def load_stable_diffusion(profile: str = SD_PROFILE):
+    import torch
+    from diffusers import DiffusionPipeline, DPMSolverMultistepScheduler
+
+    options = SD_PROFILES[profile]
+
+    # Quantised components replace the ones from_pretrained would load; int8 kernels only run on the CPU
+    components = {}
+    device = get_accel_device()
+    if options.get("quantize"):
+        from diffusers import UNet2DConditionModel
+        from transformers import CLIPTextModel
+
+        components["text_encoder"] = load_quantized(
+            f"{STABLE_DIFFUSION_MODEL}/text_encoder",
+            lambda: CLIPTextModel.from_pretrained(STABLE_DIFFUSION_MODEL, subfolder="text_encoder"))
+        components["unet"] = load_quantized(
+            f"{STABLE_DIFFUSION_MODEL}/unet",
+            lambda: UNet2DConditionModel.from_pretrained(STABLE_DIFFUSION_MODEL, subfolder="unet"))
+        device = "cpu"
+
+    pipeline = DiffusionPipeline.from_pretrained(STABLE_DIFFUSION_MODEL, torch_dtype=getattr(torch, options["dtype"]),
+                                                 **components)
+    pipeline = pipeline.to(device)
+
+    # Swap in a scheduler that converges in fewer steps
+    schedulers = {"dpm": DPMSolverMultistepScheduler}
+    if options["scheduler"] is not None:
+        pipeline.scheduler = schedulers[options["scheduler"]].from_config(pipeline.scheduler.config)
+
+    # Channels-last convolutions are faster on CPUs with oneDNN
+    if options["channels_last"]:
+        pipeline.unet.to(memory_format=torch.channels_last)
+        pipeline.vae.to(memory_format=torch.channels_last)
+
+    # Recommended if your computer has less than 64 GB of RAM
+    if options["attention_slicing"]:
+        pipeline.enable_attention_slicing()
+    return pipeline
+
+
+# Define a function to load the offline speech recognition pipeline on the CPU
+def load_whisper():
+    from transformers import pipeline as hf_pipeline
+
+    return hf_pipeline("automatic-speech-recognition", model=WHISPER_MODEL, device="cpu")
+
 
 # Define a function to load and cache models
 def load_models():
-    processor = AutoProcessor.from_pretrained("facebook/musicgen-small")
-    model = MusicgenForConditionalGeneration.from_pretrained("facebook/musicgen-small", attn_implementation="eager")
-    pipeline = DiffusionPipeline.from_pretrained("runwayml/stable-diffusion-v1-5")
+    processor, model = load_musicgen()
+    pipeline = load_stable_diffusion()
     return processor, model, pipeline
 
 # Script to load and cache the models
 if __name__ == "__main__":
     # Load models when the package is imported
-    processor, model, pipeline = load_models()
\ No newline at end of file
+    processor, model, pipeline = load_models()
+    # Cache the offline speech recognition model too, for air-gapped deployments
+    load_whisper()
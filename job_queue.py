@@ -0,0 +1,261 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from metrics import carry_context
+from scheduler import Saturated
+
+
+# Worker pool size, maximum number of queued or running jobs and how long finished jobs are kept
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_QUEUE_MAX_DEPTH = int(os.getenv('JOB_QUEUE_MAX_DEPTH', '16'))
+JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', '3600'))
+
+# Directory where job states are shared between server processes, so a job can be
+# polled from any worker (unset: jobs are only known to the process that runs them)
+JOB_STATE_DIR = os.getenv('JOB_STATE_DIR', '')
+
+# Seconds between sweeps of the shared state directory for expired jobs
+JOB_STATE_SWEEP_INTERVAL = 60
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFull(Exception):
+    """Raised when the job queue is at its depth limit."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Job queue is full, retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class Job:
+    """A unit of pipeline work and its outcome."""
+
+    def __init__(self, kind: str, key: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.status = QUEUED
+        self.result: Any = None
+        self.error: Optional[str] = None
+        # Seconds to wait before retrying, when the job failed because the server was at capacity
+        self.retry_after: Optional[int] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        """Return the job status as a JSON-serialisable dictionary."""
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "error": self.error,
+            "retry_after": self.retry_after,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "Job":
+        """Rebuild a job saved by another process from its status and result."""
+        job = cls(state["kind"], state["key"])
+        job.id = state["job_id"]
+        for name in ("status", "result", "error", "created_at", "started_at", "finished_at"):
+            setattr(job, name, state[name])
+        job.retry_after = state.get("retry_after")
+        return job
+
+
+def process_alive(pid: Optional[int]) -> bool:
+    """Whether a process with the given id is running (state files without a pid count as dead)."""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def job_key(kind: str, args: tuple) -> str:
+    """Hash the job kind and inputs so identical submissions share one job."""
+    payload = json.dumps({"kind": kind, "args": args}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class JobQueue:
+    """
+    In-process job queue backed by a bounded thread pool.
+
+    With a `state_dir`, every status change is also written there as JSON so
+    other server processes can answer status and result requests for the job.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_depth: int = JOB_QUEUE_MAX_DEPTH,
+                 result_ttl: int = JOB_RESULT_TTL, state_dir: str = JOB_STATE_DIR):
+        self.max_depth = max_depth
+        self.result_ttl = result_ttl
+        self.state_dir = state_dir
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._by_key: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._durations = []
+        self._swept_at = 0.0
+
+    def submit(self, kind: str, func: Callable, *args) -> Job:
+        """
+        Queue `func(*args)`, or return the existing job for the same inputs.
+
+        Args:
+            kind (str): Job type, e.g. "idea" or "media"
+            func (Callable): Pipeline function to run
+            *args: JSON-serialisable inputs of the pipeline function
+
+        Returns:
+            Job: The new or de-duplicated job
+
+        Raises:
+            QueueFull: If `max_depth` jobs are already queued or running
+        """
+        key = job_key(kind, args)
+        with self._lock:
+            self._expire()
+
+            # Reuse a pending or finished job with the same inputs
+            existing = self._jobs.get(self._by_key.get(key, ""))
+            if existing is not None and existing.status != FAILED:
+                return existing
+
+            if self.depth() >= self.max_depth:
+                raise QueueFull(self._retry_after())
+
+            job = Job(kind, key)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+
+        self._save(job)
+        # The job's stages are scheduled as the submitting session's
+        self._executor.submit(carry_context(self._run), job, func, args)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return the job with the given id, if it is still known to this or another process."""
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+        if job is None and self.state_dir and re.fullmatch(r"[0-9a-f]{32}", job_id):
+            try:
+                with open(os.path.join(self.state_dir, f"{job_id}.json")) as f:
+                    state = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                return None
+            job = Job.from_state(state)
+            # A worker that exited mid-job will never finish it
+            if job.status in (QUEUED, RUNNING) and not process_alive(state.get("pid")):
+                job.status = FAILED
+                job.error = "Worker process exited before the job finished"
+                job.finished_at = time.time()
+                self._save(job, pid=state.get("pid"))
+        return job
+
+    def depth(self) -> int:
+        """Return the number of queued or running jobs."""
+        return sum(1 for job in self._jobs.values() if job.status in (QUEUED, RUNNING))
+
+    def _run(self, job: Job, func: Callable, args: tuple) -> None:
+        job.status = RUNNING
+        job.started_at = time.time()
+        self._save(job)
+        try:
+            job.result = func(*args)
+            job.status = DONE
+        except Exception as e:
+            print(f"Exception occurred while running {job.kind} job {job.id}: {e}")
+            job.error = str(e)
+            if isinstance(e, Saturated):
+                job.retry_after = e.retry_after
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._durations = (self._durations + [job.finished_at - job.started_at])[-20:]
+            self._save(job)
+
+    def _save(self, job: Job, pid: Optional[int] = None) -> None:
+        if not self.state_dir:
+            return
+        os.makedirs(self.state_dir, exist_ok=True)
+        path = os.path.join(self.state_dir, f"{job.id}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                # The owning process is recorded so other workers can tell when it died
+                json.dump(dict(job.to_dict(), key=job.key, result=job.result, pid=pid or os.getpid()), f, default=str)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Exception occurred while saving job {job.id}: {e}")
+
+    def _retry_after(self) -> int:
+        # Suggest waiting roughly as long as a recent job took to run
+        if not self._durations:
+            return 5
+        return max(1, int(sum(self._durations) / len(self._durations)))
+
+    def _expire(self) -> None:
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and now - job.finished_at > self.result_ttl:
+                del self._jobs[job_id]
+                if self._by_key.get(job.key) == job_id:
+                    del self._by_key[job.key]
+                if self.state_dir:
+                    try:
+                        os.remove(os.path.join(self.state_dir, f"{job_id}.json"))
+                    except FileNotFoundError:
+                        pass
+
+        # Jobs of other workers, including ones that exited, are expired from the shared directory
+        if self.state_dir and now - self._swept_at > JOB_STATE_SWEEP_INTERVAL:
+            self._swept_at = now
+            self._sweep_state_dir(now)
+
+    def _sweep_state_dir(self, now: float) -> None:
+        try:
+            filenames = os.listdir(self.state_dir)
+        except FileNotFoundError:
+            return
+        for filename in filenames:
+            path = os.path.join(self.state_dir, filename)
+            try:
+                # Every status change rewrites the file, so an old file belongs to a finished or abandoned job
+                if now - os.path.getmtime(path) <= self.result_ttl:
+                    continue
+                # Left behind by a worker that died while saving
+                if filename.endswith(".tmp"):
+                    os.remove(path)
+                    continue
+                with open(path) as f:
+                    state = json.load(f)
+                if state.get("finished_at") is not None or not process_alive(state.get("pid")):
+                    os.remove(path)
+            except (OSError, json.JSONDecodeError):
+                continue
+
+
+# Shared job queue for the web process
+job_queue = JobQueue()
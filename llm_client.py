@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import metrics, carry_context
+from providers import LazyProvider
+
+
+# Llama API endpoint (point it at a local mock server for testing)
+LLAMA_API_URL = os.getenv('LLAMA_API_URL', 'https://api.llama-api.com')
+
+# Connection pool size, request timeout, retry policy and number of cached responses
+LLM_POOL_SIZE = int(os.getenv('LLM_POOL_SIZE', '8'))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+LLM_BACKOFF_SECONDS = float(os.getenv('LLM_BACKOFF_SECONDS', '0.5'))
+LLM_CACHE_SIZE = int(os.getenv('LLM_CACHE_SIZE', '256'))
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def request_key(api_request: Dict) -> str:
+    """Hash a chat request so identical prompts share a cached response."""
+    payload = json.dumps(api_request, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMClient:
+    """
+    Chat completion client for the Llama API.
+
+    A single pooled HTTP session is reused across calls, transient failures
+    are retried with exponential backoff, and responses are cached in memory
+    by request.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: str = LLAMA_API_URL,
+                 session: Optional[requests.Session] = None, cache_size: int = LLM_CACHE_SIZE):
+        self.api_key = api_key or os.getenv('LLAMA_API_KEY')
+        if not self.api_key:
+            raise ValueError("LLAMA_API_KEY environment variable is required")
+        self.base_url = base_url.rstrip('/')
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=LLM_POOL_SIZE, thread_name_prefix="llm")
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=LLM_POOL_SIZE, pool_maxsize=LLM_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+
+    def post(self, api_request: Dict, stream: bool = False) -> requests.Response:
+        """
+        Send a chat completion request, retrying transient failures.
+
+        Args:
+            api_request (Dict): Request body in the Llama API chat format
+            stream (bool): Return the response without reading its body
+
+        Returns:
+            requests.Response: The successful response
+        """
+        url = f"{self.base_url}/chat/completions"
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            delay = LLM_BACKOFF_SECONDS * (2 ** attempt) * (1 + random.random())
+            try:
+                response = self.session.post(url, json=api_request, headers=headers,
+                                             timeout=LLM_TIMEOUT, stream=stream)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                time.sleep(delay)
+                continue
+
+            if response.status_code in RETRY_STATUS and attempt < LLM_MAX_RETRIES:
+                retry_after = response.headers.get('Retry-After', '')
+                response.close()
+                time.sleep(float(retry_after) if retry_after.isdigit() else delay)
+                continue
+
+            response.raise_for_status()
+            return response
+
+    def run(self, api_request: Dict) -> Dict:
+        """
+        Return the JSON response for a chat request, from the cache when possible.
+
+        Args:
+            api_request (Dict): Request body in the Llama API chat format
+
+        Returns:
+            Dict: The decoded JSON response
+        """
+        key = request_key(api_request)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        result = self.post(api_request).json()
+        self._remember(key, result)
+        return result
+
+    def _remember(self, key: str, result: Dict) -> None:
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def stream(self, api_request: Dict) -> Iterator[str]:
+        """
+        Yield the message content of a chat request piece by piece as the server sends it.
+
+        The request is sent with "stream": true and the server-sent events are
+        decoded as they arrive. A cached response is replayed as a single piece,
+        and the assembled response is cached once the stream has finished.
+
+        Args:
+            api_request (Dict): Request body in the Llama API chat format
+
+        Returns:
+            Iterator[str]: Content deltas in order
+        """
+        key = request_key(api_request)
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None:
+            yield content(cached)
+            return
+
+        pieces = []
+        with self.post(dict(api_request, stream=True), stream=True) as response:
+            for line in response.iter_lines(decode_unicode=True):
+                # Events are "data: <json>" lines, terminated by "data: [DONE]"
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)['choices'][0].get('delta', {}).get('content')
+                if delta:
+                    pieces.append(delta)
+                    yield delta
+
+        self._remember(key, {"choices": [{"message": {"role": "assistant", "content": "".join(pieces)}}]})
+
+    def chat(self, api_request: Dict) -> str:
+        """Return the message content of a chat response."""
+        return content(self.run(api_request))
+
+    def submit(self, api_request: Dict, stage: Optional[str] = None) -> Future:
+        """Send a chat request in the background and return a future of its message content, timed as `stage`."""
+        def chat():
+            if stage is None:
+                return self.chat(api_request)
+            with metrics.span(stage):
+                return self.chat(api_request)
+        return self._executor.submit(carry_context(chat))
+
+
+def content(response: Dict) -> str:
+    """Extract the message content from a chat completion response."""
+    return response['choices'][0]['message']['content']
+
+
+# Shared client, created on first use so the app starts without an API key
+llm_client = LazyProvider(LLMClient)
@@ -0,0 +1,125 @@
+import os
+import subprocess
+from typing import Optional
+
+import numpy as np
+
+
+# Encoding of generated audio: "wav" (16-bit PCM), or "opus" / "mp3" compressed with ffmpeg
+AUDIO_FORMAT = os.getenv('AUDIO_FORMAT', 'wav')
+AUDIO_BITRATE = os.getenv('AUDIO_BITRATE', '96k')
+
+# Encoding of generated images: "png", "webp" or "jpeg", and the quality of the lossy ones
+IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', 'png')
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', '85'))
+
+# File extension and ffmpeg encoder arguments of each audio format
+# (Opus only supports a few sample rates, so MusicGen's 32 kHz is resampled to 48 kHz)
+AUDIO_FORMATS = {
+    "wav": {"ext": "wav", "args": None},
+    "opus": {"ext": "ogg", "args": ["-c:a", "libopus", "-ar", "48000"]},
+    "mp3": {"ext": "mp3", "args": ["-c:a", "libmp3lame"]},
+}
+
+# File extension and Pillow format of each image format
+IMAGE_FORMATS = {
+    "png": {"ext": "png", "pil": "PNG"},
+    "webp": {"ext": "webp", "pil": "WEBP"},
+    "jpeg": {"ext": "jpg", "pil": "JPEG"},
+}
+
+
+def _check(fmt: str, formats: dict, variable: str) -> dict:
+    if fmt not in formats:
+        raise ValueError(f"Unknown {variable} '{fmt}', expected one of {sorted(formats)}")
+    return formats[fmt]
+
+
+def audio_extension(fmt: str = AUDIO_FORMAT) -> str:
+    """File extension of an audio format, e.g. "ogg" for "opus"."""
+    return _check(fmt, AUDIO_FORMATS, "AUDIO_FORMAT")["ext"]
+
+
+def image_extension(fmt: str = IMAGE_FORMAT) -> str:
+    """File extension of an image format, e.g. "jpg" for "jpeg"."""
+    return _check(fmt, IMAGE_FORMATS, "IMAGE_FORMAT")["ext"]
+
+
+def to_pcm16(audio: np.ndarray) -> np.ndarray:
+    """
+    Convert float samples in [-1, 1] to 16-bit PCM, clipping anything outside the range.
+
+    Args:
+        audio (np.ndarray): Float samples
+
+    Returns:
+        np.ndarray: int16 samples
+    """
+    if audio.dtype == np.int16:
+        return audio
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def encode_audio(output_path: str, sampling_rate: int, audio: np.ndarray, fmt: str = AUDIO_FORMAT,
+                 bitrate: str = AUDIO_BITRATE) -> None:
+    """
+    Write mono audio samples in the given format.
+
+    WAV is written directly as 16-bit PCM, half the size of float32 samples;
+    Opus and MP3 are encoded by piping the PCM through ffmpeg.
+
+    Args:
+        output_path (str): Path of the output file, ending in the format's extension
+        sampling_rate (int): Sampling rate of the samples
+        audio (np.ndarray): Samples to write
+        fmt (str): Name of a format in AUDIO_FORMATS
+        bitrate (str): Target bitrate of the compressed formats, e.g. "96k"
+
+    Returns:
+        None
+
+    Examples:
+        >>> encode_audio("music.ogg", 32000, samples, fmt="opus")
+    """
+    options = _check(fmt, AUDIO_FORMATS, "AUDIO_FORMAT")
+    pcm = to_pcm16(audio)
+
+    if options["args"] is None:
+        import scipy.io.wavfile
+
+        scipy.io.wavfile.write(output_path, rate=sampling_rate, data=pcm)
+        return
+
+    from imageio_ffmpeg import get_ffmpeg_exe
+
+    command = [get_ffmpeg_exe(), "-v", "error", "-y",
+               "-f", "s16le", "-ar", str(sampling_rate), "-ac", "1", "-i", "pipe:0",
+               *options["args"], "-b:a", bitrate, output_path]
+    result = subprocess.run(command, input=pcm.tobytes(), capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to encode {fmt}: {result.stderr.decode(errors='replace').strip()}")
+
+
+def save_image(image, output_path: str, fmt: str = IMAGE_FORMAT, quality: Optional[int] = IMAGE_QUALITY) -> None:
+    """
+    Save a PIL image in the given format.
+
+    Args:
+        image (PIL.Image.Image): Image to save
+        output_path (str): Path of the output file
+        fmt (str): Name of a format in IMAGE_FORMATS
+        quality (Optional[int]): Quality of the lossy formats (1-100)
+
+    Returns:
+        None
+
+    Examples:
+        >>> save_image(image, "output.webp", fmt="webp", quality=80)
+    """
+    options = _check(fmt, IMAGE_FORMATS, "IMAGE_FORMAT")
+    if fmt == "png":
+        image.save(output_path, format=options["pil"])
+        return
+    if fmt == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+    image.save(output_path, format=options["pil"], quality=quality)
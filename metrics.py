@@ -0,0 +1,294 @@
+import contextvars
+import cProfile
+import functools
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+# Seconds between memory samples while a stage is running
+METRICS_MEMORY_INTERVAL = float(os.getenv('METRICS_MEMORY_INTERVAL', '0.05'))
+
+# Allow profiling a request with ?profile=1, and where the cProfile dumps are written
+PROFILE_REQUESTS = os.getenv('PROFILE_REQUESTS', 'false').lower() == 'true'
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+
+# Upper bounds of the stage duration histogram buckets in seconds
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss() -> int:
+    """Resident set size of the process in bytes."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        # Without procfs fall back to the high-water mark (kilobytes on Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Span:
+    """One timed run of a stage."""
+
+    def __init__(self, stage: str, parent: Optional["Span"]):
+        self.stage = stage
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.load_seconds = 0.0
+        self.peak_rss = current_rss()
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+class Metrics:
+    """
+    Process-wide stage timings, model loads and peak memory, rendered in the Prometheus text format.
+
+    Stage time spent loading models is reported separately from the rest of
+    the stage (inference, I/O or API calls), and a background sampler tracks
+    the peak resident memory while any stage is running.
+    """
+
+    def __init__(self, memory_interval: float = METRICS_MEMORY_INTERVAL):
+        self.memory_interval = memory_interval
+        self._stage_seconds: Dict[Tuple[str, str], _Histogram] = {}
+        self._stage_errors: Dict[str, int] = {}
+        self._stage_peak_rss: Dict[str, int] = {}
+        self._model_loads: Dict[str, _Histogram] = {}
+        self._active: List[Span] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        # Threads do not survive fork, so a forked server worker starts its own sampler
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[Span]:
+        """
+        Time a pipeline stage.
+
+        Args:
+            stage (str): Stage name, e.g. "asr" or "image"
+
+        Returns:
+            Iterator[Span]: The running span
+        """
+        span = Span(stage, _current_span.get())
+        token = _current_span.set(span)
+        self._start_sampling(span)
+        failed = False
+        try:
+            yield span
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            _current_span.reset(token)
+            self._stop_sampling(span)
+            self._record(span.stage, time.perf_counter() - span.start, span.load_seconds,
+                         max(span.peak_rss, current_rss()), failed)
+
+    def timed(self, stage: str) -> Callable:
+        """Decorator running every call of a function in a span of the stage."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def observe(self, stage: str, seconds: float, failed: bool = False) -> None:
+        """Record a stage timed by the caller, e.g. one spread over the chunks of a streamed response."""
+        self._record(stage, seconds, 0.0, current_rss(), failed)
+
+    def record_model_load(self, model: str, seconds: float) -> None:
+        """Record a model load and charge it to the loading thread's stages."""
+        with self._lock:
+            self._model_loads.setdefault(model, _Histogram()).observe(seconds)
+        self.charge_load(seconds)
+
+    def charge_load(self, seconds: float) -> None:
+        """Charge time spent loading a model, or waiting for another request to load it, to the current stages."""
+        span = _current_span.get()
+        while span is not None:
+            span.load_seconds += seconds
+            span = span.parent
+
+    def _record(self, stage: str, seconds: float, load_seconds: float, peak_rss: int, failed: bool) -> None:
+        load_seconds = min(load_seconds, seconds)
+        with self._lock:
+            self._stage_seconds.setdefault((stage, "load"), _Histogram())
+            if load_seconds:
+                self._stage_seconds[(stage, "load")].observe(load_seconds)
+            self._stage_seconds.setdefault((stage, "run"), _Histogram()).observe(seconds - load_seconds)
+            self._stage_errors[stage] = self._stage_errors.get(stage, 0) + failed
+            self._stage_peak_rss[stage] = max(self._stage_peak_rss.get(stage, 0), peak_rss)
+
+        trace = _trace.get()
+        if trace is not None:
+            trace.append((stage, seconds))
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sampler = None
+        self._active = []
+
+    def _start_sampling(self, span: Span) -> None:
+        with self._lock:
+            self._active.append(span)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="metrics-memory", daemon=True)
+                self._sampler.start()
+        self._wake.set()
+
+    def _stop_sampling(self, span: Span) -> None:
+        with self._lock:
+            self._active.remove(span)
+
+    def _sample(self) -> None:
+        # Sample only while some stage is running
+        while True:
+            self._wake.wait()
+            rss = current_rss()
+            with self._lock:
+                if not self._active:
+                    self._wake.clear()
+                    continue
+                for span in self._active:
+                    span.peak_rss = max(span.peak_rss, rss)
+            time.sleep(self.memory_interval)
+
+    def summary(self) -> Dict[str, Dict]:
+        """Count, total seconds and peak memory of every stage, split into load and run phases."""
+        with self._lock:
+            stages: Dict[str, Dict] = {}
+            for (stage, phase), hist in sorted(self._stage_seconds.items()):
+                entry = stages.setdefault(stage, {"peak_rss_bytes": self._stage_peak_rss.get(stage, 0),
+                                                  "errors": self._stage_errors.get(stage, 0)})
+                entry[phase] = {"count": hist.count, "seconds": hist.sum}
+            return stages
+
+    def render(self, extra: Optional[Dict[str, Tuple[str, str, float]]] = None) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Args:
+            extra (Optional[Dict[str, Tuple[str, str, float]]]): Further samples by
+                metric name, as (type, help text, value)
+
+        Returns:
+            str: The exposition text
+        """
+        lines = []
+
+        def histogram(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, hist in series:
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), hist.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{_labels(**labels, le=bound)}}} {cumulative}')
+                lines.append(f"{name}_sum{{{_labels(**labels)}}} {hist.sum:.6f}")
+                lines.append(f"{name}_count{{{_labels(**labels)}}} {hist.count}")
+
+        with self._lock:
+            histogram("trendtok_stage_seconds", "Wall time of pipeline stages, split into model loading and the rest",
+                      [({"stage": stage, "phase": phase}, hist)
+                       for (stage, phase), hist in sorted(self._stage_seconds.items())])
+            lines.append("# HELP trendtok_stage_errors_total Stage runs that raised an exception")
+            lines.append("# TYPE trendtok_stage_errors_total counter")
+            lines.extend(f'trendtok_stage_errors_total{{{_labels(stage=stage)}}} {count}'
+                         for stage, count in sorted(self._stage_errors.items()))
+            lines.append("# HELP trendtok_stage_peak_rss_bytes Highest resident memory seen while the stage ran")
+            lines.append("# TYPE trendtok_stage_peak_rss_bytes gauge")
+            lines.extend(f'trendtok_stage_peak_rss_bytes{{{_labels(stage=stage)}}} {rss}'
+                         for stage, rss in sorted(self._stage_peak_rss.items()))
+            histogram("trendtok_model_load_seconds", "Time taken to load a model into the registry",
+                      [({"model": model}, hist) for model, hist in sorted(self._model_loads.items())])
+
+        samples = {"trendtok_process_resident_memory_bytes": ("gauge", "Resident memory of the process", current_rss())}
+        samples.update(extra or {})
+        for name, (metric_type, help_text, value) in samples.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+_trace: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar("trace", default=None)
+
+
+def start_trace() -> None:
+    """Collect the stages run for the current request (and the threads it hands work to)."""
+    _trace.set([])
+
+
+def server_timing() -> str:
+    """Stages of the current request as a Server-Timing header value."""
+    trace = _trace.get() or []
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in trace)
+
+
+def carry_context(func: Callable) -> Callable:
+    """Wrap a function to run in a copy of the caller's context, so spans in worker threads join its trace."""
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+class RequestProfiler:
+    """Opt-in cProfile capture of a single request, dumped as a .prof file for snakeviz or flameprof."""
+
+    def __init__(self, output_dir: str = PROFILE_DIR):
+        self.output_dir = output_dir
+        # Only one request is profiled at a time, the profiler hooks are process-wide
+        self._busy = threading.Lock()
+
+    def start(self) -> Optional[cProfile.Profile]:
+        if not self._busy.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def stop(self, profiler: cProfile.Profile, name: str) -> str:
+        try:
+            profiler.disable()
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+            profiler.dump_stats(path)
+            return path
+        finally:
+            self._busy.release()
+
+
+# Shared metrics and profiler for the process
+metrics = Metrics()
+request_profiler = RequestProfiler()
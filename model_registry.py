@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from metrics import metrics
+from init import load_musicgen, load_stable_diffusion, load_whisper, SD_PROFILES, SD_PROFILE
+
+
+# Registry names for the models used by the pipeline
+MUSICGEN = "musicgen"
+WHISPER = "whisper"
+
+
+def stable_diffusion_name(profile: str) -> str:
+    """Return the registry name of the Stable Diffusion pipeline for a performance profile."""
+    return f"stable_diffusion:{profile}"
+
+
+# Stable Diffusion pipeline for the configured profile
+STABLE_DIFFUSION = stable_diffusion_name(SD_PROFILE)
+
+# Upper bound on resident model memory in bytes (0 disables eviction)
+MODEL_REGISTRY_MAX_BYTES = int(os.getenv('MODEL_REGISTRY_MAX_BYTES', '0'))
+
+
+def estimate_nbytes(obj: Any) -> int:
+    """
+    Estimate the resident size of a loaded model in bytes.
+
+    Torch modules are measured by the tensors in their state dict (which
+    includes the int8 weights of quantised layers), diffusion
+    pipelines by the sum of their module components, transformers pipelines
+    by their model and tuples by the sum of their members. Anything else
+    (processors, tokenizers) counts as zero.
+
+    Args:
+        obj (Any): Object returned by a model loader
+
+    Returns:
+        int: Estimated size in bytes
+    """
+    if isinstance(obj, (tuple, list)):
+        return sum(estimate_nbytes(item) for item in obj)
+
+    # Diffusion pipelines expose their sub-models through `components`
+    components = getattr(obj, "components", None)
+    if isinstance(components, dict):
+        return sum(estimate_nbytes(component) for component in components.values())
+
+    # Transformers pipelines wrap a single model
+    if not hasattr(obj, "parameters") and hasattr(obj, "model"):
+        return estimate_nbytes(obj.model)
+
+    if hasattr(obj, "state_dict") and hasattr(obj, "parameters"):
+        # The state dict also holds the packed int8 weights of quantised layers, which are not
+        # parameters; tied weights appear under several keys but are the same object
+        tensors = {}
+        for value in obj.state_dict(keep_vars=True).values():
+            for item in (value if isinstance(value, tuple) else (value,)):
+                if hasattr(item, "element_size"):
+                    tensors[id(item)] = item
+        return sum(t.numel() * t.element_size() for t in tensors.values())
+
+    return 0
+
+
+class ModelRegistry:
+    """Process-wide registry that loads each model lazily and keeps it resident."""
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._models: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    def register(self, name: str, loader: Callable[[], Any]) -> None:
+        """
+        Register a loader for a model. The loader is only called on first use.
+
+        Args:
+            name (str): Name the model is requested by
+            loader (Callable[[], Any]): Zero-argument function returning the model
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._loaders[name] = loader
+            self._load_locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str) -> Any:
+        """
+        Return a resident model, loading it first if needed.
+
+        Args:
+            name (str): Name of a registered model
+
+        Returns:
+            Any: Whatever the registered loader returned
+
+        Examples:
+            >>> processor, model = registry.get("musicgen")
+        """
+        with self._lock:
+            if name in self._models:
+                self._models.move_to_end(name)
+                return self._models[name]
+            if name not in self._loaders:
+                raise KeyError(f"No model registered under '{name}'")
+            load_lock = self._load_locks[name]
+
+        # Serialise loads per model so concurrent requests share a single load
+        wait_start = time.perf_counter()
+        with load_lock:
+            with self._lock:
+                if name in self._models:
+                    # Loaded by another request while this one waited, which it spent loading as well
+                    metrics.charge_load(time.perf_counter() - wait_start)
+                    self._models.move_to_end(name)
+                    return self._models[name]
+                loader = self._loaders[name]
+
+            start = time.perf_counter()
+            model = loader()
+            metrics.record_model_load(name, time.perf_counter() - start)
+            size = estimate_nbytes(model)
+
+            with self._lock:
+                self._models[name] = model
+                self._sizes[name] = size
+                self._evict(keep=name)
+            return model
+
+    def evict(self, name: str) -> None:
+        """Drop a resident model so the next `get` reloads it."""
+        with self._lock:
+            self._models.pop(name, None)
+            self._sizes.pop(name, None)
+
+    def warm(self, names: Optional[Iterable[str]] = None) -> None:
+        """
+        Load models ahead of the first request.
+
+        Args:
+            names (Optional[Iterable[str]]): Models to load, defaults to every registered model
+
+        Returns:
+            None
+        """
+        for name in list(names if names is not None else self._loaders):
+            self.get(name)
+
+    def loaded(self) -> List[str]:
+        """Return the names of resident models, least recently used first."""
+        with self._lock:
+            return list(self._models)
+
+    def resident_bytes(self) -> int:
+        """Return the estimated memory held by resident models."""
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def _evict(self, keep: str) -> None:
+        # Drop least recently used models until the budget is met; the model
+        # that was just loaded is always kept even if it alone exceeds it
+        if not self.max_bytes:
+            return
+        for name in list(self._models):
+            if sum(self._sizes.values()) <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            print(f"Evicting model '{name}' from the registry")
+            self._models.pop(name)
+            self._sizes.pop(name)
+
+
+# Shared registry for the whole worker process
+registry = ModelRegistry(max_bytes=MODEL_REGISTRY_MAX_BYTES)
+registry.register(MUSICGEN, load_musicgen)
+for profile in SD_PROFILES:
+    registry.register(stable_diffusion_name(profile), partial(load_stable_diffusion, profile))
+registry.register(WHISPER, load_whisper)
+
+
+def warm_models() -> None:
+    """Load the generation models, as `init.load_models` does, and keep them resident."""
+    registry.warm([MUSICGEN, STABLE_DIFFUSION])
@@ -1,63 +1,409 @@
+import math
 import os
-import scipy.io.wavfile
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
 import numpy as np
-from transformers import AutoProcessor, MusicgenForConditionalGeneration
+from model_registry import registry, MUSICGEN
+from result_cache import media_cache, cache_key
+from init import MUSICGEN_MODEL, MUSICGEN_QUANTIZE
+from music_gen.batching import MicroBatcher
+from music_gen.streaming import AudioStream
+from media_formats import AUDIO_FORMAT, AUDIO_BITRATE, audio_extension, encode_audio
+from metrics import metrics, carry_context
+from scheduler import resource_scheduler
 
 
-# Model configuration
-MUSICGEN_MODEL = "facebook/musicgen-small"
+# Seconds of audio per unit of `audio_length`
+CLIP_SECONDS = 5
 
+# Longest clip generated in a single pass; longer clips are continued chunk by chunk,
+# each chunk prompted with the last MUSICGEN_CONTEXT_SECONDS of audio and cross-faded in
+MUSICGEN_CHUNK_SECONDS = float(os.getenv('MUSICGEN_CHUNK_SECONDS', '10'))
+MUSICGEN_CONTEXT_SECONDS = float(os.getenv('MUSICGEN_CONTEXT_SECONDS', '2'))
+CROSSFADE_SECONDS = 0.25
 
-def gen_api(desc: str, output_file_name: str, audio_length: int) -> str:
+# Every continuation must add new audio beyond its prompt, or a long clip would never finish
+if MUSICGEN_CHUNK_SECONDS <= MUSICGEN_CONTEXT_SECONDS:
+    raise ValueError(f"MUSICGEN_CHUNK_SECONDS ({MUSICGEN_CHUNK_SECONDS}) must be greater than "
+                     f"MUSICGEN_CONTEXT_SECONDS ({MUSICGEN_CONTEXT_SECONDS})")
+
+# Requests with the same duration and seed arriving within this window share one generate call
+MUSICGEN_BATCH_WINDOW_MS = int(os.getenv('MUSICGEN_BATCH_WINDOW_MS', '0'))
+MUSICGEN_MAX_BATCH = int(os.getenv('MUSICGEN_MAX_BATCH', '4'))
+
+# Seed used for cached generations so identical descriptions map to the same artifact
+DEFAULT_SEED = 0
+
+# Clips being streamed by cache key, so concurrent listeners share one generation
+_streams: Dict[str, AudioStream] = {}
+_streams_lock = threading.Lock()
+
+
+def tokens_for_duration(model, seconds: float) -> int:
     """
-    Generate audio from a textual description and save it as a .wav file.
+    Compute the `max_new_tokens` budget that yields `seconds` of new audio.
+
+    MusicGen emits one token per codebook frame, and its delay pattern costs
+    one extra step per additional codebook before the first full frame.
+
+    Parameters:
+    model (MusicgenForConditionalGeneration): The MusicGen model.
+    seconds (float): Length of the audio to generate.
+
+    Returns:
+    int: Number of new tokens to generate.
+    """
+    frame_rate = model.config.audio_encoder.frame_rate
+    return math.ceil(seconds * frame_rate) + model.config.decoder.num_codebooks - 1
+
+
+class SeededSampler:
+    """
+    Logits processor drawing each token from a generator of its own.
+
+    `generate` samples from torch's process-wide RNG, which concurrent
+    generations share, so a seed set with `torch.manual_seed` does not make a
+    clip reproducible. This processor applies classifier-free guidance and the
+    model's sampling warpers itself, draws the token with a per-call generator
+    and leaves only that token possible, so generate's own draw always picks it.
+
+    Parameters:
+    model (MusicgenForConditionalGeneration): The MusicGen model.
+    seed (int): Seed of the generator.
+    """
+
+    def __init__(self, model, seed: int):
+        import torch
+        from transformers import TemperatureLogitsWarper, TopKLogitsWarper, TopPLogitsWarper
+
+        config = model.generation_config
+        self.guidance_scale = config.guidance_scale
+        self.warpers = []
+        if config.temperature is not None and config.temperature != 1.0:
+            self.warpers.append(TemperatureLogitsWarper(config.temperature))
+        if config.top_k:
+            self.warpers.append(TopKLogitsWarper(config.top_k))
+        if config.top_p is not None and config.top_p < 1.0:
+            self.warpers.append(TopPLogitsWarper(config.top_p))
+        self.generator = torch.Generator(device=model.device).manual_seed(seed)
+
+    def __call__(self, input_ids, scores):
+        import torch
+
+        # With guidance, generate passes conditional then unconditional logits and combines them after this
+        # processor; sample from the guided logits and give both halves the same single possible token
+        guided = scores.shape[0] == 2 * input_ids.shape[0]
+        logits = scores
+        if guided:
+            cond, uncond = scores.split(input_ids.shape[0], dim=0)
+            logits = uncond + (cond - uncond) * self.guidance_scale
+        for warper in self.warpers:
+            logits = warper(input_ids, logits)
+        tokens = torch.multinomial(torch.softmax(logits.float(), dim=-1), num_samples=1, generator=self.generator)
+
+        # A finite floor keeps the guidance arithmetic free of inf - inf
+        forced = torch.full_like(logits, torch.finfo(logits.dtype).min).scatter_(1, tokens, 0.0)
+        return torch.cat([forced, forced]) if guided else forced
+
+
+def crossfade(head: np.ndarray, tail: np.ndarray, overlap: int) -> np.ndarray:
+    """
+    Join two clips, blending the last `overlap` samples of `head` into the first of `tail`.
+
+    Parameters:
+    head (np.ndarray): Earlier audio.
+    tail (np.ndarray): Later audio whose start overlaps the end of `head`.
+    overlap (int): Number of overlapping samples.
+
+    Returns:
+    np.ndarray: The joined audio.
+    """
+    overlap = min(overlap, len(head), len(tail))
+    if overlap == 0:
+        return np.concatenate([head, tail])
+    fade_in = np.linspace(0.0, 1.0, overlap, dtype=head.dtype)
+    blended = head[-overlap:] * (1.0 - fade_in) + tail[:overlap] * fade_in
+    return np.concatenate([head[:-overlap], blended, tail[overlap:]])
+
+
+def generate_segments(descs: List[str], duration: float,
+                      seed: Optional[int] = None) -> Iterator[Tuple[int, List[np.ndarray]]]:
+    """
+    Generate one clip per description in a single padded batch, yielding the audio as it becomes final.
+
+    Clips up to MUSICGEN_CHUNK_SECONDS long are generated in one pass. Longer
+    clips are extended chunk by chunk: each continuation is prompted with the
+    last MUSICGEN_CONTEXT_SECONDS of the audio so far and cross-faded onto it.
+    A segment is yielded after every chunk, minus the cross-fade that the next
+    chunk still changes, so the first one is ready after the first chunk.
+
+    Parameters:
+    descs (List[str]): Descriptions based on which the audio will be generated.
+    duration (float): Length of each clip in seconds.
+    seed (Optional[int]): Random seed for reproducible generation.
+
+    Returns:
+    Iterator[Tuple[int, List[np.ndarray]]]: Sampling rate and the next segment of every clip.
+    """
+
+    from transformers import LogitsProcessorList
+
+    # Get the resident pre-trained processor and model (loaded once per worker)
+    processor, model = registry.get(MUSICGEN)
+
+    # Get the sampling rate from the model's configuration
+    sampling_rate = model.config.audio_encoder.sampling_rate
+    total_samples = int(duration * sampling_rate)
+
+    # Wait until the device has room for the generation
+    with resource_scheduler.reserve("audio", model.device.type):
+        # Seed the sampler when a reproducible clip is requested; one generator serves every chunk
+        sampler = SeededSampler(model, seed) if seed is not None and model.generation_config.do_sample else None
+
+        def sampling():
+            # generate appends its guidance processor to the list, so each call gets a new one
+            return {"logits_processor": LogitsProcessorList([sampler])} if sampler else {}
+
+        # Process the input description texts, padded into one batch
+        inputs = processor(
+            text=descs,  # Input text descriptions
+            padding=True,  # Apply padding
+            return_tensors="pt",  # Return as PyTorch tensors
+        )
+
+        # Generate the first chunk
+        first_seconds = min(duration, MUSICGEN_CHUNK_SECONDS)
+        audio_values = model.generate(**inputs, max_new_tokens=tokens_for_duration(model, first_seconds), **sampling())
+        clips = [audio_values[i, 0].numpy() for i in range(len(descs))]
+
+        # Continue the clips until they reach the requested length
+        context = int(MUSICGEN_CONTEXT_SECONDS * sampling_rate)
+        fade = int(CROSSFADE_SECONDS * sampling_rate)
+        emitted = 0
+        while len(clips[0]) < total_samples:
+            # Hand out everything the next cross-fade leaves untouched
+            final = min(len(clips[0]) - fade, total_samples)
+            if final > emitted:
+                yield sampling_rate, [clip[emitted:final] for clip in clips]
+                emitted = final
+
+            remaining = (total_samples - len(clips[0])) / sampling_rate
+            step_seconds = min(remaining, MUSICGEN_CHUNK_SECONDS - MUSICGEN_CONTEXT_SECONDS)
+
+            inputs = processor(
+                audio=[clip[-context:] for clip in clips],  # Prompt with the end of the audio so far
+                sampling_rate=sampling_rate,
+                text=descs,
+                padding=True,
+                return_tensors="pt",
+            )
+            audio_values = model.generate(**inputs, max_new_tokens=tokens_for_duration(model, step_seconds), **sampling())
+
+            # The output starts with the re-encoded prompt; overlap its last samples with the clip
+            prompt_samples = inputs["input_values"].shape[-1]
+            for i, clip in enumerate(clips):
+                continuation = audio_values[i, 0].numpy()[max(0, prompt_samples - fade):]
+                clips[i] = crossfade(clip, continuation, fade)
+
+    yield sampling_rate, [clip[emitted:total_samples] for clip in clips]
+
+
+@metrics.timed("audio")
+def generate_batch(descs: List[str], duration: float, seed: Optional[int] = None) -> Tuple[int, List[np.ndarray]]:
+    """
+    Generate one clip per description in a single padded batch.
+
+    Parameters:
+    descs (List[str]): Descriptions based on which the audio will be generated.
+    duration (float): Length of each clip in seconds.
+    seed (Optional[int]): Random seed for reproducible generation.
+
+    Returns:
+    Tuple[int, List[np.ndarray]]: Sampling rate and one array of samples per description.
+    """
+    parts = [[] for _ in descs]
+    for sampling_rate, segments in generate_segments(descs, duration, seed=seed):
+        for part, segment in zip(parts, segments):
+            part.append(segment)
+    return sampling_rate, [np.concatenate(part) for part in parts]
+
+
+def _run_batch(descs: List[str], key: Tuple[float, Optional[int]]) -> List[Tuple[int, np.ndarray]]:
+    duration, seed = key
+    sampling_rate, clips = generate_batch(descs, duration, seed=seed)
+    return [(sampling_rate, clip) for clip in clips]
+
+
+# Collects concurrent requests with identical parameters into shared generate calls
+music_batcher = MicroBatcher(_run_batch, MUSICGEN_BATCH_WINDOW_MS / 1000.0, MUSICGEN_MAX_BATCH)
+
+
+def generate_audio(desc: str, audio_length: int, seed: Optional[int] = None) -> Tuple[int, np.ndarray]:
+    """
+    Generate audio samples from a textual description.
+
+    When MUSICGEN_BATCH_WINDOW_MS is set, the request waits up to that long to
+    share a batch with concurrent requests for the same length and seed.
+
+    Parameters:
+    desc (str): Description based on which the audio will be generated.
+    audio_length (int): Length of the audio in multiples of 5 seconds.
+    seed (Optional[int]): Random seed for reproducible generation.
+
+    Returns:
+    Tuple[int, np.ndarray]: Sampling rate and the generated samples.
+    """
+    duration = audio_length * CLIP_SECONDS
+    if MUSICGEN_BATCH_WINDOW_MS > 0:
+        return music_batcher.submit(desc, (duration, seed)).result()
+
+    sampling_rate, clips = generate_batch([desc], duration, seed=seed)
+    return sampling_rate, clips[0]
+
+
+def write_audio(output_path: str, sampling_rate: int, audio: np.ndarray, fmt: str = AUDIO_FORMAT) -> None:
+    """
+    Write audio samples in AUDIO_FORMAT (16-bit WAV, Opus or MP3), creating the parent directory if needed.
+
+    Parameters:
+    output_path (str): Path of the audio file.
+    sampling_rate (int): Sampling rate of the samples.
+    audio (np.ndarray): Samples to write.
+    fmt (str): Audio format, see `media_formats.AUDIO_FORMATS`.
+
+    Returns:
+    None
+    """
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    encode_audio(output_path, sampling_rate, audio, fmt=fmt)
+
+
+def gen_api(desc: str, output_file_name: str, audio_length: int, seed: Optional[int] = None) -> str:
+    """
+    Generate audio from a textual description and save it in AUDIO_FORMAT.
 
     This function uses a pre-trained model to generate audio data based on the provided
-    textual description and saves it to a specified .wav file.
+    textual description and saves it to a specified file.
 
     Parameters:
     desc (str): Description based on which the audio will be generated.
     output_file_name (str): Name of the output file (without extension) where the generated audio will be saved.
     audio_length (int): Length of the audio in multiples of 5 seconds.
+    seed (Optional[int]): Random seed for reproducible generation.
 
     Returns:
     str: URL of the output file.
 
     Example:
     >>> gen_api("A Russian ballet with synths.", "music", 2)
-    This will create a file named 'music.wav' containing the generated audio of length 10 seconds.
+    This will create a file named 'music.wav' (with the default format) containing the generated audio of length 10 seconds.
     """
+    sampling_rate, audio = generate_audio(desc, audio_length, seed=seed)
 
-    # Load the pre-trained processor and model
-    processor = AutoProcessor.from_pretrained(MUSICGEN_MODEL)
-    model = MusicgenForConditionalGeneration.from_pretrained(
-        MUSICGEN_MODEL, attn_implementation="eager")
+    # Ensure the output path is in the static directory
+    output_file_path = os.path.join('static', 'audio', f"{output_file_name}.{audio_extension()}")
 
-    # Process the input description text
-    inputs = processor(
-        text=[desc],  # Input text description
-        padding=True,  # Apply padding
-        return_tensors="pt",  # Return as PyTorch tensors
-    )
+    # Write the generated audio in the configured format
+    write_audio(output_file_path, sampling_rate, audio)
 
-    # Generate audio values using the model
-    audio_values = model.generate(**inputs, max_new_tokens=256)
+    # Return the file URL
+    return output_file_path
 
-    # Get the sampling rate from the model's configuration
-    sampling_rate = model.config.audio_encoder.sampling_rate
 
-    # Extend the generated audio to match the specified length
-    audio = audio_values[0, 0].numpy()
-    audio = np.tile(audio, audio_length)
+def audio_params(audio_length: int) -> Dict:
+    """
+    Return the generation settings that make up the cache key of a clip, besides the description and seed.
 
-    # Ensure the output path is in the static directory
-    static_dir = os.path.join('static', 'audio')
-    if not os.path.exists(static_dir):
-        os.makedirs(static_dir)
-    output_file_path = os.path.join(static_dir, output_file_name + ".wav")
+    Parameters:
+    audio_length (int): Length of the audio in multiples of 5 seconds.
 
-    # Write the generated audio to a .wav file
-    scipy.io.wavfile.write(output_file_path, rate=sampling_rate, data=audio)
+    Returns:
+    Dict: The settings affecting the generated file.
+    """
+    return {
+        "audio_length": audio_length,
+        "chunk_seconds": MUSICGEN_CHUNK_SECONDS,
+        "context_seconds": MUSICGEN_CONTEXT_SECONDS,
+        "format": AUDIO_FORMAT,
+        "bitrate": AUDIO_BITRATE,
+        "quantized": MUSICGEN_QUANTIZE,
+    }
 
-    # Return the file URL
-    return os.path.join('static', 'audio', output_file_name + ".wav")
+
+def gen_api_cached(desc: str, audio_length: int, seed: int = DEFAULT_SEED) -> str:
+    """
+    Generate audio from a textual description through the result cache.
+
+    Identical descriptions, lengths and seeds return the previously generated
+    file, and every distinct clip gets its own content-addressed path, so
+    concurrent users never overwrite each other's audio.
+
+    Parameters:
+    desc (str): Description based on which the audio will be generated.
+    audio_length (int): Length of the audio in multiples of 5 seconds.
+    seed (int): Random seed for reproducible generation.
+
+    Returns:
+    str: Path of the content-addressed audio file.
+
+    Example:
+    >>> gen_api_cached("A Russian ballet with synths.", 2)
+    """
+    def produce(path):
+        sampling_rate, audio = generate_audio(desc, audio_length, seed=seed)
+        write_audio(path, sampling_rate, audio)
+
+    return media_cache.get_or_create("audio", audio_extension(), MUSICGEN_MODEL, desc, audio_params(audio_length),
+                                     seed, produce)
+
+
+def gen_api_stream(desc: str, audio_length: int, seed: int = DEFAULT_SEED) -> AudioStream:
+    """
+    Generate audio from a textual description through the result cache, streaming it while it is generated.
+
+    The clip is generated on a background thread that appends a segment to the
+    returned stream after every MusicGen chunk and saves the whole clip to the
+    result cache at the end, so it is the same file `gen_api_cached` returns.
+    Requests for a clip that is already streaming join that stream. A cached
+    clip finishes the stream without any segments.
+
+    Parameters:
+    desc (str): Description based on which the audio will be generated.
+    audio_length (int): Length of the audio in multiples of 5 seconds.
+    seed (int): Random seed for reproducible generation.
+
+    Returns:
+    AudioStream: The growing clip, finished with the path of the cached file.
+
+    Example:
+    >>> for segment in gen_api_stream("A Russian ballet with synths.", 2).listen():
+    ...     play(segment)
+    """
+    params = audio_params(audio_length)
+    key = cache_key(MUSICGEN_MODEL, desc, params, seed)
+
+    def produce(stream, path):
+        with metrics.span("audio"):
+            for sampling_rate, segments in generate_segments([desc], audio_length * CLIP_SECONDS, seed=seed):
+                stream.append(sampling_rate, segments[0])
+        write_audio(path, stream.sampling_rate, stream.audio())
+
+    def run(stream):
+        try:
+            path = media_cache.get_or_create("audio", audio_extension(), MUSICGEN_MODEL, desc, params, seed,
+                                             lambda path: produce(stream, path))
+            stream.finish(path=path)
+        except Exception as e:
+            print(f"Exception occurred while streaming audio for '{desc}': {e}")
+            stream.finish(error=e)
+        finally:
+            with _streams_lock:
+                _streams.pop(key, None)
+
+    with _streams_lock:
+        stream = _streams.get(key)
+        if stream is None:
+            stream = _streams[key] = AudioStream()
+            # Scheduled as the requesting session's, and the stage joins the request's trace
+            threading.Thread(target=carry_context(run), args=(stream,), daemon=True).start()
+    return stream
@@ -0,0 +1,70 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+from metrics import carry_context
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests for a short window and runs them as one batch.
+
+    Requests are grouped by a key of parameters that must be identical within
+    a batch (e.g. duration and seed); each group is flushed when its window
+    expires or it reaches `max_batch` items.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any], Hashable], List[Any]],
+                 window_seconds: float, max_batch: int):
+        self.batch_fn = batch_fn
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self._pending: Dict[Hashable, List[Tuple[Any, Future]]] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, item: Any, key: Hashable) -> Future:
+        """
+        Queue an item for the batch identified by `key`.
+
+        Args:
+            item (Any): Per-request input, e.g. a description
+            key (Hashable): Parameters shared by every item of a batch
+
+        Returns:
+            Future: Resolves to this item's entry of the batch result
+        """
+        future = Future()
+        with self._lock:
+            group = self._pending.setdefault(key, [])
+            group.append((item, future))
+            first = len(group) == 1
+            full = len(group) >= self.max_batch
+            if full:
+                del self._pending[key]
+
+        # The batch runs in the submitting request's context, so its stages keep the session and trace
+        if full:
+            threading.Thread(target=carry_context(self._run), args=(key, group), daemon=True).start()
+        elif first:
+            threading.Thread(target=carry_context(self._flush_later), args=(key, group), daemon=True).start()
+        return future
+
+    def _flush_later(self, key: Hashable, group: List[Tuple[Any, Future]]) -> None:
+        time.sleep(self.window_seconds)
+        with self._lock:
+            # The group may already have been flushed because it filled up
+            if self._pending.get(key) is not group:
+                return
+            del self._pending[key]
+        self._run(key, group)
+
+    def _run(self, key: Hashable, group: List[Tuple[Any, Future]]) -> None:
+        try:
+            results = self.batch_fn([item for item, _ in group], key)
+        except Exception as e:
+            for _, future in group:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(group, results):
+            future.set_result(result)
@@ -0,0 +1,85 @@
+import struct
+import threading
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+
+def wav_stream_header(sampling_rate: int, channels: int = 1) -> bytes:
+    """
+    Build the header of a 16-bit PCM WAV stream of unknown length.
+
+    The RIFF and data sizes are set to their maximum, which players treat as
+    "until the connection closes", so samples can follow as they are generated.
+
+    Parameters:
+    sampling_rate (int): Sampling rate of the samples.
+    channels (int): Number of interleaved channels.
+
+    Returns:
+    bytes: The 44-byte header.
+    """
+    block_align = channels * 2
+    return (b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sampling_rate, sampling_rate * block_align,
+                                    block_align, 16)
+            + b"data" + struct.pack("<I", 0xFFFFFFFF))
+
+
+class AudioStream:
+    """
+    Segments of a clip that is still being generated.
+
+    The producer appends segments and finishes the stream with the path of the
+    saved clip or an error; any number of listeners read it from the start
+    while it grows.
+    """
+
+    def __init__(self):
+        self.sampling_rate: Optional[int] = None
+        self.path: Optional[str] = None
+        self.error: Optional[Exception] = None
+        self.done = False
+        self._segments: List[np.ndarray] = []
+        self._cond = threading.Condition()
+
+    def append(self, sampling_rate: int, segment: np.ndarray) -> None:
+        """Add the next segment of the clip."""
+        with self._cond:
+            self.sampling_rate = sampling_rate
+            self._segments.append(segment)
+            self._cond.notify_all()
+
+    def finish(self, path: Optional[str] = None, error: Optional[Exception] = None) -> None:
+        """Mark the clip complete (saved at `path`) or failed."""
+        with self._cond:
+            self.path = path
+            self.error = error
+            self.done = True
+            self._cond.notify_all()
+
+    def audio(self) -> np.ndarray:
+        """Return the samples appended so far as one array."""
+        with self._cond:
+            return np.concatenate(self._segments) if self._segments else np.zeros(0, dtype=np.float32)
+
+    def listen(self) -> Iterator[np.ndarray]:
+        """
+        Yield every segment from the first one, waiting for new ones until the stream is finished.
+
+        Raises:
+        Exception: The producer's error, once the segments before it are read.
+        """
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self._segments) and not self.done:
+                    self._cond.wait()
+                if index < len(self._segments):
+                    segment = self._segments[index]
+                    index += 1
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            yield segment
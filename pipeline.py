@@ -0,0 +1,147 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from music_gen.api import gen_api_cached, gen_api_stream
+from music_gen.streaming import AudioStream
+from summariser.llama_api import llama_api, parse_idea, stream_llama_api
+from tiktok_to_text.api import t4_api
+from animate_text.api import generate_image_cached
+from result_cache import media_cache
+from prefetch import summary_prefetcher
+from metrics import carry_context
+
+
+# Length of the generated music in multiples of 5 seconds
+AUDIO_LENGTH = int(os.getenv('AUDIO_LENGTH', '6'))
+
+
+def summarise_videos(video_urls: List[str]) -> Dict:
+    # Attach to the prefetch started by /search, transcribing here only if there is none
+    return summary_prefetcher.result(video_urls) or t4_api(video_urls)
+
+
+def run_idea_pipeline(video_urls: List[str]) -> Dict:
+    """
+    Transcribe and summarise the videos, then generate a trend idea and song description.
+
+    Args:
+        video_urls (List[str]): Absolute paths of the downloaded videos
+
+    Returns:
+        Dict: The trend name, concept, summary tags and song description
+    """
+    text_summary = summarise_videos(video_urls)
+
+    # Get the idea and song descriptions from the Llama API
+    idea_description, song_description = llama_api(text_summary)
+
+    print("Idea Description:", idea_description)
+    print("Song Description:", song_description)
+
+    trend_name, formatted_video_idea = parse_idea(idea_description)
+
+    print("Trend Name:", trend_name)
+    print("Trend Idea:", formatted_video_idea)
+
+    return {
+        "idea": trend_name,
+        "concept": formatted_video_idea,
+        "tags": text_summary["tags"],
+        "song_description": song_description,
+    }
+
+
+def stream_idea_pipeline(video_urls: List[str]) -> Iterator[Tuple[str, Dict]]:
+    """
+    Like `run_idea_pipeline`, but yields the idea while the LLM is still writing it.
+
+    Args:
+        video_urls (List[str]): Absolute paths of the downloaded videos
+
+    Returns:
+        Iterator[Tuple[str, Dict]]: Events of `stream_llama_api`, with the summary
+            tags added to the final "done" event
+    """
+    text_summary = summarise_videos(video_urls)
+
+    for name, data in stream_llama_api(text_summary):
+        if name == "done":
+            data = dict(data, tags=text_summary["tags"])
+        yield name, data
+
+
+def run_parallel_stages(stages: Dict[str, Callable[[], object]]) -> Tuple[Dict, Dict[str, float]]:
+    """
+    Run independent stages side by side.
+
+    Stages that run a model wait for the resource scheduler to admit them and
+    share the process's torch threads, which the scheduler sizes so two CPU
+    stages fit side by side; cache hits return without waiting.
+
+    Args:
+        stages (Dict[str, Callable[[], object]]): Stage name mapped to a zero-argument function
+
+    Returns:
+        Tuple[Dict, Dict[str, float]]: Stage results and per-stage wall times in seconds,
+            with the end-to-end time under "total"
+    """
+    timings = {}
+
+    def run_stage(name, func):
+        start = time.perf_counter()
+        result = func()
+        timings[name] = time.perf_counter() - start
+        return result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(stages), thread_name_prefix="media") as executor:
+        futures = {name: executor.submit(carry_context(run_stage), name, func) for name, func in stages.items()}
+        results = {name: future.result() for name, future in futures.items()}
+    timings["total"] = time.perf_counter() - start
+
+    return results, timings
+
+
+def run_media_pipeline(tags: str, song_description: str) -> Dict:
+    """
+    Generate the image for the tags and the music for the song description.
+
+    Both generations are independent, so they run concurrently and the
+    pipeline takes about as long as the slower of the two.
+
+    Args:
+        tags (str): Tags extracted from the video summary
+        song_description (str): Description of the music to generate
+
+    Returns:
+        Dict: Paths of the generated image and audio files and per-stage timings
+    """
+    results, timings = run_parallel_stages({
+        # Generate the image using the tags (served from the result cache when already generated)
+        "image": lambda: generate_image_cached(tags),
+        # Generate the audio using the song description
+        "audio": lambda: gen_api_cached(song_description, AUDIO_LENGTH),
+    })
+
+    print("Media timings:", timings)
+    print("Media cache:", media_cache.stats())
+
+    return {"image_path": results["image"], "audio_path": results["audio"], "timings": timings}
+
+
+def stream_audio_pipeline(song_description: str) -> AudioStream:
+    """
+    Start (or join) the music generation for the song description, streamed while it is generated.
+
+    The finished clip lands in the result cache, so a following
+    `run_media_pipeline` for the same description reuses it.
+
+    Args:
+        song_description (str): Description of the music to generate
+
+    Returns:
+        AudioStream: The growing clip, see `music_gen.api.gen_api_stream`
+    """
+    return gen_api_stream(song_description, AUDIO_LENGTH)
@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from tiktok_to_text.api import t4_api
+from metrics import carry_context
+
+
+# Prefetches running at once, prefetches queued or running at once, and how long unused results are kept
+PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', '2'))
+PREFETCH_MAX_PENDING = int(os.getenv('PREFETCH_MAX_PENDING', '8'))
+PREFETCH_RESULT_TTL = int(os.getenv('PREFETCH_RESULT_TTL', '900'))
+
+
+class _Prefetch:
+    def __init__(self, future: Future, cancel_event: threading.Event):
+        self.future = future
+        self.cancel_event = cancel_event
+        self.sessions: Set[str] = set()
+        self.created_at = time.time()
+
+
+class SummaryPrefetcher:
+    """
+    Speculatively transcribes and summarises videos as soon as /search has resolved them.
+
+    Prefetches are keyed by the list of videos, so every session looking at the
+    same tag shares one. A prefetch is cancelled once no session refers to it
+    any more, e.g. because the user searched for another tag.
+    """
+
+    def __init__(self, workers: int = PREFETCH_WORKERS, max_pending: int = PREFETCH_MAX_PENDING,
+                 result_ttl: int = PREFETCH_RESULT_TTL):
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._prefetches: Dict[Tuple[str, ...], _Prefetch] = {}
+        self._session_keys: Dict[str, Tuple[str, ...]] = {}
+        self._lock = threading.Lock()
+
+    def start(self, session_id: str, video_urls: List[str]) -> None:
+        """
+        Start (or join) the prefetch for a session's videos, releasing its previous one.
+
+        Args:
+            session_id (str): Identifier of the browser session
+            video_urls (List[str]): Absolute paths of the videos /generate_idea will transcribe
+
+        Returns:
+            None
+        """
+        key = tuple(video_urls)
+        with self._lock:
+            self._expire()
+            self._release(session_id, keep=key)
+            if not key:
+                return
+
+            prefetch = self._prefetches.get(key)
+            if prefetch is None:
+                # Skip speculation when enough work is already queued
+                pending = sum(1 for p in self._prefetches.values() if not p.future.done())
+                if pending >= self.max_pending:
+                    return
+                cancel_event = threading.Event()
+                # Transcription is scheduled as the searching session's
+                future = self._executor.submit(carry_context(t4_api), list(key), cancel_event)
+                prefetch = self._prefetches[key] = _Prefetch(future, cancel_event)
+
+            prefetch.sessions.add(session_id)
+            self._session_keys[session_id] = key
+
+    def result(self, video_urls: List[str]) -> Optional[Dict]:
+        """
+        Wait for the in-flight or finished prefetch of these videos.
+
+        Args:
+            video_urls (List[str]): Absolute paths of the videos
+
+        Returns:
+            Optional[Dict]: The t4_api summary, or None if there is no usable prefetch
+        """
+        with self._lock:
+            prefetch = self._prefetches.get(tuple(video_urls))
+        if prefetch is None:
+            return None
+        try:
+            return prefetch.future.result()
+        except CancelledError:
+            return None
+        except Exception as e:
+            print(f"Prefetch failed, transcribing again: {e}")
+            return None
+
+    def _release(self, session_id: str, keep: Tuple[str, ...]) -> None:
+        # Drop the session's interest in its previous videos and cancel them if nobody else waits
+        key = self._session_keys.pop(session_id, None)
+        if key is None or key == keep or key not in self._prefetches:
+            return
+        prefetch = self._prefetches[key]
+        prefetch.sessions.discard(session_id)
+        if not prefetch.sessions and not prefetch.future.done():
+            prefetch.cancel_event.set()
+            prefetch.future.cancel()
+            del self._prefetches[key]
+
+    def _expire(self) -> None:
+        now = time.time()
+        for key, prefetch in list(self._prefetches.items()):
+            if prefetch.future.done() and now - prefetch.created_at > self.result_ttl:
+                del self._prefetches[key]
+                for session_id in prefetch.sessions:
+                    if self._session_keys.get(session_id) == key:
+                        del self._session_keys[session_id]
+
+
+# Shared prefetcher for the web process
+summary_prefetcher = SummaryPrefetcher()
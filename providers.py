@@ -0,0 +1,82 @@
+import os
+import threading
+from typing import Any, Callable, Generic, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+# Get service account file path from environment variable
+SERVICE_ACCOUNT_FILE = os.getenv('GOOGLE_SERVICE_ACCOUNT_FILE', 'service_account.json')
+SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
+
+
+class DriveCredentialsError(Exception):
+    """Raised when the Google service account file is missing or cannot be loaded."""
+
+
+class LazyProvider(Generic[T]):
+    """Builds a shared object on first use instead of at import time."""
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._value: Optional[T] = None
+        self._built = False
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        """
+        Return the shared object, building it on the first call.
+
+        Returns:
+            T: Whatever the factory returned
+
+        Examples:
+            >>> session = drive_session.get()
+        """
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self._value = self._factory()
+                    self._built = True
+        return self._value
+
+    def override(self, value: Any) -> None:
+        """Replace the shared object, e.g. with a local stand-in."""
+        with self._lock:
+            self._value = value
+            self._built = True
+
+    def reset(self) -> None:
+        """Forget the shared object so the next `get` builds it again."""
+        with self._lock:
+            self._value = None
+            self._built = False
+
+
+def _load_drive_credentials():
+    from google.oauth2 import service_account
+
+    # Check if the service account file exists
+    if not os.path.exists(SERVICE_ACCOUNT_FILE):
+        raise DriveCredentialsError(
+            f"Google service account file not found: {SERVICE_ACCOUNT_FILE}. "
+            "Please set the GOOGLE_SERVICE_ACCOUNT_FILE environment variable or "
+            "place the service account JSON file in the project root."
+        )
+
+    try:
+        return service_account.Credentials.from_service_account_file(
+            SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+    except ValueError as e:
+        raise DriveCredentialsError(f"Invalid Google service account file {SERVICE_ACCOUNT_FILE}: {e}") from e
+
+
+def _build_drive_session():
+    from google.auth.transport.requests import AuthorizedSession
+
+    return AuthorizedSession(drive_credentials.get())
+
+
+# Google Drive service account credentials and the authorized HTTP session using them
+drive_credentials = LazyProvider(_load_drive_credentials)
+drive_session = LazyProvider(_build_drive_session)
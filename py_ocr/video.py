@@ -0,0 +1,193 @@
+import os
+import re
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from imageio_ffmpeg import get_ffmpeg_exe, read_frames
+
+from utils import process_pool
+
+
+# Read on-screen text of the videos and add it to the summary input
+OCR_ENABLED = os.getenv('OCR_ENABLED', 'false').lower() == 'true'
+
+# Frames considered per second, scene-change score a frame needs to be sampled, and frame width for OCR
+OCR_SAMPLE_FPS = float(os.getenv('OCR_SAMPLE_FPS', '2'))
+OCR_SCENE_THRESHOLD = float(os.getenv('OCR_SCENE_THRESHOLD', '0.1'))
+OCR_MAX_WIDTH = int(os.getenv('OCR_MAX_WIDTH', '720'))
+
+# Perceptual hashes within this many bits of an already read frame are skipped as duplicates
+OCR_HASH_DISTANCE = int(os.getenv('OCR_HASH_DISTANCE', '6'))
+
+# Tesseract processes and options (page segmentation mode 11 finds sparse caption text)
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+OCR_LANG = os.getenv('OCR_LANG', 'eng')
+OCR_TESSERACT_CONFIG = os.getenv('OCR_TESSERACT_CONFIG', '--psm 11')
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def engine_name() -> str:
+    """Name recorded with stored OCR text, so changing the sampling or Tesseract options re-reads the videos."""
+    return (f"ocr:{OCR_LANG}:{OCR_TESSERACT_CONFIG}:{OCR_SAMPLE_FPS}:{OCR_SCENE_THRESHOLD}:"
+            f"{OCR_MAX_WIDTH}:{OCR_HASH_DISTANCE}")
+
+
+def _output_size(video_file: str) -> Tuple[int, int]:
+    # Only the header is read to learn the frame size
+    frames = read_frames(video_file)
+    try:
+        meta = next(frames)
+    finally:
+        frames.close()
+    width, height = meta["size"]
+    if meta.get("rotate") in (90, 270):
+        width, height = height, width
+    if width > OCR_MAX_WIDTH:
+        width, height = OCR_MAX_WIDTH, int(height * OCR_MAX_WIDTH / width)
+    # Even dimensions keep the scaler exact
+    return width - width % 2, height - height % 2
+
+
+def sample_frames(video_file: str) -> Iterator[np.ndarray]:
+    """
+    Yield the grayscale frames at which the picture changes, decoded by ffmpeg.
+
+    The video is thinned to OCR_SAMPLE_FPS first and only frames whose scene-change
+    score exceeds OCR_SCENE_THRESHOLD (plus the first frame) are passed through
+    the pipe, so Python never sees most of the frames.
+
+    Parameters:
+    video_file (str): The path to the video file.
+
+    Returns:
+    Iterator[np.ndarray]: Frames of shape (height, width) and dtype uint8.
+    """
+    width, height = _output_size(video_file)
+    command = [
+        get_ffmpeg_exe(), "-nostdin", "-v", "error",
+        "-i", video_file,
+        "-an",  # Skip the audio stream
+        "-vf", f"fps={OCR_SAMPLE_FPS},select='eq(n\\,0)+gt(scene\\,{OCR_SCENE_THRESHOLD})',"
+               f"scale={width}:{height},format=gray",
+        "-vsync", "vfr",
+        "-f", "rawvideo", "-pix_fmt", "gray",
+        "pipe:1",
+    ]
+    frame_size = width * height
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            data = process.stdout.read(frame_size)
+            if len(data) < frame_size:
+                break
+            yield np.frombuffer(data, dtype=np.uint8).reshape(height, width)
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to sample frames from {video_file}: {stderr.decode(errors='replace').strip()}")
+
+
+def dhash(frame: np.ndarray) -> int:
+    """
+    64-bit difference hash of a grayscale frame.
+
+    The frame is resized to 8x9 cells and each bit records whether a cell is
+    brighter than its right-hand neighbour, so small changes in compression
+    or motion leave the hash (nearly) unchanged.
+    """
+    import cv2
+
+    # Area interpolation averages the pixels under each cell and also handles frames smaller than the grid
+    cells = cv2.resize(frame, (9, 8), interpolation=cv2.INTER_AREA).astype(np.float32)
+    bits = (cells[:, 1:] > cells[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def distinct_frames(frames: Iterator[np.ndarray], max_distance: int = OCR_HASH_DISTANCE) -> Iterator[np.ndarray]:
+    # Compare against every frame read so far, since captions often come back after a cut-away
+    seen: List[int] = []
+    for frame in frames:
+        frame_hash = dhash(frame)
+        if any(bin(frame_hash ^ other).count("1") <= max_distance for other in seen):
+            continue
+        seen.append(frame_hash)
+        yield frame
+
+
+def _ocr_frame(frame: np.ndarray) -> str:
+    import cv2
+    import pytesseract
+
+    # Upscale small captions and binarise with Otsu's threshold, which suits white-on-video text
+    if frame.shape[1] < 1000:
+        frame = cv2.resize(frame, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+    frame = cv2.GaussianBlur(frame, (3, 3), 0)
+    _, binary = cv2.threshold(frame, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    try:
+        return pytesseract.image_to_string(binary, lang=OCR_LANG, config=OCR_TESSERACT_CONFIG)
+    except pytesseract.pytesseract.TesseractError as e:
+        raise RuntimeError(f"Tesseract failed: {e}") from None
+    except pytesseract.TesseractNotFoundError as e:
+        # pytesseract's own exceptions cannot be unpickled, which would break the whole pool
+        raise RuntimeError(str(e)) from None
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = process_pool(OCR_WORKERS)
+    return _executor
+
+
+def clean_lines(texts: List[str]) -> List[str]:
+    # Keep each readable line once, in order of appearance
+    lines, seen = [], set()
+    for text in texts:
+        for line in text.splitlines():
+            line = " ".join(line.split())
+            key = re.sub(r"[^a-z0-9]", "", line.lower())
+            if len(re.findall(r"[A-Za-z]", line)) < 3 or key in seen:
+                continue
+            seen.add(key)
+            lines.append(line)
+    return lines
+
+
+def ocr_video(video_file: str) -> Dict:
+    """
+    Read the on-screen text of a video.
+
+    Sampled frames are deduplicated by perceptual hash while ffmpeg is still
+    decoding, and the remaining frames are preprocessed and read by Tesseract
+    on a process pool.
+
+    Parameters:
+    video_file (str): The path to the video file.
+
+    Returns:
+    Dict: The deduplicated "text" and the "sampled", "read" and "skipped" frame counts and "seconds" taken.
+    """
+    start = time.perf_counter()
+    counts = {"sampled": 0}
+
+    def counted(frames):
+        for frame in frames:
+            counts["sampled"] += 1
+            yield frame
+
+    futures = [_pool().submit(_ocr_frame, frame) for frame in distinct_frames(counted(sample_frames(video_file)))]
+    lines = clean_lines([future.result() for future in futures])
+
+    return {
+        "text": "\n".join(lines),
+        "sampled": counts["sampled"],
+        "read": len(futures),
+        "skipped": counts["sampled"] - len(futures),
+        "seconds": time.perf_counter() - start,
+    }
@@ -0,0 +1,84 @@
+import os
+import re
+from typing import Callable
+
+
+# Where quantised checkpoints are cached so the conversion is paid once per model and library version
+QUANTIZED_CACHE_DIR = os.getenv('QUANTIZED_CACHE_DIR', os.path.join('models', 'quantized'))
+
+
+def quantize_linear(module):
+    """
+    Dynamically quantise the linear layers of a model to int8 for CPU inference.
+
+    Weights are stored as int8 and activations are quantised on the fly, so
+    matrix multiplications run on int8 kernels while everything else (convolutions,
+    norms, embeddings) stays in float32.
+
+    Args:
+        module (torch.nn.Module): Model in float32 on the CPU, converted in place
+
+    Returns:
+        torch.nn.Module: The quantised model
+    """
+    import torch
+
+    # In place: no second copy of the weights, and weight-normed layers (EnCodec) cannot be deep-copied
+    return torch.ao.quantization.quantize_dynamic(module.eval(), {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def checkpoint_path(name: str, cache_dir: str = QUANTIZED_CACHE_DIR) -> str:
+    """
+    Return the path of a cached quantised model.
+
+    The torch and transformers/diffusers versions are part of the name since
+    the checkpoint is a pickled module that only loads with the same classes.
+
+    Args:
+        name (str): Model name, e.g. "facebook/musicgen-small" or "runwayml/stable-diffusion-v1-5/unet"
+        cache_dir (str): Directory of the cached checkpoints
+
+    Returns:
+        str: Path of the checkpoint
+    """
+    import diffusers
+    import torch
+    import transformers
+
+    versions = f"torch{torch.__version__}-tf{transformers.__version__}-df{diffusers.__version__}"
+    return os.path.join(cache_dir, re.sub(r"[^\w.-]+", "--", f"{name}-{versions}") + ".pt")
+
+
+def load_quantized(name: str, load_float: Callable, cache_dir: str = QUANTIZED_CACHE_DIR):
+    """
+    Load a quantised model from the cache, converting and caching it on a miss.
+
+    Args:
+        name (str): Model name used for the checkpoint path
+        load_float (Callable): Function loading the float32 model, only called on a miss
+        cache_dir (str): Directory of the cached checkpoints
+
+    Returns:
+        torch.nn.Module: The quantised model
+    """
+    import torch
+
+    path = checkpoint_path(name, cache_dir)
+    if os.path.exists(path):
+        try:
+            # The checkpoint is a whole pickled module written by this function, not a downloaded file
+            return torch.load(path, weights_only=False)
+        except Exception as e:
+            print(f"Exception occurred while loading {path}, converting again: {e}")
+
+    model = quantize_linear(load_float())
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        torch.save(model, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return model
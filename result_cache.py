@@ -0,0 +1,157 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+# Cache location and eviction limits (artifacts are served from here by the /media route)
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', os.path.join('static', 'cache'))
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+RESULT_CACHE_MAX_AGE = int(os.getenv('RESULT_CACHE_MAX_AGE', str(7 * 24 * 3600)))
+
+
+def cache_key(model: str, prompt: str, params: Dict[str, Any], seed: Optional[int]) -> str:
+    """
+    Build the content address of a generated artifact.
+
+    Args:
+        model (str): Name of the model producing the artifact
+        prompt (str): Prompt the artifact is generated from
+        params (Dict[str, Any]): Generation parameters that affect the output
+        seed (Optional[int]): Random seed used for generation
+
+    Returns:
+        str: Hex SHA-256 digest identifying the artifact
+
+    Examples:
+        >>> cache_key("facebook/musicgen-small", "lofi beat", {"audio_length": 6}, 0)
+    """
+    payload = json.dumps(
+        {"model": model, "prompt": prompt, "params": params, "seed": seed},
+        sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Disk-backed cache of generated artifacts stored at content-addressed paths.
+
+    Concurrent requests for the same artifact, from any thread or server
+    process sharing the cache directory, wait for a single producer.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 0, max_age: int = 0):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+    def path_for(self, kind: str, key: str, ext: str) -> str:
+        """Return the path an artifact with the given key is stored at."""
+        return os.path.join(self.root, kind, key[:2], f"{key}.{ext}")
+
+    def get_or_create(self, kind: str, ext: str, model: str, prompt: str,
+                      params: Dict[str, Any], seed: Optional[int],
+                      producer: Callable[[str], None]) -> str:
+        """
+        Return the cached artifact for the inputs, producing it on a miss.
+
+        Args:
+            kind (str): Artifact family used as a sub-directory, e.g. "image" or "audio"
+            ext (str): File extension of the artifact
+            model (str): Name of the model producing the artifact
+            prompt (str): Prompt the artifact is generated from
+            params (Dict[str, Any]): Generation parameters that affect the output
+            seed (Optional[int]): Random seed used for generation
+            producer (Callable[[str], None]): Function writing the artifact to the given path
+
+        Returns:
+            str: Path of the cached artifact
+        """
+        key = cache_key(model, prompt, params, seed)
+        path = self.path_for(kind, key, ext)
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Concurrent requests for the same artifact wait for a single producer: threads on the
+        # in-process lock, other server processes on an advisory lock file next to the artifact
+        try:
+            with key_lock:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(f"{path}.lock", "a") as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    if os.path.exists(path):
+                        with self._lock:
+                            self.hits += 1
+                        # Refresh the modification time so eviction treats it as recently used
+                        os.utime(path)
+                        return path
+
+                    with self._lock:
+                        self.misses += 1
+
+                    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.{ext}"
+                    try:
+                        producer(tmp_path)
+                        os.replace(tmp_path, path)
+                    finally:
+                        if os.path.exists(tmp_path):
+                            os.remove(tmp_path)
+        finally:
+            # Also dropped on hits and failed producers, so the lock table does not grow
+            with self._lock:
+                self._key_locks.pop(key, None)
+
+        self.evict()
+        return path
+
+    def evict(self) -> None:
+        """Delete artifacts older than `max_age`, then the oldest ones until under `max_bytes`."""
+        if not os.path.isdir(self.root):
+            return
+
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if ".tmp." in filename or filename.endswith(".lock"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+
+        now = time.time()
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            expired = self.max_age and now - mtime > self.max_age
+            oversized = self.max_bytes and total > self.max_bytes
+            if not (expired or oversized):
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+            try:
+                os.remove(f"{path}.lock")
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit and miss counters."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+# Shared cache for generated images and audio
+media_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_AGE)
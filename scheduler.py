@@ -0,0 +1,281 @@
+import contextvars
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from metrics import metrics
+from utils import get_accel_device, set_torch_threads
+
+
+# CPU threads and working memory (MB) the heavy stages may use at once (0: all cores, half the physical memory)
+SCHEDULER_CPU_THREADS = int(os.getenv('SCHEDULER_CPU_THREADS', '0'))
+SCHEDULER_MEMORY_MB = int(os.getenv('SCHEDULER_MEMORY_MB', '0'))
+
+# Stages running on the accelerator at once, and the share of its memory they may use
+SCHEDULER_ACCEL_SLOTS = int(os.getenv('SCHEDULER_ACCEL_SLOTS', '1'))
+SCHEDULER_ACCEL_MEMORY_FRACTION = float(os.getenv('SCHEDULER_ACCEL_MEMORY_FRACTION', '0.9'))
+
+# Stages allowed to wait for capacity, and how long one may wait before it is rejected
+SCHEDULER_MAX_QUEUE = int(os.getenv('SCHEDULER_MAX_QUEUE', '8'))
+SCHEDULER_MAX_WAIT = float(os.getenv('SCHEDULER_MAX_WAIT', '300'))
+
+# Torch threads every CPU stage runs with (0: half the scheduled threads, so image and music generation fit
+# side by side); torch's thread count is process-wide, so it is set once and each CPU stage reserves it
+SCHEDULER_STAGE_THREADS = int(os.getenv('SCHEDULER_STAGE_THREADS', '0'))
+
+# Working memory of a stage in MB (activations and buffers; resident weights are the model registry's)
+STAGE_MEMORY_MB = {
+    "transcribe": int(os.getenv('SCHEDULER_TRANSCRIBE_MEMORY_MB', '512')),
+    "audio": int(os.getenv('SCHEDULER_AUDIO_MEMORY_MB', '1536')),
+    "image": int(os.getenv('SCHEDULER_IMAGE_MEMORY_MB', '3072')),
+}
+
+# Cheaper stages start first when several wait; cache hits and LLM calls never wait at all
+STAGE_PRIORITY = {"transcribe": 0, "audio": 1, "image": 2}
+
+_session: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("scheduler_session", default=None)
+
+
+class Saturated(Exception):
+    """Raised when a stage cannot get capacity: too many stages are waiting, or it waited too long."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server is at capacity, retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class Device:
+    """Capacity of a device and what is currently reserved on it."""
+
+    def __init__(self, name: str, threads: int = 0, memory_mb: int = 0, slots: int = 0):
+        self.name = name
+        self.threads = threads
+        self.memory_mb = memory_mb
+        # Concurrent stages allowed (0: only bounded by threads and memory)
+        self.slots = slots
+        self.used_threads = 0
+        self.used_memory_mb = 0
+        self.used_slots = 0
+
+    def to_dict(self) -> Dict:
+        return {"threads": self.threads, "memory_mb": self.memory_mb, "slots": self.slots,
+                "used_threads": self.used_threads, "used_memory_mb": self.used_memory_mb,
+                "used_slots": self.used_slots}
+
+
+class Grant:
+    """A stage's reservation, waiting or running."""
+
+    def __init__(self, seq: int, stage: str, device: str, threads: int, memory_mb: int, session: Optional[str]):
+        self.seq = seq
+        self.stage = stage
+        self.device = device
+        self.threads = threads
+        self.memory_mb = memory_mb
+        self.session = session
+        self.started_at: Optional[float] = None
+
+
+def set_session(session_id: Optional[str]) -> None:
+    """Attribute the stages run for the current request (and the threads it hands work to) to a session."""
+    _session.set(session_id)
+
+
+def physical_memory_mb() -> int:
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // 2 ** 20
+    except (AttributeError, ValueError, OSError):
+        return 8192
+
+
+def detect_devices() -> Dict[str, Device]:
+    """Return the CPU and, when present, the accelerator with their schedulable capacity."""
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    threads = SCHEDULER_CPU_THREADS or cores
+    devices = {"cpu": Device("cpu", threads, SCHEDULER_MEMORY_MB or physical_memory_mb() // 2)}
+
+    accel = get_accel_device()
+    if accel == "cuda":
+        import torch
+
+        total_mb = torch.cuda.get_device_properties(0).total_memory // 2 ** 20
+        devices[accel] = Device(accel, memory_mb=int(total_mb * SCHEDULER_ACCEL_MEMORY_FRACTION),
+                                slots=SCHEDULER_ACCEL_SLOTS)
+    elif accel == "mps":
+        # Unified memory has no separate budget, only the number of concurrent stages is limited
+        devices[accel] = Device(accel, slots=SCHEDULER_ACCEL_SLOTS)
+    return devices
+
+
+class ResourceScheduler:
+    """
+    Admission control for the heavy inference stages (transcription, image and music generation).
+
+    Each stage reserves CPU threads and working memory, plus a slot and memory
+    on the accelerator when it runs there, before it starts. Stages that do not
+    fit wait; when capacity frees up, the waiting stage of the session with the
+    fewest running stages goes first, then the cheapest stage, then the oldest.
+    A stage is rejected with `Saturated` when SCHEDULER_MAX_QUEUE stages are
+    already waiting or it waited for SCHEDULER_MAX_WAIT seconds.
+    """
+
+    def __init__(self, max_queue: int = SCHEDULER_MAX_QUEUE, max_wait: float = SCHEDULER_MAX_WAIT):
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.share = 1
+        self.torch_threads = SCHEDULER_STAGE_THREADS
+        self._devices: Optional[Dict[str, Device]] = None
+        self._waiting: List[Grant] = []
+        self._running: List[Grant] = []
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._durations: List[float] = []
+
+    def partition(self, processes: int, torch_threads: int = 0) -> None:
+        """
+        Schedule only this process's share of every device, for servers running several worker processes.
+
+        Args:
+            processes (int): Number of worker processes sharing the devices
+            torch_threads (int): Torch threads of every CPU stage, instead of SCHEDULER_STAGE_THREADS
+        """
+        with self._cond:
+            self.share = max(1, processes)
+            self.torch_threads = torch_threads or SCHEDULER_STAGE_THREADS
+            self._devices = None
+
+    def devices(self) -> Dict[str, Device]:
+        # Detected on first use, since it imports torch
+        if self._devices is None:
+            devices = detect_devices()
+            for device in devices.values():
+                device.threads = device.threads and max(1, device.threads // self.share)
+                device.memory_mb = device.memory_mb and max(1, device.memory_mb // self.share)
+                device.slots = device.slots and max(1, device.slots // self.share)
+            self._devices = devices
+            set_torch_threads(self.stage_threads())
+        return self._devices
+
+    def stage_threads(self) -> int:
+        """Torch threads of this process, which every CPU stage runs with and reserves."""
+        cpu_threads = self._devices["cpu"].threads
+        return min(self.torch_threads, cpu_threads) or max(1, cpu_threads // 2)
+
+    @contextmanager
+    def reserve(self, stage: str, device: str = "cpu", threads: Optional[int] = None,
+                memory_mb: Optional[int] = None) -> Iterator[Grant]:
+        """
+        Wait for capacity to run a stage and hold it for the block.
+
+        On the CPU a stage reserves the process's torch threads (`stage_threads`);
+        on an accelerator it takes one host thread and a device slot.
+
+        Args:
+            stage (str): Stage name, e.g. "image" or "audio"
+            device (str): Device the stage runs on ("cpu", "cuda" or "mps")
+            threads (Optional[int]): CPU threads the stage keeps busy, when not torch's (e.g. worker processes)
+            memory_mb (Optional[int]): Working memory in MB, instead of the stage's default
+
+        Returns:
+            Iterator[Grant]: The granted reservation
+
+        Raises:
+            Saturated: If too many stages are waiting or capacity did not free up in time
+
+        Examples:
+            >>> with resource_scheduler.reserve("image", pipe.device.type):
+            ...     pipe(prompt)
+        """
+        with self._cond:
+            devices = self.devices()
+            if device not in devices:
+                device = "cpu"
+            cpu, target = devices["cpu"], devices[device]
+
+            threads = 1 if device != "cpu" else threads or self.stage_threads()
+            memory_mb = STAGE_MEMORY_MB.get(stage, 0) if memory_mb is None else memory_mb
+            # A stage larger than the whole device still runs, alone
+            grant = Grant(next(self._seq), stage, device, min(threads, cpu.threads),
+                          min(memory_mb, target.memory_mb) if target.memory_mb else 0, _session.get())
+
+            if len(self._waiting) >= self.max_queue:
+                raise Saturated(self._retry_after())
+            self._waiting.append(grant)
+
+            if not self._ready(grant):
+                # Time spent queueing shows up as its own stage, e.g. "image_wait"
+                with metrics.span(f"{stage}_wait"):
+                    deadline = time.monotonic() + self.max_wait
+                    while not self._ready(grant):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._waiting.remove(grant)
+                            self._cond.notify_all()
+                            raise Saturated(self._retry_after())
+                        self._cond.wait(remaining)
+
+            self._waiting.remove(grant)
+            cpu.used_threads += grant.threads
+            target.used_memory_mb += grant.memory_mb
+            if target.slots:
+                target.used_slots += 1
+            grant.started_at = time.monotonic()
+            self._running.append(grant)
+            # The next stage in line may fit as well
+            self._cond.notify_all()
+
+        try:
+            yield grant
+        finally:
+            with self._cond:
+                self._running.remove(grant)
+                cpu.used_threads -= grant.threads
+                target.used_memory_mb -= grant.memory_mb
+                if target.slots:
+                    target.used_slots -= 1
+                self._durations = (self._durations + [time.monotonic() - grant.started_at])[-20:]
+                self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        """Return the waiting and running stages and the capacity in use per device."""
+        with self._cond:
+            return {
+                "waiting": len(self._waiting),
+                "running": len(self._running),
+                "devices": {name: device.to_dict() for name, device in self.devices().items()},
+            }
+
+    def _ready(self, grant: Grant) -> bool:
+        return self._next(grant.device) is grant and self._fits(grant)
+
+    def _next(self, device: str) -> Optional[Grant]:
+        # Fairness first: sessions with fewer running stages go ahead, then cheaper stages, then arrival order
+        running: Dict[Optional[str], int] = {}
+        for grant in self._running:
+            running[grant.session] = running.get(grant.session, 0) + 1
+        candidates = [grant for grant in self._waiting if grant.device == device]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda g: (running.get(g.session, 0),
+                                              STAGE_PRIORITY.get(g.stage, len(STAGE_PRIORITY)), g.seq))
+
+    def _fits(self, grant: Grant) -> bool:
+        cpu, target = self._devices["cpu"], self._devices[grant.device]
+        return (cpu.used_threads + grant.threads <= cpu.threads
+                and (not target.memory_mb or target.used_memory_mb + grant.memory_mb <= target.memory_mb)
+                and (not target.slots or target.used_slots < target.slots))
+
+    def _retry_after(self) -> int:
+        # Roughly how long the stages ahead take to drain, from recent stage durations
+        if not self._durations:
+            return 5
+        average = sum(self._durations) / len(self._durations)
+        return max(1, math.ceil(average * (len(self._waiting) + 1) / max(1, len(self._running))))
+
+
+# Shared scheduler for the web process
+resource_scheduler = ResourceScheduler()
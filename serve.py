@@ -0,0 +1,175 @@
+import argparse
+import gc
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+# Address and number of worker processes of the production server
+SERVE_HOST = os.getenv('SERVE_HOST', '0.0.0.0')
+SERVE_PORT = int(os.getenv('SERVE_PORT', '8888'))
+SERVE_WORKERS = int(os.getenv('SERVE_WORKERS', '2'))
+
+# Load the models in the parent before forking, so workers share their pages copy-on-write
+SERVE_PRELOAD = os.getenv('SERVE_PRELOAD', 'true').lower() == 'true'
+
+# Torch intra-op threads every model stage of a worker runs with (0: half the worker's share of the cores)
+SERVE_TORCH_THREADS = int(os.getenv('SERVE_TORCH_THREADS', '0'))
+
+
+def listen(host: str, port: int, backlog: int = 128) -> socket.socket:
+    """
+    Open the listening socket every worker accepts connections from.
+
+    Args:
+        host (str): Interface to bind
+        port (int): Port to bind (0 picks a free one)
+        backlog (int): Pending connection queue length
+
+    Returns:
+        socket.socket: The bound, listening socket
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def preload_models() -> None:
+    """
+    Load the generation models the workers use, so their weights are shared rather than copied per worker.
+
+    Whisper is not preloaded: it decodes in the ASR_WORKERS processes each worker
+    starts from a forkserver, and every one of them loads its own copy.
+    """
+    from model_registry import registry, MUSICGEN, STABLE_DIFFUSION
+
+    names = [MUSICGEN, STABLE_DIFFUSION]
+    start = time.perf_counter()
+    registry.warm(names)
+    print(f"Loaded {', '.join(names)} in {time.perf_counter() - start:.1f}s before forking")
+
+
+def run_worker(app, sock: socket.socket, torch_threads: int, workers: int) -> None:
+    """Serve requests on the shared socket until terminated; runs in a forked child."""
+    from werkzeug.serving import make_server
+    from scheduler import resource_scheduler
+
+    # Objects created from here on belong to this worker and are collected as usual
+    gc.enable()
+
+    # Model stages of this worker are admitted against its share of the cores, memory and accelerator,
+    # and the scheduler sets the worker's torch threads to fit within it
+    resource_scheduler.partition(workers, torch_threads)
+
+    # Exit cleanly when the parent stops the server
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    print(f"Worker {os.getpid()} serving on http://{host}:{port}")
+    server.serve_forever()
+
+
+def serve(app, sock: socket.socket, workers: int = SERVE_WORKERS, preload: bool = SERVE_PRELOAD,
+          torch_threads: int = SERVE_TORCH_THREADS) -> None:
+    """
+    Run a pre-fork server: load the models once, then fork workers sharing the socket.
+
+    The parent only supervises: it restarts workers that die and stops them all
+    on SIGTERM or SIGINT.
+
+    Args:
+        app (Flask): The WSGI application
+        sock (socket.socket): Listening socket from `listen`
+        workers (int): Number of worker processes
+        preload (bool): Load the models before forking
+        torch_threads (int): Torch threads of every model stage in a worker (0: half the worker's share of the cores)
+    """
+    if preload:
+        preload_models()
+
+    # Move everything allocated so far out of the collector's reach: collections in the
+    # workers would otherwise write to these objects and copy the shared pages
+    gc.freeze()
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(app, sock, torch_threads, workers)
+            except SystemExit:
+                pass
+            finally:
+                # Skip the parent's atexit handlers and buffered output
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        pid, status = os.wait()
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting it")
+            # Avoid a tight restart loop when workers die on startup
+            time.sleep(1)
+            spawn()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the app with several worker processes sharing the models.")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--no-preload", action="store_true", help="Let each worker load the models on demand")
+    parser.add_argument("--torch-threads", type=int, default=SERVE_TORCH_THREADS)
+    args = parser.parse_args()
+
+    # Objects created while importing and loading are frozen before forking, so collect nothing until then
+    gc.disable()
+
+    # Jobs may be polled from another worker than the one running them
+    state_dir = None
+    if args.workers > 1 and not os.getenv('JOB_STATE_DIR'):
+        state_dir = tempfile.mkdtemp(prefix="trendtok-jobs-")
+        os.environ['JOB_STATE_DIR'] = state_dir
+
+    # Bind before loading anything, so a taken port fails fast
+    sock = listen(args.host, args.port)
+
+    from app import app
+
+    try:
+        serve(app, sock, args.workers, not args.no_preload, args.torch_threads)
+    finally:
+        sock.close()
+        if state_dir:
+            shutil.rmtree(state_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
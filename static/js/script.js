@@ -1,3 +1,58 @@
+// Submit a pipeline job and poll its result endpoint until it has finished
+function runJob(url, formData) {
+    return fetch(url + '?async=1', {
+            method: 'POST',
+            body: formData
+        }).then(response => response.json())
+        .then(job => new Promise((resolve, reject) => {
+            // Results served straight away (e.g. from the trend index) carry no job id
+            if (!job.job_id) {
+                job.error ? reject(job.error) : resolve(job);
+                return;
+            }
+            function poll() {
+                fetch('/jobs/' + job.job_id + '/result')
+                    .then(response => {
+                        if (response.status === 202) {
+                            setTimeout(poll, 2000);
+                        } else if (response.ok) {
+                            response.json().then(resolve, reject);
+                        } else {
+                            // Failed or rejected jobs answer with an error message
+                            response.json().then(data => reject(data.error), reject);
+                        }
+                    }, reject);
+            }
+            poll();
+        }));
+}
+
+// Stream the idea from the server, reporting each section as it is written
+function streamIdea(onUpdate) {
+    return new Promise((resolve, reject) => {
+        var source = new EventSource('/generate_idea/stream');
+        source.addEventListener('partial', e => {
+            var data = JSON.parse(e.data);
+            onUpdate(data.field, data.text);
+        });
+        source.addEventListener('idea', e => onUpdate('idea', JSON.parse(e.data).idea));
+        source.addEventListener('concept', e => onUpdate('concept', JSON.parse(e.data).concept));
+        source.addEventListener('done', e => {
+            source.close();
+            resolve(JSON.parse(e.data));
+        });
+        source.addEventListener('failed', e => {
+            source.close();
+            reject(JSON.parse(e.data).error);
+        });
+        // Stop the browser from reconnecting and generating the idea again
+        source.onerror = () => {
+            source.close();
+            reject('Idea stream interrupted');
+        };
+    });
+}
+
 document.addEventListener('DOMContentLoaded', function () {
     var input = document.querySelector('#main-search');
     var availableTags = JSON.parse(document.getElementById('trending-tags').textContent);
@@ -49,29 +104,34 @@ document.addEventListener('DOMContentLoaded', function () {
                     document.getElementById('left-content').style.display = 'block';
                     document.getElementById('right-content').style.display = 'block';
                     document.getElementById('body-content').innerHTML = html;
-                    fetch('/generate_idea', {
-                            method: 'POST',
-                            body: formData
-                        }).then(response => response.json())
+                    // Show the idea as soon as its first words arrive
+                    var showIdea = function (field, text) {
+                        document.getElementById('idea-content').style.display = 'block';
+                        document.getElementById('audio-loader').style.display = 'none';
+                        document.getElementById('audio-loader-2').style.display = 'block';
+                        document.getElementById(field === 'idea' ? 'idea-text' : 'concept-text').textContent = text;
+                    };
+                    var idea = window.EventSource ? streamIdea(showIdea) : runJob('/generate_idea', formData);
+                    var streamingAudio = false;
+                    idea
                         .then(data => {
                             console.log("Response received for idea and concept");
-                            var ideaContent = document.getElementById('idea-content');
-                            ideaContent.style.display = 'block';
-                            document.getElementById('audio-loader').style.display = 'none';
-                            document.getElementById('audio-loader-2').style.display = 'block';
-                            var ideaText = document.getElementById('idea-text');
-                            var conceptText = document.getElementById('concept-text');
-                            var infoText = document.getElementById('info-text');
-
-                            ideaText.textContent = data.idea;
-                            conceptText.textContent = data.concept;
-                            infoText.style.display = 'block';
-                            return fetch('/generate_media', {
-                                method: 'POST',
-                                body: formData
-                            });
+                            showIdea('idea', data.idea);
+                            showIdea('concept', data.concept);
+                            document.getElementById('info-text').style.display = 'block';
+                            if (data.tags && data.song_description) {
+                                // Start playing the music while it is generated; the image follows with /generate_media
+                                streamingAudio = true;
+                                document.getElementById('audio-loader-2').style.display = 'none';
+                                document.getElementById('audio-content').style.display = 'block';
+                                document.getElementById('generated-image').style.display = 'none';
+                                document.getElementById('audio-source').src = '/generate_media/audio_stream';
+                                var streamElement = document.getElementById('audio-element');
+                                streamElement.load();
+                                streamElement.play();
+                            }
+                            return runJob('/generate_media', formData);
                         })
-                        .then(response => response.json())
                         .then(data => {
                             console.log("Response received for audio generation");
                             document.getElementById('audio-loader-2').style.display = 'none';
@@ -80,10 +140,14 @@ document.addEventListener('DOMContentLoaded', function () {
                             var audioSource = document.getElementById('audio-source');
                             var audioPlayer = document.getElementById('audio-player');
 
-                            if (data.audio_url) {
+                            var audioElement = document.getElementById('audio-element');
+                            // A failed stream leaves the element without a usable source
+                            if (streamingAudio && audioElement.networkState !== HTMLMediaElement.NETWORK_NO_SOURCE) {
+                                // The streamed music is the clip behind audio_url, keep it playing
+                                audioPlayer.style.display = 'block';
+                            } else if (data.audio_url) {
                                 audioSource.src = data.audio_url;
                                 audioPlayer.style.display = 'block';
-                                var audioElement = document.getElementById('audio-element');
                                 audioElement.load();
                                 audioElement.play();
                             } else {
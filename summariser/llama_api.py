@@ -1,40 +1,196 @@
+import json
 import os
-from llamaapi import LlamaAPI
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
 
+from llm_client import llm_client
+from metrics import metrics
 
-def llama_api(desc: str) -> str:
-    api_key = os.getenv('LLAMA_API_KEY')
-    if not api_key:
-        raise ValueError("LLAMA_API_KEY environment variable is required")
-    
-    llama = LlamaAPI(api_key)
 
+# Ask for the idea and the song description in a single structured-JSON request
+LLAMA_COMBINED_IDEA_SONG = os.getenv('LLAMA_COMBINED_IDEA_SONG', 'false').lower() == 'true'
+
+IDEA_SYSTEM_PROMPT = "You are a TikTok trend idea generator which can come up with a new trend idea. Your response should include a title starting with 'Trend Idea:', followed by a concise description starting with 'Trend Concept:'."
+SONG_SYSTEM_PROMPT = "You are a tiktok trend generator which can take tags and generate audio cues to be given to a Music generator model. Your response includes only the audio description for a 5 second clip. It is very concise."
+COMBINED_SYSTEM_PROMPT = (
+    "You are a TikTok trend generator. Given tags, respond with only a JSON object with two string fields. "
+    "\"idea\": a new trend idea with a title starting with 'Trend Idea:', followed by a concise description starting with 'Trend Concept:'. "
+    "\"song\": very concise audio cues for a Music generator model describing a 5 second clip."
+)
+
+
+def idea_request(tags: str) -> Dict:
     # API Request JSON Cell
-    api_request_idea = {
+    return {
         "model": "llama3-8b",
         "messages": [
             {
                 "role": "system",
-                "content": "You are a TikTok trend idea generator which can come up with a new trend idea. Your response should include a title starting with 'Trend Idea:', followed by a concise description starting with 'Trend Concept:'."
+                "content": IDEA_SYSTEM_PROMPT
             },
             {
                 "role": "user",
-                "content": desc["tags"],
+                "content": tags,
             },
         ],
         "max_tokens": 250,
         "stream": False
     }
 
-    api_request_song = {
+
+def song_request(tags: str) -> Dict:
+    return {
         "model": "llama3-8b",
         "messages": [
-            {"role": "system", "content": "You are a tiktok trend generator which can take tags and generate audio cues to be given to a Music generator model. Your response includes only the audio description for a 5 second clip. It is very concise."},
-            {"role": "user", "content": desc["tags"]},
+            {"role": "system", "content": SONG_SYSTEM_PROMPT},
+            {"role": "user", "content": tags},
         ]
     }
 
-    # Make your request and handle the response
-    response_idea = llama.run(api_request_idea)
-    response_song = llama.run(api_request_song)
-    return response_idea.json()['choices'][0]['message']['content'], response_song.json()['choices'][0]['message']['content']
+
+def combined_request(tags: str) -> Dict:
+    return {
+        "model": "llama3-8b",
+        "messages": [
+            {"role": "system", "content": COMBINED_SYSTEM_PROMPT},
+            {"role": "user", "content": tags},
+        ],
+        "max_tokens": 350,
+        "stream": False
+    }
+
+
+def parse_combined(response_text: str) -> Optional[Tuple[str, str]]:
+    # Accept the JSON object on its own or wrapped in prose or a code fence
+    start = response_text.find('{')
+    end = response_text.rfind('}')
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(response_text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data.get("idea"), str) or not isinstance(data.get("song"), str):
+        return None
+    return data["idea"], data["song"]
+
+
+def parse_idea(idea_description: str) -> Tuple[str, str]:
+    """
+    Split the idea generator's response into the trend name and concept.
+
+    Args:
+        idea_description (str): Response containing 'Trend Idea:' and 'Trend Concept:' sections
+
+    Returns:
+        Tuple[str, str]: Trend name and formatted video concept
+    """
+    # Extract the "Trend Name"
+    trend_name_start = idea_description.find(
+        "Trend Idea:") + len("Trend Idea:")
+    trend_name_end = idea_description.find("Trend Concept:")
+    trend_name = idea_description[trend_name_start:trend_name_end].strip().strip(
+        '"')
+
+    # Extract the "Video Idea"
+    video_idea_start = idea_description.find(
+        "Trend Concept:") + len("Trend Concept:")
+    video_idea = idea_description[video_idea_start:].strip()
+    video_idea_lines = video_idea.split('\n')
+    formatted_video_idea = '\n'.join(line.strip() for line in video_idea_lines)
+
+    return trend_name, formatted_video_idea
+
+
+def llama_api(desc: Dict, variant: int = 0) -> Tuple[str, str]:
+    client = llm_client.get()
+
+    # Further variants ask for another take on the same tags (and get their own cache entry)
+    tags = desc["tags"] if not variant else f"{desc['tags']}\n\nVariation {variant + 1}: suggest a different idea."
+
+    if LLAMA_COMBINED_IDEA_SONG:
+        with metrics.span("idea_song"):
+            parsed = parse_combined(client.chat(combined_request(tags)))
+        if parsed is not None:
+            return parsed
+        print("Combined idea/song response was not valid JSON, falling back to separate requests")
+
+    # The idea and song requests are independent, so send them concurrently
+    idea_future = client.submit(idea_request(tags), stage="idea")
+    song_future = client.submit(song_request(tags), stage="song")
+    return idea_future.result(), song_future.result()
+
+
+IDEA_MARKER = "Trend Idea:"
+CONCEPT_MARKER = "Trend Concept:"
+
+
+def _without_partial_marker(text: str, marker: str) -> str:
+    # Hold back a trailing fragment that may turn out to be the start of the next section's marker
+    for size in range(min(len(marker), len(text)), 0, -1):
+        if marker.startswith(text[-size:]):
+            return text[:-size]
+    return text
+
+
+class IdeaStreamParser:
+    """
+    Incrementally splits a streamed idea response into its sections.
+
+    `feed` returns ("partial", ...) events while a section is being written
+    and an ("idea", ...) event as soon as the trend name is complete; `finish`
+    returns the final name and concept, parsed exactly like `parse_idea`.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.idea_done = False
+
+    def feed(self, delta: str) -> List[Tuple[str, Dict]]:
+        self.text += delta
+        events = []
+        idea_start = self.text.find(IDEA_MARKER)
+        concept_start = self.text.find(CONCEPT_MARKER)
+
+        if concept_start == -1:
+            if idea_start != -1:
+                partial = _without_partial_marker(self.text[idea_start + len(IDEA_MARKER):], CONCEPT_MARKER)
+                events.append(("partial", {"field": "idea", "text": partial.strip().strip('"')}))
+            return events
+
+        if not self.idea_done:
+            self.idea_done = True
+            events.append(("idea", {"idea": parse_idea(self.text)[0]}))
+        concept = self.text[concept_start + len(CONCEPT_MARKER):]
+        events.append(("partial", {"field": "concept", "text": concept.strip()}))
+        return events
+
+    def finish(self) -> Tuple[str, str]:
+        return parse_idea(self.text)
+
+
+def stream_llama_api(desc: Dict) -> Iterator[Tuple[str, Dict]]:
+    """
+    Stream the trend idea for the tags while the song description is generated alongside.
+
+    Yields ("partial", {"field", "text"}) while a section is being written,
+    ("idea", {"idea"}) and ("concept", {"concept"}) once a section is complete,
+    and finally ("done", {"idea", "concept", "song_description"}).
+    """
+    client = llm_client.get()
+
+    # The song description is only needed for the media step, so it is not streamed
+    song_future = client.submit(song_request(desc["tags"]), stage="song")
+
+    # Timed by hand, a span cannot stay open across the yields of a generator
+    start = time.perf_counter()
+    parser = IdeaStreamParser()
+    for delta in client.stream(idea_request(desc["tags"])):
+        yield from parser.feed(delta)
+    metrics.observe("idea", time.perf_counter() - start)
+
+    trend_name, formatted_video_idea = parser.finish()
+    if not parser.idea_done:
+        yield "idea", {"idea": trend_name}
+    yield "concept", {"concept": formatted_video_idea}
+    yield "done", {"idea": trend_name, "concept": formatted_video_idea, "song_description": song_future.result()}
@@ -1,12 +1,25 @@
-import os
-from typing import Dict, List
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import subprocess
+import threading
+from typing import Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, CancelledError, as_completed
 
-import moviepy.editor as mp
-import speech_recognition as sr
-from llamaapi import LlamaAPI
+from imageio_ffmpeg import get_ffmpeg_exe
 
+from tiktok_to_text.asr import SAMPLE_RATE, get_backend
+from tiktok_to_text.transcript_store import TranscriptStore, file_content_hash
+from py_ocr.video import OCR_ENABLED, engine_name, ocr_video
+from providers import LazyProvider
+from llm_client import llm_client
+from metrics import metrics, carry_context
 
+
+# Persistent transcripts keyed by video content hash
+transcript_store = LazyProvider(TranscriptStore)
+
+SUMMARY_SYSTEM_PROMPT = "Summarize the sentences in less than 80 words. Give the top tags/keywords for this summarized text (at least one tag for each sentence) along with the summarized text."
+
+
+@metrics.timed("summary")
 def llama_api_summary_tag(desc: str) -> str:
     """
     Generate a summary and tags/keywords for a given text using the LlamaAPI.
@@ -17,27 +30,20 @@ def llama_api_summary_tag(desc: str) -> str:
     Returns:
     str: The summarized text along with tags/keywords.
     """
-    api_key = os.getenv('LLAMA_API_KEY')
-    if not api_key:
-        raise ValueError("LLAMA_API_KEY environment variable is required")
-    
-    llama = LlamaAPI(api_key)
-
     # API Request JSON structure
     api_request_summarize_tags = {
         "model": "llama3-8b",
         "messages": [
             {
                 "role": "system",
-                "content": "Summarize the sentences in less than 80 words. Give the top tags/keywords for this summarized text (at least one tag for each sentence) along with the summarized text.",
+                "content": SUMMARY_SYSTEM_PROMPT,
             },
             {"role": "user", "content": desc},
         ],
     }
 
-    # Make the API request and handle the response
-    response_summary_tag = llama.run(api_request_summarize_tags)
-    return response_summary_tag.json()["choices"][0]["message"]["content"]
+    # Make the API request through the shared client and handle the response
+    return llm_client.get().chat(api_request_summarize_tags)
 
 
 def text_cleaning(input_text: str):
@@ -70,61 +76,148 @@ def text_cleaning(input_text: str):
     return summary_text, tags_text
 
 
-def transcribe_audio_from_video(video_file):
+@metrics.timed("extract")
+def extract_audio_pcm(video_file: str) -> bytes:
+    """
+    Decode the audio track of a video straight to 16 kHz mono PCM in memory.
+
+    ffmpeg streams the samples through a pipe, so no temporary audio file is
+    written and the video frames are never decoded.
+
+    Parameters:
+    video_file (str): The path to the video file.
+
+    Returns:
+    bytes: Raw little-endian 16-bit PCM samples.
     """
-    Transcribe audio from a given video file using Google Speech Recognition.
+    command = [
+        get_ffmpeg_exe(), "-nostdin", "-v", "error",
+        "-i", video_file,
+        "-vn",  # Skip the video stream
+        "-ac", "1",  # Downmix to mono
+        "-ar", str(SAMPLE_RATE),  # Resample for speech recognition
+        "-f", "s16le", "-acodec", "pcm_s16le",
+        "pipe:1",
+    ]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"ffmpeg failed to extract audio from {video_file}: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout
+
+
+def transcribe_audio_from_video(video_file, backend=None):
+    """
+    Transcribe audio from a given video file using the configured speech recognition backend.
 
     Parameters:
     video_file (str): The path to the video file.
+    backend (ASRBackend): Backend to use instead of the one selected by ASR_BACKEND.
 
     Returns:
     str: The transcribed text from the video.
     """
-    # Load the video file
-    video = mp.VideoFileClip(video_file)
+    backend = backend or get_backend()
+
+    # Reuse the stored transcript if this exact video was transcribed before
+    content_hash = file_content_hash(video_file)
+    text = transcript_store.get().get(content_hash, backend.name)
+    if text is not None:
+        return text
 
-    # Extract audio from the video
-    audio = video.audio
-    name = video_file.split('.')[0].split('/')[-1]
-    audio.write_audiofile(f"temp_audio{name}.wav")
+    # Extract the audio from the video as in-memory PCM
+    pcm = extract_audio_pcm(video_file)
 
-    # Initialize the recognizer
-    recognizer = sr.Recognizer()
+    # Transcribe the audio
+    with metrics.span("asr"):
+        text = backend.transcribe(pcm, SAMPLE_RATE)
 
-    # Load and transcribe the audio file
-    audio_file = sr.AudioFile(f"temp_audio{name}.wav")
-    with audio_file as source:
-        audio_data = recognizer.record(source)
-        text = recognizer.recognize_google(
-            audio_data, language='en')
+    transcript_store.get().put(content_hash, backend.name, text)
 
     return text
 
 
-def t4_api(video_files: List[str]) -> Dict:
+def read_on_screen_text(video_file):
+    """
+    Read the captions and other on-screen text of a video.
+
+    Parameters:
+    video_file (str): The path to the video file.
+
+    Returns:
+    str: The deduplicated on-screen text, one line per caption.
+    """
+    # OCR results are stored next to the transcripts, under the OCR settings as engine name
+    content_hash = file_content_hash(video_file)
+    text = transcript_store.get().get(content_hash, engine_name())
+    if text is not None:
+        return text
+
+    with metrics.span("ocr"):
+        result = ocr_video(video_file)
+    print(f"OCR for {video_file}: read {result['read']} of {result['sampled']} sampled frames "
+          f"in {result['seconds']:.1f}s")
+    transcript_store.get().put(content_hash, engine_name(), result["text"])
+
+    return result["text"]
+
+
+def video_text(video_file: str, check_cancelled: Optional[Callable[[], None]] = None) -> str:
+    """
+    Transcribe a video and add its on-screen text when OCR is enabled.
+
+    Parameters:
+    video_file (str): The path to the video file.
+    check_cancelled (Optional[Callable[[], None]]): Called between the steps; raises to stop early.
+
+    Returns:
+    str: The transcription, followed by the on-screen text if there is any.
+    """
+    # Transcribe audio from the video
+    transcription = transcribe_audio_from_video(video_file)
+    print(f"Transcription for {video_file}:\n{transcription}\n")
+
+    # Add the on-screen captions, which often carry what is not said out loud
+    if OCR_ENABLED:
+        if check_cancelled is not None:
+            check_cancelled()
+        try:
+            on_screen_text = read_on_screen_text(video_file)
+        except Exception as e:
+            print(f"Exception occurred while reading on-screen text of {video_file}: {e}")
+            on_screen_text = ""
+        if on_screen_text:
+            transcription = f"{transcription}\n\nOn-screen text:\n{on_screen_text}"
+
+    return transcription
+
+
+def t4_api(video_files: List[str], cancel_event: Optional[threading.Event] = None) -> Dict:
     """
     Main function to process multiple video files, transcribe their audio,
     and summarize the transcriptions with tags/keywords.
 
     Parameters:
     video_files (List[str]): A list of paths to video files.
+    cancel_event (Optional[threading.Event]): When set, remaining work is skipped and CancelledError is raised.
 
     Returns:
     Dict: A dictionary containing the summarized text and tags.
     """
-    def process_video(video_file):
-        # Transcribe audio from the video
-        transcription = transcribe_audio_from_video(video_file)
-        print(f"Transcription for {video_file}:\n{transcription}\n")
+    def check_cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            raise CancelledError()
 
-        return transcription
+    def process_video(video_file):
+        check_cancelled()
+        return video_text(video_file, check_cancelled)
 
     all_transcriptions = []
 
     # Use ThreadPoolExecutor to parallelize the processing of video files
     with ThreadPoolExecutor() as executor:
         future_to_video = {executor.submit(
-            process_video, video_file): video_file for video_file in video_files}
+            carry_context(process_video), video_file): video_file for video_file in video_files}
         for future in as_completed(future_to_video):
             video_file = future_to_video[future]
             try:
@@ -133,6 +226,8 @@ def t4_api(video_files: List[str]) -> Dict:
             except Exception as e:
                 print(f"Exception occurred while processing {video_file}: {e}")
 
+    check_cancelled()
+
     # Combine all transcriptions into one text
     all_transcriptions_text = "\n\n".join(all_transcriptions)
 
@@ -140,12 +235,6 @@ def t4_api(video_files: List[str]) -> Dict:
     summary_tag = llama_api_summary_tag(all_transcriptions_text)
     summary_text, tags_text = text_cleaning(summary_tag)
 
-    # Clean up temporary audio file
-    name = [video_file.split('.')[0].split('/')[-1]
-            for video_file in video_files]
-    for i in name:
-        os.remove(f"temp_audio{i}.wav")
-
     return {
         "summary": summary_text,
         "tags": tags_text,
@@ -0,0 +1,192 @@
+import abc
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from scheduler import resource_scheduler
+from utils import process_pool
+
+
+# Audio format handed to the backends: 16 kHz mono 16-bit PCM
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+
+# Speech recognition backend used by transcribe_audio_from_video ("google" or "whisper")
+ASR_BACKEND = os.getenv('ASR_BACKEND', 'google')
+
+# Number of processes decoding chunks for the local backend
+ASR_WORKERS = int(os.getenv('ASR_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+
+# Silence splitting: longest chunk handed to the model, shortest pause that may split,
+# and the level (relative to the loudest frame) below which a frame counts as silent
+ASR_MAX_CHUNK_SECONDS = float(os.getenv('ASR_MAX_CHUNK_SECONDS', '25'))
+ASR_MIN_SILENCE_SECONDS = 0.3
+ASR_SILENCE_DB = -35.0
+FRAME_SECONDS = 0.03
+
+
+def pcm_to_float(pcm: bytes) -> np.ndarray:
+    """Convert 16-bit PCM bytes to float32 samples in [-1, 1]."""
+    return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def split_on_silence(samples: np.ndarray, sample_rate: int = SAMPLE_RATE,
+                     max_chunk_seconds: float = ASR_MAX_CHUNK_SECONDS) -> List[Tuple[int, int]]:
+    """
+    Split audio into chunks no longer than `max_chunk_seconds`, cutting in pauses.
+
+    Frames whose RMS level is `ASR_SILENCE_DB` below the loudest frame are
+    silent. Runs of silence at least `ASR_MIN_SILENCE_SECONDS` long are cut
+    points; chunks are grown greedily up to the length limit and hard-split
+    only when speech runs longer than the limit without a pause.
+
+    Parameters:
+    samples (np.ndarray): Mono float32 samples.
+    sample_rate (int): Sampling rate of the samples.
+    max_chunk_seconds (float): Longest chunk in seconds.
+
+    Returns:
+    List[Tuple[int, int]]: Start and end sample indices of each chunk, in order.
+    """
+    frame = max(1, int(FRAME_SECONDS * sample_rate))
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return [(0, len(samples))] if len(samples) else []
+
+    frames = samples[:n_frames * frame].reshape(n_frames, frame)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1)) + 1e-10
+    level_db = 20 * np.log10(rms / rms.max())
+    silent = level_db < ASR_SILENCE_DB
+
+    # Cut in the middle of every long enough run of silent frames
+    min_silence_frames = max(1, int(ASR_MIN_SILENCE_SECONDS / FRAME_SECONDS))
+    cuts = []
+    run_start = None
+    for i, is_silent in enumerate(np.append(silent, False)):
+        if is_silent and run_start is None:
+            run_start = i
+        elif not is_silent and run_start is not None:
+            if i - run_start >= min_silence_frames:
+                cuts.append(((run_start + i) // 2) * frame)
+            run_start = None
+
+    # Grow chunks greedily between cut points, hard-splitting over-long speech
+    max_len = int(max_chunk_seconds * sample_rate)
+    chunks = []
+    start = 0
+    last_cut = None
+    for cut in cuts + [len(samples)]:
+        while cut - start > max_len:
+            end = last_cut if last_cut is not None and last_cut > start else start + max_len
+            chunks.append((start, end))
+            start = end
+            last_cut = None
+        last_cut = cut
+    if start < len(samples):
+        chunks.append((start, len(samples)))
+    return chunks
+
+
+class ASRBackend(abc.ABC):
+    """Interface of a speech recognition engine working on 16 kHz mono PCM."""
+
+    # Name recorded with stored transcripts so engines never share cache entries
+    name = "base"
+
+    @abc.abstractmethod
+    def transcribe(self, pcm: bytes, sample_rate: int = SAMPLE_RATE) -> str:
+        """
+        Transcribe raw audio.
+
+        Parameters:
+        pcm (bytes): Little-endian 16-bit mono PCM.
+        sample_rate (int): Sampling rate of the audio.
+
+        Returns:
+        str: The transcribed text.
+        """
+
+
+class GoogleBackend(ASRBackend):
+    """Google Speech Recognition through the `speech_recognition` package (needs network access)."""
+
+    name = "google"
+
+    def transcribe(self, pcm: bytes, sample_rate: int = SAMPLE_RATE) -> str:
+        import speech_recognition as sr
+
+        recognizer = sr.Recognizer()
+        audio_data = sr.AudioData(pcm, sample_rate, SAMPLE_WIDTH)
+        return recognizer.recognize_google(audio_data, language='en')
+
+
+def _decode_chunk(samples: np.ndarray) -> str:
+    # Runs in a worker process; the registry loads Whisper once per process
+    import torch
+    from model_registry import registry, WHISPER
+
+    torch.set_num_threads(1)
+    asr = registry.get(WHISPER)
+    return asr({"raw": samples, "sampling_rate": SAMPLE_RATE})["text"].strip()
+
+
+class WhisperBackend(ASRBackend):
+    """
+    Offline Whisper recognition on the CPU.
+
+    Audio is split on silence and the chunks are decoded in parallel on a
+    process pool, then stitched back together in order.
+    """
+
+    name = "whisper"
+
+    def __init__(self, workers: int = ASR_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = process_pool(self.workers)
+        return self._executor
+
+    def transcribe(self, pcm: bytes, sample_rate: int = SAMPLE_RATE) -> str:
+        samples = pcm_to_float(pcm)
+        chunks = [samples[start:end] for start, end in split_on_silence(samples, sample_rate)]
+        if not chunks:
+            return ""
+
+        # Each decoding process uses one core, so reserve as many as will be busy
+        with resource_scheduler.reserve("transcribe", threads=min(self.workers, len(chunks))):
+            # A single chunk is cheaper to decode without the process hop
+            if len(chunks) == 1 and self.workers <= 1:
+                texts = [_decode_chunk(chunks[0])]
+            else:
+                texts = list(self._pool().map(_decode_chunk, chunks))
+        return " ".join(text for text in texts if text)
+
+
+BACKENDS = {
+    GoogleBackend.name: GoogleBackend,
+    WhisperBackend.name: WhisperBackend,
+}
+
+_backends = {}
+
+
+def get_backend(name: str = ASR_BACKEND) -> ASRBackend:
+    """
+    Return the shared instance of a speech recognition backend.
+
+    Parameters:
+    name (str): Backend name, one of `BACKENDS`.
+
+    Returns:
+    ASRBackend: The backend instance.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown ASR backend '{name}', expected one of {sorted(BACKENDS)}")
+    if name not in _backends:
+        _backends[name] = BACKENDS[name]()
+    return _backends[name]
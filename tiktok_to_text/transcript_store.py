@@ -0,0 +1,131 @@
+import argparse
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from utils import sqlite_connection
+
+
+# SQLite file holding transcripts keyed by video content hash
+TRANSCRIPT_DB = os.getenv('TRANSCRIPT_DB', 'transcripts.sqlite3')
+
+_hash_memo: Dict[Tuple[str, int, int], str] = {}
+_hash_lock = threading.Lock()
+
+
+def file_content_hash(path: str) -> str:
+    """
+    Compute the SHA-256 digest of a file's content.
+
+    Digests are memoised per path, size and modification time so unchanged
+    videos are only read once per process.
+
+    Parameters:
+    path (str): Path of the file to hash.
+
+    Returns:
+    str: Hex digest of the file content.
+    """
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _hash_lock:
+        if memo_key in _hash_memo:
+            return _hash_memo[memo_key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+
+    with _hash_lock:
+        _hash_memo[memo_key] = digest.hexdigest()
+    return digest.hexdigest()
+
+
+class TranscriptStore:
+    """Persistent transcript cache keyed by video content hash and ASR engine."""
+
+    def __init__(self, db_path: str = TRANSCRIPT_DB):
+        self.db_path = db_path
+        with sqlite_connection(self.db_path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS transcripts ("
+                " content_hash TEXT NOT NULL,"
+                " engine TEXT NOT NULL,"
+                " text TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (content_hash, engine))")
+
+    def get(self, content_hash: str, engine: str) -> Optional[str]:
+        """
+        Look up a stored transcript.
+
+        Parameters:
+        content_hash (str): Content hash of the video.
+        engine (str): Name of the speech recognition engine.
+
+        Returns:
+        Optional[str]: The transcript, or None if the video has not been transcribed.
+        """
+        with sqlite_connection(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT text FROM transcripts WHERE content_hash = ? AND engine = ?",
+                (content_hash, engine)).fetchone()
+        return row[0] if row else None
+
+    def put(self, content_hash: str, engine: str, text: str) -> None:
+        """
+        Store a transcript, replacing any previous one for the same video and engine.
+
+        Parameters:
+        content_hash (str): Content hash of the video.
+        engine (str): Name of the speech recognition engine.
+        text (str): The transcript.
+
+        Returns:
+        None
+        """
+        with sqlite_connection(self.db_path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO transcripts (content_hash, engine, text, created_at) VALUES (?, ?, ?, ?)",
+                (content_hash, engine, text, time.time()))
+
+
+def prewarm(video_dir: str) -> None:
+    """
+    Transcribe every downloaded video under `video_dir` so interactive requests hit the store.
+
+    Parameters:
+    video_dir (str): Root directory holding one sub-directory of videos per tag.
+
+    Returns:
+    None
+    """
+    from tiktok_to_text.api import transcribe_audio_from_video
+    from tiktok_videos.previews import PREVIEW_DIR
+
+    video_files = []
+    for dirpath, dirnames, filenames in os.walk(video_dir):
+        # Skip the preview renditions, which carry the same audio as their originals
+        dirnames[:] = [d for d in dirnames if d != PREVIEW_DIR]
+        video_files.extend(os.path.join(dirpath, f) for f in sorted(filenames) if f.endswith('.mp4'))
+
+    for video_file in video_files:
+        try:
+            transcribe_audio_from_video(video_file)
+            print(f"Transcribed {video_file}")
+        except Exception as e:
+            print(f"Exception occurred while processing {video_file}: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcript store maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    prewarm_parser = subparsers.add_parser("prewarm", help="Transcribe every downloaded tag folder")
+    prewarm_parser.add_argument("--video-dir", default=os.path.join('static', 'video'))
+    args = parser.parse_args()
+
+    if args.command == "prewarm":
+        prewarm(args.video_dir)
@@ -1,44 +1,247 @@
+import fcntl
+import hashlib
+import json
 import os
-import gdown
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 
-# Get service account file path from environment variable
-SERVICE_ACCOUNT_FILE = os.getenv('GOOGLE_SERVICE_ACCOUNT_FILE', 'service_account.json')
-SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
+import requests
 
-# Check if the service account file exists
-if not os.path.exists(SERVICE_ACCOUNT_FILE):
-    raise FileNotFoundError(
-        f"Google service account file not found: {SERVICE_ACCOUNT_FILE}. "
-        "Please set the GOOGLE_SERVICE_ACCOUNT_FILE environment variable or "
-        "place the service account JSON file in the project root."
-    )
+from metrics import metrics
+from providers import DriveCredentialsError, drive_session
 
-credentials = service_account.Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-drive_service = build('drive', 'v3', credentials=credentials)
+# Drive REST endpoint (point it at a local stand-in server for testing)
+DRIVE_API_URL = os.getenv('DRIVE_API_URL', 'https://www.googleapis.com/drive/v3')
+
+# Parallel downloads, videos fetched per tag, and how long folder listings are cached
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', '3'))
+MAX_VIDEOS_PER_TAG = 3
+DRIVE_LISTING_TTL = int(os.getenv('DRIVE_LISTING_TTL', '3600'))
+DRIVE_LISTING_CACHE = os.getenv('DRIVE_LISTING_CACHE', 'drive_listing_cache.json')
+
+CHUNK_SIZE = 1024 * 1024
+
+FOLDERS = {
+    "#AI - #MachineLearning - #TechInnovation": "1JYv-bd4bWg2LucmnS0631wqJCABAwA0g",
+    "#Foodie - #RecipeOfTheDay - #CookingHacks": "1oGdZ8xWMq3bH74MhFL8PmDKOv5IK2p0I",
+    "#MakeupTutorial - #BeautyHacks - #SkincareRoutine": "1bn2d-6tjDi9cb03uRwFG019B4CKjnyT7",
+    "#OOTD - #FashionInspo - #StyleTips": "1axVn0xBJ41grkByuCdEOGNFJ-YjVIJST",
+    "#TravelVlog - #HiddenGems - #TravelTips": "1Y1zbBzSWB_sbQp7P7Y4yAnX3UzWQtLfl"
+}
+
+# Tags offered on the home page, each one served from one of the folders above
+TRENDING_TAGS = ["MakeupTutorial", "BeautyHacks", "SkincareRoutine",  "TravelVlog", "HiddenGems",
+                 "TravelTips", "Foodie", "RecipeOfTheDay", "CookingHacks", "OOTD", "FashionInspo",
+                 "StyleTips", "AI", "MachineLearning", "TechInnovation"]
+
+
+class DownloadError(Exception):
+    """Raised when a downloaded file does not match its Drive metadata."""
+
+
+class ListingCache:
+    """JSON file caching Drive folder listings for `ttl` seconds."""
+
+    def __init__(self, path: str, ttl: int):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def get(self, folder_id: str, allow_stale: bool = False) -> Optional[List[Dict]]:
+        with self._lock:
+            entry = self._load().get(folder_id)
+        if entry is None:
+            return None
+        if not allow_stale and time.time() - entry["fetched_at"] > self.ttl:
+            return None
+        return entry["files"]
+
+    def put(self, folder_id: str, files: List[Dict]) -> None:
+        with self._lock:
+            listings = self._load()
+            listings[folder_id] = {"fetched_at": time.time(), "files": files}
+            # Other worker processes write the same cache, so each writer uses its own temporary file
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump(listings, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                # The listing was fetched; only the next lookup misses the cache
+                print(f"Exception occurred while caching the listing of {folder_id}: {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+
+class DriveDownloader:
+    """
+    Lists Drive folders and downloads files in parallel.
+
+    Files are written to `<path>.part` and atomically renamed once their size
+    and MD5 match the Drive metadata; an interrupted `.part` file is resumed
+    with an HTTP range request. Concurrent downloads of the same file, from
+    any thread or worker process, are serialised on `<path>.lock`.
+    """
+
+    def __init__(self, session: Optional[requests.Session] = None, base_url: str = DRIVE_API_URL,
+                 workers: int = DOWNLOAD_WORKERS, listing_cache: Optional[ListingCache] = None):
+        self._session = session
+        self.base_url = base_url.rstrip('/')
+        self.workers = workers
+        self.listing_cache = listing_cache or ListingCache(DRIVE_LISTING_CACHE, DRIVE_LISTING_TTL)
+
+    @property
+    def session(self) -> requests.Session:
+        # Without an explicit session, authenticate against Drive on first use
+        return self._session if self._session is not None else drive_session.get()
+
+    def list_folder(self, folder_id: str) -> List[Dict]:
+        """
+        Return the metadata (id, name, size, md5Checksum) of the videos in a folder.
+
+        A listing younger than the cache TTL is served from the cache; if Drive
+        cannot be reached, a stale listing is used rather than failing.
+        """
+        cached = self.listing_cache.get(folder_id)
+        if cached is not None:
+            return cached
+
+        query = f"'{folder_id}' in parents and mimeType='video/mp4'"
+        files = []
+        page_token = None
+        try:
+            while True:
+                params = {"q": query, "fields": "nextPageToken, files(id, name, size, md5Checksum)",
+                          "orderBy": "name"}
+                if page_token:
+                    params["pageToken"] = page_token
+                response = self.session.get(f"{self.base_url}/files", params=params, timeout=30)
+                response.raise_for_status()
+                results = response.json()
+                files.extend(results.get('files', []))
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+        except (requests.RequestException, DriveCredentialsError):
+            stale = self.listing_cache.get(folder_id, allow_stale=True)
+            if stale is None:
+                raise
+            return stale
+
+        self.listing_cache.put(folder_id, files)
+        return files
+
+    def download(self, item: Dict, output_path: str) -> str:
+        """
+        Download one file unless a complete copy already exists.
+
+        Args:
+            item (Dict): Drive metadata with at least an 'id', optionally 'size' and 'md5Checksum'
+            output_path (str): Final path of the file
+
+        Returns:
+            str: `output_path`
+
+        Raises:
+            DownloadError: If the downloaded file does not match the metadata
+        """
+        expected_size = int(item['size']) if item.get('size') else None
+        if self._complete(output_path, expected_size):
+            return output_path
+
+        # Another request or worker may be downloading the same file into the same `.part` file
+        with open(output_path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if self._complete(output_path, expected_size):
+                return output_path
+            return self._download_locked(item, output_path, expected_size)
+
+    @staticmethod
+    def _complete(path: str, expected_size: Optional[int]) -> bool:
+        return os.path.exists(path) and (expected_size is None or os.path.getsize(path) == expected_size)
+
+    def _download_locked(self, item: Dict, output_path: str, expected_size: Optional[int]) -> str:
+        part_path = output_path + '.part'
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if expected_size is not None and offset > expected_size:
+            offset = 0
+
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        url = f"{self.base_url}/files/{item['id']}"
+        with self.session.get(url, params={"alt": "media"}, headers=headers, stream=True, timeout=60) as response:
+            if response.status_code == 416:
+                # The partial file already holds every byte
+                pass
+            else:
+                response.raise_for_status()
+                # A server that ignores the range restarts the file from scratch
+                mode = 'ab' if offset and response.status_code == 206 else 'wb'
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+
+        self._verify(item, part_path)
+        os.replace(part_path, output_path)
+        return output_path
+
+    def _verify(self, item: Dict, path: str) -> None:
+        size = os.path.getsize(path)
+        if item.get('size') and size != int(item['size']):
+            # Keep a short file so the next attempt resumes it, drop an over-long one
+            if size > int(item['size']):
+                os.remove(path)
+            raise DownloadError(f"{item['id']}: expected {item['size']} bytes, got {size}")
+
+        if item.get('md5Checksum'):
+            digest = hashlib.md5()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(block)
+            if digest.hexdigest() != item['md5Checksum']:
+                os.remove(path)
+                raise DownloadError(f"{item['id']}: checksum mismatch")
+
+    def download_all(self, items: List[Dict], output_dir: str) -> List[str]:
+        """
+        Download files in parallel as `video_<n>.mp4` in `output_dir`.
+
+        Returns:
+            List[str]: Paths of the files that are complete, in listing order
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        targets = [(item, os.path.join(output_dir, f'video_{i + 1}.mp4')) for i, item in enumerate(items)]
+
+        video_files = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self.download, item, path) for item, path in targets]
+            for (item, path), future in zip(targets, futures):
+                try:
+                    video_files.append(future.result())
+                except Exception as e:
+                    print(f"Exception occurred while downloading {item['id']}: {e}")
+        return video_files
+
+
+downloader = DriveDownloader()
 
 
 def fetch_video_ids_from_folder(folder_id):
-    query = f"'{folder_id}' in parents and mimeType='video/mp4'"
-    results = drive_service.files().list(q=query, fields="files(id, name)").execute()
-    items = results.get('files', [])
-    video_ids = [item['id'] for item in items]
-    return video_ids
+    return [item['id'] for item in downloader.list_folder(folder_id)]
 
 
+@metrics.timed("download")
 def download_videos(tag, output_dir):
-    folders = {
-        "#AI - #MachineLearning - #TechInnovation": "1JYv-bd4bWg2LucmnS0631wqJCABAwA0g",
-        "#Foodie - #RecipeOfTheDay - #CookingHacks": "1oGdZ8xWMq3bH74MhFL8PmDKOv5IK2p0I",
-        "#MakeupTutorial - #BeautyHacks - #SkincareRoutine": "1bn2d-6tjDi9cb03uRwFG019B4CKjnyT7",
-        "#OOTD - #FashionInspo - #StyleTips": "1axVn0xBJ41grkByuCdEOGNFJ-YjVIJST",
-        "#TravelVlog - #HiddenGems - #TravelTips": "1Y1zbBzSWB_sbQp7P7Y4yAnX3UzWQtLfl"
-    }
-
     folder_id = None
-    for folder_name, fid in folders.items():
+    for folder_name, fid in FOLDERS.items():
         if f"#{tag}" in folder_name.split(" - "):
             folder_id = fid
             break
@@ -46,22 +249,13 @@ def download_videos(tag, output_dir):
     if not folder_id:
         return []
 
-    video_ids = fetch_video_ids_from_folder(folder_id)
-
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-        video_files = []
-        for i, video_id in enumerate(video_ids):
-            if i <= 2:
-                video_url = f"https://drive.google.com/uc?id={video_id}"
-                output_path = os.path.join(output_dir, f'video_{i + 1}.mp4')
-                gdown.download(video_url, output_path, quiet=False)
-                video_files.append(output_path)
-            else:
-                break
-    else:
-        video_files = [os.path.join(output_dir, f) for f in os.listdir(
-            output_dir) if f.endswith('.mp4')]
+    try:
+        items = downloader.list_folder(folder_id)[:MAX_VIDEOS_PER_TAG]
+    except (requests.RequestException, DriveCredentialsError) as e:
+        # Drive is unreachable or not configured: fall back to whatever complete videos are already on disk
+        print(f"Exception occurred while listing {folder_id}: {e}")
+        if not os.path.isdir(output_dir):
+            return []
+        return sorted(os.path.join(output_dir, f) for f in os.listdir(output_dir) if f.endswith('.mp4'))
 
-    return video_files
+    return downloader.download_all(items, output_dir)
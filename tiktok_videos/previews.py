@@ -0,0 +1,152 @@
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from imageio_ffmpeg import get_ffmpeg_exe
+
+from metrics import metrics
+from tiktok_to_text.transcript_store import file_content_hash
+
+# Make small previews and poster frames for the results page after downloading
+PREVIEWS_ENABLED = os.getenv('PREVIEWS_ENABLED', 'true').lower() == 'true'
+
+# Preview width in pixels (the player is 320 wide), bitrates, and where the poster frame is taken
+PREVIEW_WIDTH = int(os.getenv('PREVIEW_WIDTH', '360'))
+PREVIEW_VIDEO_BITRATE = os.getenv('PREVIEW_VIDEO_BITRATE', '350k')
+PREVIEW_AUDIO_BITRATE = os.getenv('PREVIEW_AUDIO_BITRATE', '64k')
+POSTER_SECOND = float(os.getenv('POSTER_SECOND', '0.5'))
+
+# Videos encoded at once
+PREVIEW_WORKERS = int(os.getenv('PREVIEW_WORKERS', '3'))
+
+# Sub-directory of a tag's video directory holding the renditions
+PREVIEW_DIR = 'previews'
+
+
+def _run_ffmpeg(args: List[str], output_path: str) -> None:
+    # Encode to a temporary file so a half-written rendition is never served
+    tmp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp{os.path.splitext(output_path)[1]}"
+    command = [get_ffmpeg_exe(), "-nostdin", "-v", "error", "-y", *args, tmp_path]
+    try:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0 or not os.path.exists(tmp_path) or os.path.getsize(tmp_path) == 0:
+            raise RuntimeError(f"ffmpeg failed to write {output_path}: {result.stderr.decode(errors='replace').strip()}")
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def make_preview(video_file: str, output_path: str) -> None:
+    """
+    Encode a low-resolution, low-bitrate copy of a video for the results page.
+
+    The moov atom is moved to the front so playback starts before the whole
+    preview has been fetched.
+
+    Parameters:
+    video_file (str): Path of the original video.
+    output_path (str): Path of the .mp4 preview.
+
+    Returns:
+    None
+    """
+    _run_ffmpeg([
+        "-i", video_file,
+        "-vf", f"scale='min({PREVIEW_WIDTH},iw)':-2",  # Never upscale; keep the height even for H.264
+        "-c:v", "libx264", "-preset", "veryfast", "-b:v", PREVIEW_VIDEO_BITRATE,
+        "-maxrate", PREVIEW_VIDEO_BITRATE, "-bufsize", PREVIEW_VIDEO_BITRATE,
+        "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", PREVIEW_AUDIO_BITRATE, "-ac", "1",
+        "-movflags", "+faststart",
+    ], output_path)
+
+
+def make_poster(video_file: str, output_path: str) -> None:
+    """
+    Extract one frame of a video as a JPEG poster.
+
+    Parameters:
+    video_file (str): Path of the original video.
+    output_path (str): Path of the .jpg poster.
+
+    Returns:
+    None
+    """
+    args = ["-i", video_file, "-frames:v", "1", "-vf", f"scale='min({PREVIEW_WIDTH},iw)':-2", "-q:v", "4"]
+    try:
+        _run_ffmpeg(["-ss", str(POSTER_SECOND), *args], output_path)
+    except RuntimeError:
+        # Clips shorter than POSTER_SECOND have no frame there, use the first one
+        _run_ffmpeg(args, output_path)
+
+
+def make_renditions(video_file: str, digest: str, preview_dir: str) -> Dict[str, Optional[str]]:
+    """
+    Return the preview and poster of a video, creating whichever is missing.
+
+    Parameters:
+    video_file (str): Path of the original video.
+    digest (str): Content hash of the video, naming its renditions.
+    preview_dir (str): Directory holding the renditions.
+
+    Returns:
+    Dict[str, Optional[str]]: Paths of the "video", its "preview" and its "poster";
+        a rendition that could not be made is None, as is a preview no smaller
+        than the original.
+    """
+    renditions = {"video": video_file, "preview": None, "poster": None}
+    for kind, ext, make in (("preview", "mp4", make_preview), ("poster", "jpg", make_poster)):
+        path = os.path.join(preview_dir, f"{digest}.{ext}")
+        try:
+            if not os.path.exists(path):
+                make(video_file, path)
+            renditions[kind] = path
+        except Exception as e:
+            print(f"Exception occurred while making the {kind} of {video_file}: {e}")
+
+    # Already small originals are served as they are
+    if renditions["preview"] and os.path.getsize(renditions["preview"]) >= os.path.getsize(video_file):
+        renditions["preview"] = None
+    return renditions
+
+
+@metrics.timed("preview")
+def make_previews(video_files: List[str], output_dir: str) -> List[Dict[str, Optional[str]]]:
+    """
+    Make previews and posters for downloaded videos in parallel.
+
+    Renditions are cached in `<output_dir>/previews` by the hash of the
+    original, so they are only encoded once per distinct video; renditions
+    of videos that are no longer in the folder are removed.
+
+    Parameters:
+    video_files (List[str]): Paths of the downloaded videos.
+    output_dir (str): The tag's video directory.
+
+    Returns:
+    List[Dict[str, Optional[str]]]: The renditions of each video, in order
+        (only the original when previews are disabled).
+    """
+    if not PREVIEWS_ENABLED:
+        return [{"video": video_file, "preview": None, "poster": None} for video_file in video_files]
+
+    preview_dir = os.path.join(output_dir, PREVIEW_DIR)
+    os.makedirs(preview_dir, exist_ok=True)
+
+    # Renditions are named by content hash, memoised per file so unchanged videos are not re-read
+    digests = [file_content_hash(video_file) for video_file in video_files]
+    with ThreadPoolExecutor(max_workers=PREVIEW_WORKERS) as executor:
+        renditions = list(executor.map(make_renditions, video_files, digests, [preview_dir] * len(video_files)))
+
+    # Drop the renditions of replaced videos
+    for filename in os.listdir(preview_dir):
+        if filename.split('.')[0] not in digests:
+            try:
+                os.remove(os.path.join(preview_dir, filename))
+            except FileNotFoundError:
+                pass
+
+    return renditions
@@ -0,0 +1,282 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from init import WHISPER_MODEL
+from providers import LazyProvider
+from summariser.llama_api import llama_api, idea_request, parse_idea, song_request
+from tiktok_to_text.api import SUMMARY_SYSTEM_PROMPT, llama_api_summary_tag, text_cleaning, video_text
+from tiktok_to_text.asr import ASR_BACKEND
+from py_ocr.video import OCR_ENABLED, engine_name as ocr_engine_name
+from tiktok_videos.download import TRENDING_TAGS, download_videos
+from utils import sqlite_connection
+
+
+# SQLite file holding the precomputed transcripts, summary and ideas of every trending tag
+TREND_INDEX_DB = os.getenv('TREND_INDEX_DB', 'trend_index.sqlite3')
+
+# Ideas generated per tag, age after which an entry is refreshed, and whether the web process refreshes
+# stale entries (missing entries are only built by `python -m trend_index build`)
+TREND_INDEX_IDEAS = int(os.getenv('TREND_INDEX_IDEAS', '3'))
+TREND_INDEX_MAX_AGE = int(os.getenv('TREND_INDEX_MAX_AGE', '86400'))
+TREND_INDEX_REFRESH = os.getenv('TREND_INDEX_REFRESH', 'false').lower() == 'true'
+
+# Bump when the layout of the stored entries changes
+INDEX_SCHEMA = 1
+
+# Entry states: current and young enough, current but old, or missing / built with another version
+FRESH, STALE, MISSING = "fresh", "stale", "missing"
+
+
+def index_version() -> str:
+    """
+    Stamp identifying everything an entry was built with.
+
+    Entries built with another ASR engine, Whisper model, OCR setting or prompt set get a
+    different stamp and are never served.
+
+    Returns:
+    str: Schema number followed by a digest of the engine and prompts.
+    """
+    engine = f"whisper:{WHISPER_MODEL}" if ASR_BACKEND == "whisper" else ASR_BACKEND
+    ocr_engine = ocr_engine_name() if OCR_ENABLED else None
+    payload = json.dumps([engine, ocr_engine, SUMMARY_SYSTEM_PROMPT, idea_request(""), song_request("")],
+                         sort_keys=True)
+    return f"{INDEX_SCHEMA}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:12]}"
+
+
+class TrendIndex:
+    """Persistent per-tag index of transcripts, summary, tags and generated ideas."""
+
+    def __init__(self, db_path: str = TREND_INDEX_DB):
+        self.db_path = db_path
+        with sqlite_connection(self.db_path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS trend_index ("
+                " tag TEXT PRIMARY KEY,"
+                " version TEXT NOT NULL,"
+                " built_at REAL NOT NULL,"
+                " data TEXT NOT NULL)")
+
+    def get(self, tag: str) -> Optional[Dict]:
+        """
+        Look up the entry of a tag.
+
+        Parameters:
+        tag (str): Trending tag without the leading '#'.
+
+        Returns:
+        Optional[Dict]: The stored data with its "version" and "built_at", or None if the tag is not indexed.
+        """
+        with sqlite_connection(self.db_path) as conn:
+            row = conn.execute("SELECT version, built_at, data FROM trend_index WHERE tag = ?", (tag,)).fetchone()
+        if row is None:
+            return None
+        entry = json.loads(row[2])
+        entry["version"], entry["built_at"] = row[0], row[1]
+        return entry
+
+    def put(self, tag: str, version: str, data: Dict) -> None:
+        """
+        Store the entry of a tag, replacing the previous one.
+
+        Parameters:
+        tag (str): Trending tag without the leading '#'.
+        version (str): Stamp returned by `index_version`.
+        data (Dict): Videos, transcripts, summary, tags and ideas of the tag.
+
+        Returns:
+        None
+        """
+        with sqlite_connection(self.db_path) as conn:
+            conn.execute("INSERT OR REPLACE INTO trend_index (tag, version, built_at, data) VALUES (?, ?, ?, ?)",
+                         (tag, version, time.time(), json.dumps(data)))
+
+    def status(self) -> List[Dict]:
+        """List the version and age of every indexed tag."""
+        with sqlite_connection(self.db_path) as conn:
+            rows = conn.execute("SELECT tag, version, built_at FROM trend_index ORDER BY tag").fetchall()
+        return [{"tag": tag, "version": version, "age": time.time() - built_at} for tag, version, built_at in rows]
+
+
+def build_tag(tag: str, ideas: int = TREND_INDEX_IDEAS) -> Optional[Dict]:
+    """
+    Download, transcribe and summarise a tag's videos and generate its ideas.
+
+    Parameters:
+    tag (str): Trending tag without the leading '#'.
+    ideas (int): Number of ideas and song descriptions to generate.
+
+    Returns:
+    Optional[Dict]: The entry data, or None if no video of the tag could be transcribed.
+    """
+    output_dir = os.path.join('static', 'video', tag)
+    video_files = download_videos(tag, output_dir)
+
+    # Transcripts and on-screen text, as the live pipeline reads them (from the transcript store when seen before)
+    transcripts = {}
+    with ThreadPoolExecutor() as executor:
+        futures = {video_file: executor.submit(video_text, video_file) for video_file in video_files}
+        for video_file, future in futures.items():
+            try:
+                transcripts[os.path.basename(video_file)] = future.result()
+            except Exception as e:
+                print(f"Exception occurred while processing {video_file}: {e}")
+
+    if not transcripts:
+        return None
+
+    summary_text, tags_text = text_cleaning(llama_api_summary_tag("\n\n".join(transcripts.values())))
+
+    generated = []
+    for variant in range(ideas):
+        idea_description, song_description = llama_api({"tags": tags_text}, variant=variant)
+        trend_name, formatted_video_idea = parse_idea(idea_description)
+        generated.append({"idea": trend_name, "concept": formatted_video_idea, "song_description": song_description})
+
+    return {
+        "videos": sorted(os.path.basename(video_file) for video_file in video_files),
+        "transcripts": transcripts,
+        "summary": summary_text,
+        "tags": tags_text,
+        "ideas": generated,
+    }
+
+
+def build(tags: List[str] = TRENDING_TAGS, ideas: int = TREND_INDEX_IDEAS, stale_only: bool = False) -> None:
+    """
+    Build the index entries of the given tags, keeping the old entry of any tag that fails.
+
+    Parameters:
+    tags (List[str]): Tags to index.
+    ideas (int): Number of ideas and song descriptions per tag.
+    stale_only (bool): Skip tags whose entry is current and younger than TREND_INDEX_MAX_AGE.
+
+    Returns:
+    None
+    """
+    index = trend_index.get()
+    version = index_version()
+    for tag in tags:
+        if stale_only and state(index.get(tag), version) == FRESH:
+            print(f"Skipping {tag}: up to date")
+            continue
+        try:
+            data = build_tag(tag, ideas)
+        except Exception as e:
+            print(f"Exception occurred while indexing {tag}: {e}")
+            continue
+        if data is None:
+            print(f"Skipping {tag}: no transcribable videos")
+            continue
+        index.put(tag, version, data)
+        print(f"Indexed {tag}: {len(data['transcripts'])} transcripts, {len(data['ideas'])} ideas")
+
+
+def state(entry: Optional[Dict], version: str) -> str:
+    if entry is None or entry["version"] != version or not entry["ideas"]:
+        return MISSING
+    if time.time() - entry["built_at"] > TREND_INDEX_MAX_AGE:
+        return STALE
+    return FRESH
+
+
+class TrendIndexServer:
+    """
+    Serves ideas from the index and refreshes entries in the background.
+
+    Stale entries are still served while they are rebuilt (with `refresh`).
+    Missing or outdated entries are left to `python -m trend_index build`,
+    since building one would duplicate the live pipeline's work in the web process.
+    """
+
+    def __init__(self, refresh: bool = TREND_INDEX_REFRESH):
+        self.refresh = refresh
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trend-index")
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._version = None
+
+    def version(self) -> str:
+        if self._version is None:
+            self._version = index_version()
+        return self._version
+
+    def lookup(self, tag: Optional[str]) -> Optional[Dict]:
+        """
+        Return an indexed idea for the tag in the shape of `run_idea_pipeline`'s result.
+
+        Parameters:
+        tag (Optional[str]): Tag the session searched for.
+
+        Returns:
+        Optional[Dict]: The trend name, concept, summary tags and song description, or None on a miss.
+        """
+        if not tag:
+            return None
+        entry = trend_index.get().get(tag)
+        entry_state = state(entry, self.version())
+        if entry_state == MISSING:
+            return None
+        if entry_state == STALE:
+            self._schedule_refresh(tag)
+
+        generated = random.choice(entry["ideas"])
+        return {
+            "idea": generated["idea"],
+            "concept": generated["concept"],
+            "tags": entry["tags"],
+            "song_description": generated["song_description"],
+        }
+
+    def is_indexed(self, tag: Optional[str]) -> bool:
+        """Whether the tag has a current entry, so nothing needs to be prefetched for it."""
+        return bool(tag) and state(trend_index.get().get(tag), self.version()) != MISSING
+
+    def _schedule_refresh(self, tag: str) -> None:
+        if not self.refresh or tag not in TRENDING_TAGS:
+            return
+        with self._lock:
+            if tag in self._refreshing:
+                return
+            self._refreshing.add(tag)
+        self._executor.submit(self._refresh, tag)
+
+    def _refresh(self, tag: str) -> None:
+        try:
+            build([tag])
+        finally:
+            with self._lock:
+                self._refreshing.discard(tag)
+
+
+# Shared index, opened on first use so importing the app creates no database file
+trend_index = LazyProvider(TrendIndex)
+
+# Shared server for the web process
+trend_index_server = TrendIndexServer()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-tag trend index maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Index every trending tag")
+    build_parser.add_argument("--tags", nargs="+", default=TRENDING_TAGS)
+    build_parser.add_argument("--ideas", type=int, default=TREND_INDEX_IDEAS)
+    build_parser.add_argument("--stale-only", action="store_true", help="Only rebuild missing or stale entries")
+    subparsers.add_parser("status", help="Show the version and age of every entry")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build(args.tags, args.ideas, args.stale_only)
+    elif args.command == "status":
+        current = index_version()
+        for row in trend_index.get().status():
+            marker = "" if row["version"] == current else " (outdated)"
+            print(f"{row['tag']:>16}: version {row['version']}{marker}, {row['age'] / 3600:.1f} h old")
@@ -1,4 +1,10 @@
-import torch
+import multiprocessing
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator
 
 
 # Define a function to get the acceleration device to be used by the pipeline
@@ -15,9 +21,78 @@ def get_accel_device() -> str:
     Examples:
         >>> get_accel_device() -> "cuda"
     """
+    import torch
+
     if torch.cuda.is_available():
         return "cuda"  # Use CUDA if available
     elif torch.backends.mps.is_available():
         return "mps"  # Use MPS if available
     else:
         return "cpu"  # Fall back to CPU if no other options are available
+
+
+def set_torch_threads(num_threads: int) -> None:
+    """
+    Sets the intra-op threads torch uses in this process.
+
+    The thread count is process-wide: every Python thread running torch work
+    shares it, so it is set once rather than per stage. Before torch is
+    imported, OMP_NUM_THREADS is set instead so torch starts with it.
+
+    Args:
+        num_threads (int): Number of intra-op threads
+
+    Returns:
+        None
+    """
+    num_threads = max(1, num_threads)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(num_threads)
+    else:
+        os.environ["OMP_NUM_THREADS"] = str(num_threads)
+
+
+@contextmanager
+def sqlite_connection(db_path: str) -> Iterator[sqlite3.Connection]:
+    """
+    Opens a short-lived SQLite connection that commits (or rolls back) and closes on exit.
+
+    A connection per call keeps the stores built on it safe to use from any
+    thread, since sqlite3 connections may not be shared between threads.
+
+    Args:
+        db_path (str): Path of the database file
+
+    Returns:
+        Iterator[sqlite3.Connection]: The open connection
+
+    Examples:
+        >>> with sqlite_connection("transcripts.sqlite3") as conn:
+        ...     conn.execute("SELECT 1")
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Creates a process pool whose workers start from a forkserver.
+
+    Forking a threaded web worker can copy locks held by other threads into
+    the children, so the workers are forked from a clean server process
+    instead and import what they need themselves.
+
+    Args:
+        workers (int): Number of worker processes
+
+    Returns:
+        ProcessPoolExecutor: The pool
+
+    Examples:
+        >>> texts = list(process_pool(4).map(_decode_chunk, chunks))
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))